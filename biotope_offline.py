@@ -0,0 +1,258 @@
+"""Kompaktný offline balík katalógu a jednoduché hodnotenie zápisov bez servera.
+
+Balík je jeden binárny súbor: hlavička (JSON s metadátami a polohami sekcií) a za ňou
+zarovnané sekcie. Číselné sekcie sa čítajú cez np.memmap (bez načítania do pamäte),
+slovník mien je front-coded (zdieľaná predpona + prípona) a komprimovaný zlibom.
+Modul potrebuje len numpy, takže beží aj na tablete bez Streamlitu a celého katalógu.
+
+Použitie:  python biotope_offline.py balik.bin zoznam_druhov.txt [top_k]
+"""
+import json
+import re
+import sys
+import zlib
+from datetime import datetime
+
+import numpy as np
+
+BUNDLE_MAGIC = b'BIOTOPE\x01'
+BUNDLE_FORMAT_VERSION = 1
+BUNDLE_ALIGNMENT = 16
+# Počet úrovní kvantovania frekvencií (kód uint8 → hodnota z tabuľky úrovní)
+QUANTIZATION_LEVELS = 256
+RE_WHITESPACE = re.compile(r'\s+')
+
+
+# --- ZÁPIS BALÍKA ---
+
+def encode_varint(value, output):
+    while value >= 0x80:
+        output.append((value & 0x7F) | 0x80)
+        value >>= 7
+    output.append(value)
+
+def decode_varint(data, position):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+def front_code_names(names):
+    """Zoradené mená → (dĺžka zdieľanej predpony, dĺžka prípony, prípona) v UTF-8, komprimované zlibom."""
+    output = bytearray()
+    encode_varint(len(names), output)
+    previous = b''
+    for name in names:
+        encoded = name.encode('utf-8')
+        shared = 0
+        limit = min(len(previous), len(encoded))
+        while shared < limit and previous[shared] == encoded[shared]:
+            shared += 1
+        encode_varint(shared, output)
+        encode_varint(len(encoded) - shared, output)
+        output += encoded[shared:]
+        previous = encoded
+    return zlib.compress(bytes(output), 9)
+
+def decode_front_coded_names(blob):
+    data = zlib.decompress(blob)
+    count, position = decode_varint(data, 0)
+    names = []
+    previous = b''
+    for _ in range(count):
+        shared, position = decode_varint(data, position)
+        length, position = decode_varint(data, position)
+        encoded = previous[:shared] + data[position:position + length]
+        position += length
+        names.append(encoded.decode('utf-8'))
+        previous = encoded
+    return names
+
+def quantize_frequencies(values):
+    """Frekvencie → kódy uint8 a tabuľka úrovní; do 255 bez straty, inak logaritmické úrovne."""
+    max_value = int(values.max(initial=0))
+    if max_value < QUANTIZATION_LEVELS:
+        levels = np.arange(QUANTIZATION_LEVELS, dtype=np.float32)
+        return values.astype(np.uint8), levels
+
+    levels = np.unique(np.round(np.geomspace(1, max_value, QUANTIZATION_LEVELS - 1)))
+    levels = np.concatenate(([0.0], levels)).astype(np.float32)
+    # Najbližšia úroveň v logaritmickej mierke (hranice = geometrické priemery susedných úrovní)
+    boundaries = np.sqrt(levels[1:-1] * levels[2:])
+    codes = np.searchsorted(boundaries, values, side='right') + 1
+    codes[values == 0] = 0
+    levels = np.pad(levels, (0, QUANTIZATION_LEVELS - len(levels)))
+    return codes.astype(np.uint8), levels
+
+def write_bundle(path, catalog_version, names, name_rows, row_names, frequency_matrix, group_totals,
+                 group_codes, group_labels, biotope_pages, pdf_url):
+    """Zapíše balík; frequency_matrix je hustá matica druh × skupina (uloží sa ako riedka CSR)."""
+    frequency_matrix = np.asarray(frequency_matrix)
+    rows, columns = np.nonzero(frequency_matrix)
+    codes, levels = quantize_frequencies(frequency_matrix[rows, columns])
+    indptr = np.zeros(frequency_matrix.shape[0] + 1, dtype=np.uint32)
+    np.cumsum(np.bincount(rows, minlength=frequency_matrix.shape[0]), out=indptr[1:])
+    index_dtype = np.uint16 if frequency_matrix.shape[1] <= np.iinfo(np.uint16).max else np.uint32
+
+    sections = {
+        'names': front_code_names(names),
+        'name_rows': np.asarray(name_rows, dtype=np.int32),
+        'row_names': np.asarray(row_names, dtype=np.int32),
+        'indptr': indptr,
+        'indices': columns.astype(index_dtype),
+        'codes': codes,
+        'levels': levels,
+        'group_totals': np.asarray(group_totals, dtype=np.float64),
+    }
+
+    header = {
+        'format_version': BUNDLE_FORMAT_VERSION,
+        'catalog_version': catalog_version,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'group_codes': list(group_codes),
+        'group_labels': list(group_labels),
+        'biotope_pages': dict(biotope_pages),
+        'pdf_url': pdf_url,
+        'sections': {},
+    }
+    # Polohy sekcií závisia od dĺžky hlavičky – opakuje sa, kým sa začiatok sekcií neustáli
+    header_bytes = b''
+    while True:
+        start = align(len(BUNDLE_MAGIC) + 8 + len(header_bytes))
+        offset = start
+        for name, section in sections.items():
+            size = len(section) if isinstance(section, bytes) else section.nbytes
+            entry = {'offset': offset, 'size': size}
+            if not isinstance(section, bytes):
+                entry.update(dtype=section.dtype.str, shape=list(section.shape))
+            header['sections'][name] = entry
+            offset = align(offset + size)
+        header_bytes = json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        if align(len(BUNDLE_MAGIC) + 8 + len(header_bytes)) == start:
+            break
+
+    with open(path, 'wb') as f:
+        f.write(BUNDLE_MAGIC)
+        f.write(len(header_bytes).to_bytes(8, 'little'))
+        f.write(header_bytes)
+        for name, section in sections.items():
+            f.write(b'\0' * (header['sections'][name]['offset'] - f.tell()))
+            f.write(section if isinstance(section, bytes) else section.tobytes())
+    return header
+
+def align(offset):
+    return -(-offset // BUNDLE_ALIGNMENT) * BUNDLE_ALIGNMENT
+
+
+# --- ČÍTANIE A HODNOTENIE ---
+
+def open_bundle(path):
+    """Otvorí balík: číselné sekcie ako np.memmap, slovník mien sa rozbalí do indexu meno → ID."""
+    with open(path, 'rb') as f:
+        if f.read(len(BUNDLE_MAGIC)) != BUNDLE_MAGIC:
+            raise ValueError(f"{path}: not a biotope bundle")
+        header = json.loads(f.read(int.from_bytes(f.read(8), 'little')).decode('utf-8'))
+        if header['format_version'] > BUNDLE_FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported bundle format {header['format_version']}")
+        names_entry = header['sections']['names']
+        f.seek(names_entry['offset'])
+        names = decode_front_coded_names(f.read(names_entry['size']))
+
+    bundle = {
+        'catalog_version': header['catalog_version'],
+        'created_at': header['created_at'],
+        'group_codes': header['group_codes'],
+        'group_labels': header['group_labels'],
+        'group_pdf_urls': [f"{header['pdf_url']}#page={header['biotope_pages'].get(code, 1)}" for code in header['group_codes']],
+        'biotope_pages': header['biotope_pages'],
+        'names': names,
+        'name_index': {name: i for i, name in enumerate(names)},
+    }
+    for name, entry in header['sections'].items():
+        if 'dtype' in entry:
+            shape = tuple(entry['shape'])
+            bundle[name] = (np.memmap(path, dtype=np.dtype(entry['dtype']), mode='r', offset=entry['offset'], shape=shape)
+                            if entry['size'] else np.zeros(shape, dtype=np.dtype(entry['dtype'])))
+    return bundle
+
+def normalize_species_name(name):
+    """Zadané meno druhu v tvare kľúčov katalógu: okraje bez medzier, vnútorné medzery zlúčené na jednu.
+
+    Rovnaké pravidlo používa webová aplikácia, aby balík aj server rozlíšili mená zhodne.
+    """
+    return RE_WHITESPACE.sub(' ', name).strip()
+
+def score_species(bundle, species_list, top_k=3):
+    """FQI pre jeden zápis z balíka (rovnaké pravidlá mien ako webová aplikácia)."""
+    rows = []
+    seen_rows = set()
+    canonical_names = {}
+    unknown = []
+    for species in species_list:
+        species = normalize_species_name(species)
+        if not species:
+            continue
+        name_id = bundle['name_index'].get(species)
+        row = int(bundle['name_rows'][name_id]) if name_id is not None else -1
+        if row < 0:
+            unknown.append(species)
+            continue
+        canonical_names[species] = bundle['names'][bundle['row_names'][row]]
+        if row not in seen_rows:
+            seen_rows.add(row)
+            rows.append(row)
+
+    indptr = bundle['indptr']
+    cumulative = np.zeros(len(bundle['group_codes']), dtype=np.float64)
+    if rows:
+        positions = np.concatenate([np.arange(indptr[row], indptr[row + 1]) for row in rows])
+        np.add.at(cumulative, bundle['indices'][positions], bundle['levels'][bundle['codes'][positions]])
+
+    group_totals = bundle['group_totals']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fqi = np.where(group_totals > 0, cumulative / group_totals * 100, 0.0)
+    candidates = np.flatnonzero(cumulative > 0)
+    columns = candidates[np.argsort(-fqi[candidates], kind='stable')[:top_k]]
+
+    return {
+        'top_matches': [
+            {
+                'rank': rank + 1,
+                'code': bundle['group_codes'][col],
+                'name': bundle['group_labels'][col],
+                'fqi': f"{fqi[col]:.2f} %",
+                'fqi_value': float(fqi[col]),
+                'pdf_url': bundle['group_pdf_urls'][col],
+            }
+            for rank, col in enumerate(columns.tolist())
+        ],
+        'canonical_names': canonical_names,
+        'unknown': unknown,
+    }
+
+def read_species_file(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    try:
+        text = data.decode('utf-8')
+    except UnicodeDecodeError:
+        text = data.decode('windows-1250')
+    return text.split('\n')
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(2)
+    bundle = open_bundle(sys.argv[1])
+    result = score_species(bundle, read_species_file(sys.argv[2]), top_k=int(sys.argv[3]) if len(sys.argv) > 3 else 3)
+    print(f"Katalóg {bundle['catalog_version']} ({bundle['created_at']})")
+    for item in result['top_matches']:
+        print(f"{item['rank']}. {item['code']}  {item['fqi']:>9}  {item['name']}")
+    if result['unknown']:
+        print("Neznáme druhy: " + ", ".join(result['unknown']))
@@ -1,13 +1,51 @@
 import streamlit as st
 import re
 import pandas as pd
+import numpy as np
+import altair as alt
 from collections import defaultdict
-from datetime import date 
+from datetime import date, datetime
 import io 
+import csv
+import json
+import codecs
+import itertools
+import tempfile
+import sqlite3
+import zipfile
+import shutil
+import os
+import hashlib
+import threading
+import time
+import functools
+import sys
+import math
+import zlib
+import uuid
+import importlib
+import logging
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import biotope_offline
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # voliteľné – bez pyarrow nie je dostupný len stĺpcový export (Parquet/Arrow)
+    pa = None
+    pq = None
 
 # NÁZOV PÔVODNÉHO KATALÓGOVÉHO SÚBORU
 CATALOG_FILENAME = "ES Katalog biotopov Suvada ed 2023 v1.05.txt"
 
+# Voliteľný súbor so stranami PDF (riadky "KÓD strana"). Ak existuje, prepíše BIOTOPE_PAGES.
+PAGES_FILENAME = "strany.txt"
+
+# Interval (v sekundách), v ktorom vlákno na pozadí kontroluje zmeny katalógu
+CATALOG_WATCH_INTERVAL = 5
+
 # ODKAZY NA VLAJKY
 FLAG_URL_SK = "https://flagcdn.com/w40/sk.png"
 FLAG_URL_GB = "https://flagcdn.com/w40/gb.png"
@@ -100,6 +138,70 @@ TRANSLATIONS = {
         "SK": "Celkový počet názvov/synoným na výber: **{}**",
         "EN": "Total names/synonyms for selection: **{}**"
     },
+    "btn_download_bundle": {
+        "SK": "📦 Offline balík katalógu",
+        "EN": "📦 Offline catalogue bundle"
+    },
+    "bundle_help": {
+        "SK": "Kompaktný balík pre tablety bez pripojenia; hodnotí sa skriptom biotope_offline.py (stačí numpy).",
+        "EN": "Compact bundle for tablets without connectivity; score with the biotope_offline.py script (needs only numpy)."
+    },
+    "stats_version": {
+        "SK": "Verzia katalógu: **{}** (načítaná {})",
+        "EN": "Catalogue version: **{}** (loaded {})"
+    },
+    "cache_admin_title": {
+        "SK": "⚙️ Efektivita cache",
+        "EN": "⚙️ Cache efficiency"
+    },
+    "cache_admin_empty": {
+        "SK": "Zatiaľ žiadne volania cache.",
+        "EN": "No cache calls yet."
+    },
+    "col_cache_function": { "SK": "Funkcia", "EN": "Function" },
+    "col_cache_hits": { "SK": "Zásahy", "EN": "Hits" },
+    "col_cache_misses": { "SK": "Výpadky", "EN": "Misses" },
+    "col_hit_rate": { "SK": "Úspešnosť", "EN": "Hit rate" },
+    "col_hash_ms": { "SK": "Hašovanie (ms/volanie)", "EN": "Hashing (ms/call)" },
+    "col_compute_ms": { "SK": "Výpočet (ms/výpadok)", "EN": "Compute (ms/miss)" },
+    "col_cache_size": { "SK": "Záznamy (MB)", "EN": "Entries (MB)" },
+    "col_max_entries": { "SK": "max_entries", "EN": "max_entries" },
+    "btn_download_metrics": {
+        "SK": "⬇️ Metriky (Prometheus)",
+        "EN": "⬇️ Metrics (Prometheus)"
+    },
+    "btn_reset_cache_stats": {
+        "SK": "Vynulovať počítadlá",
+        "EN": "Reset counters"
+    },
+    "session_admin_title": {
+        "SK": "⚙️ Pamäť relácií",
+        "EN": "⚙️ Session memory"
+    },
+    "session_admin_summary": {
+        "SK": "Relácií: **{}**, spolu ~{:.2f} MB; nečinné dlhšie ako {} min sa uvoľnia.",
+        "EN": "Sessions: **{}**, ~{:.2f} MB in total; idle longer than {} min are released."
+    },
+    "col_session": { "SK": "Relácia", "EN": "Session" },
+    "col_idle_min": { "SK": "Nečinná (min)", "EN": "Idle (min)" },
+    "col_state_kb": { "SK": "Stav (kB)", "EN": "State (kB)" },
+    "col_resources_kb": { "SK": "Zdroje (kB)", "EN": "Resources (kB)" },
+    "btn_prune_sessions": {
+        "SK": "Uvoľniť nečinné relácie",
+        "EN": "Release idle sessions"
+    },
+    "toast_sessions_pruned": {
+        "SK": "Uvoľnených relácií: {}",
+        "EN": "Sessions released: {}"
+    },
+    "stats_history_refresh": {
+        "SK": "História po zmene katalógu: prepočítaných **{}** (z toho {} zo starších verzií katalógu), bez zmeny **{}** ({:.1f} s)",
+        "EN": "History after catalogue change: re-scored **{}** ({} from older catalogue versions), unchanged **{}** ({:.1f} s)"
+    },
+    "toast_catalog_reloaded": {
+        "SK": "Katalóg bol aktualizovaný (verzia {}).",
+        "EN": "Catalogue was updated (version {})."
+    },
     # Section 1: Input
     "sec1_title": {
         "SK": "1. Zadanie Druhov",
@@ -110,8 +212,8 @@ TRANSLATIONS = {
         "EN": "1.1. Bulk Input (TXT file)"
     },
     "upload_info": {
-        "SK": "Nahrajte textový súbor, ktorý bude mať na každom riadku len meno jedného druhu bez informácie o pokryvnosti. Aplikácia automaticky spracuje známe druhy a identifikuje neznáme.",
-        "EN": "Upload a text file with one species name per line (without cover information). The app will automatically process known species and identify unknown ones."
+        "SK": "Nahrajte textový súbor, ktorý bude mať na každom riadku meno jedného druhu. Voliteľne môže za menom nasledovať pokryvnosť (v % alebo Braun-Blanquet) a vrstva E3–E0, oddelené tabulátorom alebo ';'. Aplikácia automaticky spracuje známe druhy a identifikuje neznáme.",
+        "EN": "Upload a text file with one species name per line. The name may optionally be followed by cover (percent or Braun-Blanquet) and layer E3–E0, separated by a tab or ';'. The app will automatically process known species and identify unknown ones."
     },
     "upload_label": {
         "SK": "Vyberte TXT súbor so zoznamom druhov",
@@ -162,6 +264,10 @@ TRANSLATIONS = {
         "EN": "Uploaded file removed. Species list cleared."
     },
     # Section 2: Results
+    "err_file_not_found": {
+        "SK": "Súbor katalógu sa nenašiel:",
+        "EN": "Catalog file not found:"
+    },
     "err_no_species": {
         "SK": "Chyba: Neboli nájdené žiadne druhy na analýzu. Prepnite späť na výber.",
         "EN": "Error: No species found for analysis. Switch back to selection."
@@ -186,6 +292,115 @@ TRANSLATIONS = {
         "SK": "Biotopy s najvyššou podobnosťou (FQI)",
         "EN": "Habitats with highest similarity (FQI)"
     },
+    "metric_label": {
+        "SK": "Metrika pre poradie biotopov",
+        "EN": "Metric used to rank habitats"
+    },
+    "metric_fqi": { "SK": "FQI", "EN": "FQI" },
+    "metric_jaccard": { "SK": "Jaccard", "EN": "Jaccard" },
+    "metric_cosine": { "SK": "Kosínus", "EN": "Cosine" },
+    "metric_precision": { "SK": "Presnosť (vážená)", "EN": "Precision (weighted)" },
+    "metric_f1": { "SK": "F1", "EN": "F1" },
+    "metrics_caption": {
+        "SK": "**Jaccard** = podiel spoločných druhov zápisu a biotopu; **Kosínus** = zhoda zápisu s frekvenčným profilom biotopu; **Presnosť** = frekvencie druhov v biotope voči ich najvyšším frekvenciám v katalógu; **F1** = harmonický priemer presnosti a FQI.",
+        "EN": "**Jaccard** = share of species common to the relevé and the habitat; **Cosine** = match of the relevé with the habitat's frequency profile; **Precision** = species frequencies in the habitat relative to their highest frequencies in the catalogue; **F1** = harmonic mean of precision and FQI."
+    },
+    "col_lookalikes": { "SK": "Zameniteľné biotopy", "EN": "Look-alike habitats" },
+    "lookalike_caption": {
+        "SK": "**Zameniteľné biotopy** = biotopy s najpodobnejším frekvenčným profilom druhov v katalógu (kosínusová podobnosť v %).",
+        "EN": "**Look-alike habitats** = habitats with the most similar species frequency profile in the catalogue (cosine similarity in %)."
+    },
+    "hierarchy_toggle": {
+        "SK": "Poradie podľa triedy, typu a podtypu biotopu",
+        "EN": "Ranking by habitat class, type and subtype"
+    },
+    "level_class": { "SK": "Trieda", "EN": "Class" },
+    "level_type": { "SK": "Typ", "EN": "Type" },
+    "level_subtype": { "SK": "Podtyp", "EN": "Subtype" },
+    "hierarchy_caption": {
+        "SK": "Vyššie úrovne spájajú frekvencie a súčty všetkých biotopov, ktoré zahŕňajú (napr. LES05.1 = LES05.1, LES05.1a, LES05.1b).",
+        "EN": "Higher levels pool the frequencies and totals of all habitats they contain (e.g. LES05.1 = LES05.1, LES05.1a, LES05.1b)."
+    },
+    "suggest_toggle": {
+        "SK": "Ktoré druhy ešte hľadať na rozlíšenie najlepších kandidátov",
+        "EN": "Which species to look for to tell the top candidates apart"
+    },
+    "suggest_method": {
+        "SK": "Poradie podľa",
+        "EN": "Rank by"
+    },
+    "suggest_method_difference": { "SK": "Rozdiel frekvencií", "EN": "Frequency difference" },
+    "suggest_method_entropy": { "SK": "Informačný zisk", "EN": "Information gain" },
+    "suggest_none": {
+        "SK": "Nie je čo rozlišovať – zhodu má menej ako dva biotopy alebo žiadny ďalší druh sa v nich nevyskytuje.",
+        "EN": "Nothing to tell apart – fewer than two habitats match or no further species occurs in them."
+    },
+    "suggest_caption_difference": {
+        "SK": "Rozdiel frekvencií: o koľko percentuálnych bodov by nález druhu najviac posunul FQI jedného kandidáta oproti inému.",
+        "EN": "Frequency difference: the largest gap, in percentage points, between the FQI gains the species would give the candidates."
+    },
+    "suggest_caption_entropy": {
+        "SK": "Informačný zisk: o koľko bitov sa v priemere zníži neistota o víťazovi, keď zistíte, či druh na lokalite rastie.",
+        "EN": "Information gain: the expected reduction (in bits) of uncertainty about the winner once you know whether the species is present."
+    },
+    "suggest_add": {
+        "SK": "Pridať nájdený druh do výberu:",
+        "EN": "Add a species you found to the selection:"
+    },
+    "col_suggest_difference": { "SK": "Rozdiel frekvencií", "EN": "Frequency difference" },
+    "col_suggest_entropy": { "SK": "Informačný zisk", "EN": "Information gain" },
+    "col_favours": { "SK": "Nález podporí", "EN": "Presence favours" },
+    "col_candidate_gains": { "SK": "Prírastok FQI kandidátov", "EN": "FQI gain per candidate" },
+    "cover_weighting_label": {
+        "SK": "Váženie FQI pokryvnosťou",
+        "EN": "Cover weighting of FQI"
+    },
+    "cover_weighting_presence": { "SK": "Bez váženia (prítomnosť)", "EN": "None (presence)" },
+    "cover_weighting_cover": { "SK": "Pokryvnosť", "EN": "Cover" },
+    "cover_weighting_sqrt_cover": { "SK": "Odmocnina pokryvnosti", "EN": "Square root of cover" },
+    "cover_weighting_ordinal": { "SK": "Ordinálna stupnica (1–9)", "EN": "Ordinal scale (1–9)" },
+    "cover_scale_label": {
+        "SK": "Stupnica pokryvnosti",
+        "EN": "Cover scale"
+    },
+    "cover_scale_auto": { "SK": "Automaticky", "EN": "Automatic" },
+    "cover_scale_percent": { "SK": "Percentá", "EN": "Percent" },
+    "cover_scale_braun_blanquet": { "SK": "Braun-Blanquet", "EN": "Braun-Blanquet" },
+    "cover_weighting_caption": {
+        "SK": "FQI je vážené: {} ({} druhov s pokryvnosťou). Váhy majú priemer 1 (druhy bez pokryvnosti dostanú priemernú váhu), pri rovnakých pokryvnostiach je výsledok zhodný s obyčajným FQI. Ostatné metriky sú podľa prítomnosti druhov.",
+        "EN": "FQI is weighted: {} ({} species with cover). Weights average 1 (species without cover get the average weight), so equal covers give the plain FQI. Other metrics use species presence."
+    },
+    "batch_cover_help": {
+        "SK": "Platí pre vyhodnotenie na pozadí a trvalú frontu; vstup potrebuje stĺpec 'pokryvnost' (a voliteľne 'vrstva').",
+        "EN": "Applies to background scoring and the durable queue; the input needs a 'cover' column (and optionally 'layer')."
+    },
+    "sensitivity_toggle": {
+        "SK": "Citlivosť na vynechanie jednotlivých druhov",
+        "EN": "Sensitivity to leaving out individual species"
+    },
+    "sensitivity_warning": {
+        "SK": "Vynechanie **{}** druhov zmení najlepšie zodpovedajúci biotop:",
+        "EN": "Leaving out **{}** species changes the best-matching habitat:"
+    },
+    "sensitivity_stable": {
+        "SK": "Najlepšie zodpovedajúci biotop sa nezmení po vynechaní žiadneho druhu.",
+        "EN": "The best-matching habitat does not change when any single species is left out."
+    },
+    "col_winner": { "SK": "Najlepší biotop bez druhu", "EN": "Best habitat without species" },
+    "col_top_codes": { "SK": "Poradie bez druhu", "EN": "Ranking without species" },
+    "col_score_drop": { "SK": "Pokles skóre víťaza", "EN": "Winner score drop" },
+    "col_changes_winner": { "SK": "Mení víťaza", "EN": "Changes winner" },
+    "confidence_toggle": {
+        "SK": "Odhad spoľahlivosti poradia (bootstrap)",
+        "EN": "Estimate ranking confidence (bootstrap)"
+    },
+    "col_ci": { "SK": "95 % interval skóre", "EN": "95% score interval" },
+    "col_p_best": { "SK": "Pravdep. najlepšej zhody", "EN": "Prob. of best match" },
+    "col_p_value": { "SK": "p-hodnota", "EN": "p-value" },
+    "confidence_caption": {
+        "SK": "Interval a pravdepodobnosť najlepšej zhody vychádzajú z {} bootstrap výberov druhov zápisu. p-hodnota udáva podiel z {} náhodných súborov druhov rovnakej veľkosti, ktoré dosiahli aspoň rovnaké skóre zvolenej metriky (pri vážení pokryvnosťou s váhami druhov zápisu).",
+        "EN": "The interval and probability of best match are based on {} bootstrap resamples of the relevé's species. The p-value is the share of {} random species sets of the same size that reached at least the same score in the selected metric (with the relevé's cover weights when weighting is on)."
+    },
     "fqi_caption": {
         "SK": "FQI (Frekvenčný Index) je **%**, ktoré vyjadruje podiel súčtu frekvencií vybraných druhov na celkovej možnej frekvencii všetkých kanonických druhov v danej skupine. Vyššie percento = Vyššia zhoda.",
         "EN": "FQI (Frequency Index) is a **%** representing the share of the cumulative frequency of selected species to the total possible frequency of all canonical species in the group. Higher percentage = Higher match."
@@ -414,11 +629,418 @@ TRANSLATIONS = {
     "col_status": { "SK": "Stav", "EN": "Status" },
     "col_species": { "SK": "Druh", "EN": "Species" },
     "status_manual": { "SK": "Manuálne pridané (zaradené do analýzy)", "EN": "Manually added (included in analysis)" },
-    "status_unclassified": { "SK": "Nezaradené (pôvodný neznámy/preklep)", "EN": "Unclassified (original unknown/typo)" }
+    "status_unclassified": { "SK": "Nezaradené (pôvodný neznámy/preklep)", "EN": "Unclassified (original unknown/typo)" },
+    # Navigation
+    "nav_label": {
+        "SK": "Režim",
+        "EN": "Mode"
+    },
+    "nav_single": {
+        "SK": "Jeden zápis",
+        "EN": "Single relevé"
+    },
+    "nav_batch": {
+        "SK": "Dávkové spracovanie",
+        "EN": "Batch processing"
+    },
+    # Batch processing
+    "batch_title": {
+        "SK": "Dávkové spracovanie zápisov (GeoJSON)",
+        "EN": "Batch Processing of Relevés (GeoJSON)"
+    },
+    "batch_info": {
+        "SK": "Nahrajte tabuľku (TAB, ';' alebo ',') s hlavičkou a stĺpcami **zapis**, **druh** a voliteľne **suradnica** (alebo **lat**/**lon**), **lokalita**, **mapovatel**, **datum**, **E3**–**E0**. Každý riadok obsahuje jeden druh, riadky jedného zápisu musia ísť za sebou.",
+        "EN": "Upload a table (TAB, ';' or ',') with a header and columns **releve**, **species** and optionally **coordinates** (or **lat**/**lon**), **locality**, **mapper**, **date**, **E3**–**E0**. Each row holds one species, rows of one relevé must be consecutive."
+    },
+    "batch_upload_label": {
+        "SK": "Vyberte súbor so zápismi",
+        "EN": "Select file with relevés"
+    },
+    "batch_top_k": {
+        "SK": "Počet najlepších biotopov na zápis",
+        "EN": "Number of top habitats per relevé"
+    },
+    "btn_batch_geojson": {
+        "SK": "🟢 Vyhodnotiť zápisy (GeoJSON)",
+        "EN": "🟢 Score relevés (GeoJSON)"
+    },
+    "batch_done": {
+        "SK": "Vyhodnotených zápisov: **{}**",
+        "EN": "Relevés scored: **{}**"
+    },
+    "batch_error": {
+        "SK": "Súbor sa nepodarilo spracovať: {}",
+        "EN": "File could not be processed: {}"
+    },
+    "btn_batch_job": {
+        "SK": "▶️ Vyhodnotiť zápisy na pozadí",
+        "EN": "▶️ Score relevés in the background"
+    },
+    "batch_job_reading": {
+        "SK": "Vyhodnotených zápisov: {} (prečítaných {:.0%} vstupu)",
+        "EN": "Relevés scored: {} ({:.0%} of the input read)"
+    },
+    "batch_job_progress": {
+        "SK": "Vyhodnotených zápisov: {} / {}",
+        "EN": "Relevés scored: {} / {}"
+    },
+    "btn_queue_job": {
+        "SK": "📥 Zaradiť do trvalej fronty (pobeží aj po zatvorení prehliadača)",
+        "EN": "📥 Add to the durable queue (keeps running after the browser is closed)"
+    },
+    "queue_submitted": {
+        "SK": "Úloha **{}** bola zaradená do fronty. Výsledky nájdete nižšie aj neskôr.",
+        "EN": "Job **{}** was queued. You can collect the results below, now or later."
+    },
+    "queue_title": {
+        "SK": "Fronta dávkových úloh",
+        "EN": "Batch Job Queue"
+    },
+    "queue_select": {
+        "SK": "Úloha:",
+        "EN": "Job:"
+    },
+    "queue_col_created": { "SK": "Zaradená", "EN": "Queued at" },
+    "queue_col_input": { "SK": "Súbor", "EN": "File" },
+    "queue_col_progress": { "SK": "Zápisy", "EN": "Relevés" },
+    "queue_col_catalog": { "SK": "Verzia katalógu", "EN": "Catalogue version" },
+    "queue_status_queued": { "SK": "⏳ čaká", "EN": "⏳ queued" },
+    "queue_status_running": { "SK": "▶️ beží", "EN": "▶️ running" },
+    "queue_status_done": { "SK": "✅ hotová", "EN": "✅ done" },
+    "queue_status_failed": { "SK": "❌ chyba", "EN": "❌ failed" },
+    "queue_status_cancelled": { "SK": "⏹️ zrušená", "EN": "⏹️ cancelled" },
+    "queue_job_done": {
+        "SK": "Vyhodnotených zápisov: **{}** (dokončené {})",
+        "EN": "Relevés scored: **{}** (finished {})"
+    },
+    "btn_queue_delete": {
+        "SK": "🗑️ Odstrániť úlohu",
+        "EN": "🗑️ Delete job"
+    },
+    "btn_cancel_job": {
+        "SK": "⏹️ Zrušiť",
+        "EN": "⏹️ Cancel"
+    },
+    "batch_job_cancelled": {
+        "SK": "Úloha bola zrušená po {} zápisoch.",
+        "EN": "Job was cancelled after {} relevés."
+    },
+    "batch_job_done": {
+        "SK": "Vyhodnotených zápisov: **{}** ({:.1f} s)",
+        "EN": "Relevés scored: **{}** ({:.1f} s)"
+    },
+    "batch_job_preview": {
+        "SK": "Zobrazených {} z {} hotových výsledkov",
+        "EN": "Showing {} of {} finished results"
+    },
+    "heatmap_toggle": {
+        "SK": "🗺️ Heatmapa skóre (zápis × biotop)",
+        "EN": "🗺️ Score heatmap (relevé × habitat)"
+    },
+    "heatmap_class": { "SK": "Trieda biotopov", "EN": "Habitat class" },
+    "heatmap_all_classes": { "SK": "Všetky triedy", "EN": "All classes" },
+    "heatmap_rows": { "SK": "Zápisov v pohľade", "EN": "Relevés in view" },
+    "heatmap_start": { "SK": "Od zápisu", "EN": "From relevé" },
+    "heatmap_caption": {
+        "SK": "Zápisy {}–{} z {} zoradené podľa najlepšieho biotopu; jeden riadok = priemer {} zápisov.",
+        "EN": "Relevés {}–{} of {} ordered by best habitat; one row = mean of {} relevés."
+    },
+    "btn_download_job_csv": {
+        "SK": "⬇️ Stiahnuť výsledky (CSV)",
+        "EN": "⬇️ Download results (CSV)"
+    },
+    "col_releve_id": { "SK": "Zápis", "EN": "Relevé" },
+    "col_species_count": { "SK": "Druhov", "EN": "Species" },
+    "col_unknown_count": { "SK": "Neznámych", "EN": "Unknown" },
+    "col_winner_score": { "SK": "Skóre", "EN": "Score" },
+    "col_top_matches": { "SK": "Najlepšie biotopy", "EN": "Top habitats" },
+    "btn_batch_save_history": {
+        "SK": "💾 Uložiť zápisy do histórie",
+        "EN": "💾 Save relevés to history"
+    },
+    "batch_saved": {
+        "SK": "Do histórie uložených zápisov: **{}**",
+        "EN": "Relevés saved to history: **{}**"
+    },
+    "btn_save_history": {
+        "SK": "💾 Uložiť analýzu do histórie",
+        "EN": "💾 Save analysis to history"
+    },
+    "toast_saved_history": {
+        "SK": "Analýza bola uložená do histórie (ID {}).",
+        "EN": "Analysis was saved to history (ID {})."
+    },
+    # Species profile page
+    "nav_species": {
+        "SK": "Profil druhu",
+        "EN": "Species profile"
+    },
+    "species_title": {
+        "SK": "Profil druhu",
+        "EN": "Species Profile"
+    },
+    "species_select": {
+        "SK": "Druh alebo synonymum:",
+        "EN": "Species or synonym:"
+    },
+    "species_placeholder": {
+        "SK": "Začnite písať meno druhu...",
+        "EN": "Start typing a species name..."
+    },
+    "species_info": {
+        "SK": "Vyberte druh – zobrazia sa jeho synonymá a výskyt v jednotlivých biotopoch.",
+        "EN": "Choose a species to see its synonyms and occurrence in each habitat."
+    },
+    "species_unknown": {
+        "SK": "Druh sa v aktuálnom katalógu nenachádza.",
+        "EN": "The species is not in the current catalogue."
+    },
+    "species_resolved": {
+        "SK": "**{}** je synonymum druhu **{}**.",
+        "EN": "**{}** is a synonym of **{}**."
+    },
+    "species_synonyms": {
+        "SK": "**Synonymá:** {}",
+        "EN": "**Synonyms:** {}"
+    },
+    "species_no_synonyms": {
+        "SK": "Druh nemá v katalógu žiadne synonymá.",
+        "EN": "The species has no synonyms in the catalogue."
+    },
+    "species_occurrences": {
+        "SK": "Výskyt v zápisoch katalógu: **{}** v **{}** biotopoch",
+        "EN": "Occurrences in catalogue relevés: **{}** in **{}** habitats"
+    },
+    "species_no_occurrences": {
+        "SK": "Druh nemá v tabuľke frekvencií katalógu žiadny výskyt.",
+        "EN": "The species has no occurrences in the catalogue frequency table."
+    },
+    "col_occurrences": { "SK": "Výskyt", "EN": "Occurrences" },
+    "col_share_species": { "SK": "Podiel výskytov druhu", "EN": "Share of species occurrences" },
+    "col_share_group": { "SK": "Podiel vo frekvenciách biotopu", "EN": "Share of habitat frequencies" },
+    # History page
+    "nav_history": {
+        "SK": "História analýz",
+        "EN": "Analysis history"
+    },
+    "history_title": {
+        "SK": "História uložených analýz",
+        "EN": "History of Saved Analyses"
+    },
+    "history_found": {
+        "SK": "Nájdených analýz: **{}** (zobrazených najviac {})",
+        "EN": "Analyses found: **{}** (showing at most {})"
+    },
+    "nearby_title": {
+        "SK": "📍 Staršie analýzy v okolí",
+        "EN": "📍 Earlier analyses nearby"
+    },
+    "nearby_radius": {
+        "SK": "Polomer (km)",
+        "EN": "Radius (km)"
+    },
+    "nearby_empty": {
+        "SK": "V histórii nie je v tomto okolí žiadna analýza so súradnicami.",
+        "EN": "The history has no analysis with coordinates within this radius."
+    },
+    "nearby_summary": {
+        "SK": "Analýz v okolí: **{}**; najčastejšie víťazné biotopy: {}",
+        "EN": "Analyses nearby: **{}**; most frequent winning habitats: {}"
+    },
+    "nearby_agreement": {
+        "SK": "Aktuálny víťaz {} bol víťazom v {} z {} analýz v okolí.",
+        "EN": "The current winner {} also won {} of {} nearby analyses."
+    },
+    "col_distance_km": {
+        "SK": "Vzdialenosť (km)",
+        "EN": "Distance (km)"
+    },
+    "history_empty": {
+        "SK": "Žiadna uložená analýza nezodpovedá filtru.",
+        "EN": "No saved analysis matches the filter."
+    },
+    "lbl_winner_code": {
+        "SK": "KÓD víťazného biotopu",
+        "EN": "Winning habitat CODE"
+    },
+    "lbl_date_from": {
+        "SK": "Dátum od",
+        "EN": "Date from"
+    },
+    "lbl_date_to": {
+        "SK": "Dátum do",
+        "EN": "Date to"
+    },
+    "lbl_analysis_id": {
+        "SK": "Detail analýzy (ID)",
+        "EN": "Analysis detail (ID)"
+    },
+    "btn_batch_zip": {
+        "SK": "🗂️ Protokoly pre všetky zápisy (ZIP: TXT + XLSX)",
+        "EN": "🗂️ Reports for all relevés (ZIP: TXT + XLSX)"
+    },
+    "batch_zip_progress": {
+        "SK": "Export protokolov na pozadí: zapísaných súborov {} (prečítaných {:.0%} vstupu)",
+        "EN": "Report export in the background: {} files written ({:.0%} of the input read)"
+    },
+    "batch_zip_cancelled": {
+        "SK": "Export protokolov bol zrušený po {} súboroch.",
+        "EN": "Report export was cancelled after {} files."
+    },
+    "batch_zip_done": {
+        "SK": "Pripravených súborov v archíve: **{}**",
+        "EN": "Files prepared in the archive: **{}**"
+    },
+    "btn_download_zip": {
+        "SK": "⬇️ Stiahnuť protokoly (ZIP)",
+        "EN": "⬇️ Download reports (ZIP)"
+    },
+    "btn_download_geojson": {
+        "SK": "⬇️ Export výsledkov (GeoJSON)",
+        "EN": "⬇️ Export Results (GeoJSON)"
+    },
+    "columnar_format_label": {
+        "SK": "Stĺpcový formát",
+        "EN": "Columnar format"
+    },
+    "btn_batch_columnar": {
+        "SK": "📊 Stĺpcový export výsledkov (Parquet / Arrow)",
+        "EN": "📊 Columnar results export (Parquet / Arrow)"
+    },
+    "columnar_missing": {
+        "SK": "Stĺpcový export vyžaduje balík pyarrow.",
+        "EN": "Columnar export requires the pyarrow package."
+    },
+    "btn_download_columnar_results": {
+        "SK": "⬇️ Stiahnuť výsledky ({})",
+        "EN": "⬇️ Download results ({})"
+    },
+    "btn_download_columnar_species": {
+        "SK": "⬇️ Stiahnuť rozlíšenie druhov ({})",
+        "EN": "⬇️ Download species resolution ({})"
+    }
 }
 
+logger = logging.getLogger(__name__)
+
+# --- CACHE INSTRUMENTATION ---
+
+@st.cache_resource
+def get_cache_stats_store():
+    """Zdieľané počítadlá efektivity cache (spoločné pre všetky relácie)."""
+    return {'lock': threading.Lock(), 'functions': {}}
+
+def get_cache_function_stats(name, cache_kwargs):
+    store = get_cache_stats_store()
+    with store['lock']:
+        if name not in store['functions']:
+            store['functions'][name] = {
+                'max_entries': cache_kwargs.get('max_entries'),
+                'ttl': cache_kwargs.get('ttl'),
+                'hits': 0,
+                'misses': 0,
+                'hash_seconds': 0.0,
+                'compute_seconds': 0.0,
+                'entry_bytes': [],
+                'last_entry_bytes': 0,
+            }
+        return store['lock'], store['functions'][name]
+
+def instrumented_cache_data(**cache_kwargs):
+    """st.cache_data s počítadlami: zásahy, výpadky, čas hašovania/vyhľadania, čas výpočtu a odhad veľkosti záznamov.
+
+    Výpadok sa zistí tak, že pôvodná funkcia sa vôbec zavolá (príznak v thread-local pamäti);
+    čas mimo výpočtu je réžia cache – hašovanie argumentov, vyhľadanie a načítanie záznamu.
+    """
+    def decorator(func):
+        state = threading.local()
+
+        @functools.wraps(func)
+        def compute(*args, **kwargs):
+            started = time.perf_counter()
+            result = func(*args, **kwargs)
+            state.compute_seconds = time.perf_counter() - started
+            state.missed = True
+            state.result = result
+            return result
+
+        cached = st.cache_data(**cache_kwargs)(compute)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            state.missed = False
+            state.compute_seconds = 0.0
+            state.result = None
+            started = time.perf_counter()
+            result = cached(*args, **kwargs)
+            elapsed = time.perf_counter() - started
+
+            # Veľkosť záznamu len odhadom (polia numpy podľa nbytes, dlhé zoznamy zo vzorky) – opätovné
+            # serializovanie celého výsledku by predĺžilo práve meraný výpadok
+            entry_bytes = estimate_object_size(state.result) if state.missed else None
+            state.result = None
+
+            lock, stats = get_cache_function_stats(func.__name__, cache_kwargs)
+            with lock:
+                stats['hash_seconds'] += elapsed - state.compute_seconds
+                if entry_bytes is None:
+                    stats['hits'] += 1
+                else:
+                    stats['misses'] += 1
+                    stats['compute_seconds'] += state.compute_seconds
+                    stats['last_entry_bytes'] = entry_bytes
+                    stats['entry_bytes'].append(entry_bytes)
+                    # Pri max_entries cache drží len posledné záznamy – odhad obsadenej pamäte tomu zodpovedá
+                    if stats['max_entries']:
+                        del stats['entry_bytes'][:-stats['max_entries']]
+            return result
+
+        wrapper.clear = cached.clear
+        return wrapper
+    return decorator
+
+def get_cache_stats():
+    store = get_cache_stats_store()
+    with store['lock']:
+        stats = {name: dict(values) for name, values in store['functions'].items()}
+    for values in stats.values():
+        calls = values['hits'] + values['misses']
+        values['calls'] = calls
+        values['hit_rate'] = values['hits'] / calls if calls else 0.0
+        values['stored_bytes'] = sum(values.pop('entry_bytes'))
+    return stats
+
+def reset_cache_stats():
+    store = get_cache_stats_store()
+    with store['lock']:
+        store['functions'].clear()
+
+CACHE_METRICS = (
+    ('hits', 'counter', 'biotope_cache_hits_total', "Cache hits per cached function."),
+    ('misses', 'counter', 'biotope_cache_misses_total', "Cache misses (recomputations) per cached function."),
+    ('hash_seconds', 'counter', 'biotope_cache_hash_seconds_total', "Time spent hashing arguments and looking up/loading entries."),
+    ('compute_seconds', 'counter', 'biotope_cache_compute_seconds_total', "Time spent computing missed entries."),
+    ('stored_bytes', 'gauge', 'biotope_cache_stored_bytes', "Estimated size of entries currently held (sampled)."),
+    ('last_entry_bytes', 'gauge', 'biotope_cache_last_entry_bytes', "Estimated size of the most recently computed entry (sampled)."),
+    ('max_entries', 'gauge', 'biotope_cache_max_entries', "Configured max_entries (0 = unlimited)."),
+)
+
+def format_cache_metrics_prometheus(stats=None):
+    """Počítadlá cache vo formáte Prometheus (text exposition format)."""
+    if stats is None:
+        stats = get_cache_stats()
+    lines = []
+    for key, metric_type, metric_name, help_text in CACHE_METRICS:
+        lines.append(f"# HELP {metric_name} {help_text}")
+        lines.append(f"# TYPE {metric_name} {metric_type}")
+        for name, values in sorted(stats.items()):
+            lines.append(f'{metric_name}{{function="{name}"}} {values[key] or 0}')
+    return "\n".join(lines) + "\n"
+
 # --- HELPER FUNCTIONS ---
 
+RE_BIOTOPE_CODE_EXTRACTOR = re.compile(r'^(\S+)\s+(.*)', re.IGNORECASE)
+
 def inner_dict_factory():
     return defaultdict(int)
 
@@ -427,23 +1049,18 @@ def t(key):
     lang = st.session_state.get('lang', 'SK')
     return TRANSLATIONS.get(key, {}).get(lang, key)
 
-@st.cache_data
+# Načítanie a parsovanie katalógu prebieha len pri zostavení snapshotu (aj vo vlákne na pozadí
+# a v procesoch fronty), preto bez st.cache_data a bez výpisov do stránky – výsledok drží snapshot.
+
 def load_file_content(filename):
+    """Obsah textového súboru (UTF-8, inak Windows-1250); chyby (napr. FileNotFoundError) rieši volajúci."""
     try:
-        try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                return f.read()
-        except UnicodeDecodeError:
-            with open(filename, 'r', encoding='Windows-1250') as f:
-                return f.read()
-    except FileNotFoundError:
-        st.error(f"⚠️ {t('err_file_not_found')} '{filename}'")
-        return None
-    except Exception as e:
-        st.error(f"Error loading file: {e}")
-        return None
+        with open(filename, 'r', encoding='utf-8') as f:
+            return f.read()
+    except UnicodeDecodeError:
+        with open(filename, 'r', encoding='Windows-1250') as f:
+            return f.read()
 
-@st.cache_data
 def parse_catalog_data(catalog_text):
     lines = catalog_text.split('\n')
     section_1_active = False
@@ -521,7 +1138,6 @@ def parse_catalog_data(catalog_text):
          
     return synonym_map, group_names, similarity_matrix
 
-@st.cache_data
 def calculate_total_frequency_per_group(similarity_matrix, group_names):
     total_frequency = defaultdict(int)
     all_groups = set(group_names.keys())
@@ -536,10 +1152,9 @@ def calculate_total_frequency_per_group(similarity_matrix, group_names):
 
 
 def get_canonical_name(species_name, synonym_map):
-    species_name = species_name.strip()
+    species_name = biotope_offline.normalize_species_name(species_name)
     return synonym_map.get(species_name, species_name)
 
-@st.cache_data
 def get_all_known_species(synonym_map, similarity_matrix):
     canonical_species = set(similarity_matrix.keys())
     all_known = canonical_species.union(set(synonym_map.keys())).union(set(synonym_map.values()))
@@ -555,241 +1170,2920 @@ def process_uploaded_species_list(uploaded_file, all_known_species):
         try:
             string_data = uploaded_file.getvalue().decode("windows-1250")
         except:
-            return None, None
+            return None, None, None
             
+    cover_entries = []
     for line in string_data.split('\n'):
-        species = re.sub(r'\s+', ' ', line).strip()
+        # Riadok môže niesť aj pokryvnosť a vrstvu (oddelené TAB alebo ';')
+        species, cover, layer = parse_species_cover_line(line)
         
         if species:
             if species in all_known_species:
                 known_species.append(species)
+                if cover:
+                    cover_entries.append((species, cover, layer))
             else:
                 unknown_species.append(species)
                 
     known_species = sorted(list(set(known_species)))
     unknown_species = sorted(list(set(unknown_species)))
     
-    return known_species, unknown_species
+    return known_species, unknown_species, cover_entries
 
 
-@st.cache_data(show_spinner=False)
-def analyze_similarity(species_list, synonym_map, group_names, similarity_matrix, total_frequency_per_group):
-    cumulative_scores = defaultdict(int)
-    valid_groups = set(group_names.keys())
-    processed_canonical_species = set() 
-    name_conversion_map = {} 
-    ignored_inputs = [] 
-    
-    for user_species in species_list:
-        user_species = user_species.strip()
-        canonical_name = get_canonical_name(user_species, synonym_map)
-        
-        if canonical_name in similarity_matrix:
-            
-            name_conversion_map[user_species] = canonical_name
+def split_biotope_name(biotope_full_name, group_id):
+    """Rozdelí celý názov skupiny ("LES01.1 - Názov") na kód biotopu a názov."""
+    biotope_code = group_id
+    biotope_name = biotope_full_name
 
-            if canonical_name not in processed_canonical_species:
-                processed_canonical_species.add(canonical_name)
-                
-                species_data = similarity_matrix[canonical_name]
-                for group_id, count in species_data.items():
-                    if group_id in valid_groups:
-                        cumulative_scores[group_id] += count
-            else:
-                ignored_inputs.append(user_species)
-                
+    match_code = RE_BIOTOPE_CODE_EXTRACTOR.match(biotope_full_name)
 
-    if not cumulative_scores:
-        return None, processed_canonical_species, name_conversion_map, ignored_inputs 
+    if match_code:
+        biotope_code = match_code.group(1).strip()
+        biotope_name = match_code.group(2).strip()
 
-    fqi_scores = {}
-    
-    for group_id, cumulative_score in cumulative_scores.items():
-        max_score = total_frequency_per_group.get(group_id, 0)
-        
-        if max_score > 0:
-            fqi = (cumulative_score / max_score) * 100
-            fqi_scores[group_id] = fqi
-        else:
-            fqi_scores[group_id] = 0.0
+        if biotope_name.startswith('-'):
+             biotope_name = biotope_name[1:].strip()
 
-    sorted_scores = sorted(fqi_scores.items(), key=lambda item: item[1], reverse=True)
-    top_matches_data = []
-    
-    re_biotope_code_extractor = re.compile(r'^(\S+)\s+(.*)', re.IGNORECASE)
+    return biotope_code, biotope_name
 
-    for rank, (group_id, score) in enumerate(sorted_scores[:3]):
-        biotope_full_name = group_names.get(group_id, f"Unknown ({group_id})")
-        
-        biotope_code = group_id 
-        biotope_name = biotope_full_name
+def get_biotope_pdf_url(biotope_code, biotope_pages):
+    page_num = biotope_pages.get(biotope_code, 1) # Default na stranu 1, ak sa nenájde
+    return f"{PDF_BASE_URL}{PDF_FILENAME}#page={page_num}"
 
-        match_code = re_biotope_code_extractor.match(biotope_full_name)
-        
-        if match_code:
-            biotope_code = match_code.group(1).strip() 
-            biotope_name = match_code.group(2).strip()
-            
-            if biotope_name.startswith('-'):
-                 biotope_name = biotope_name[1:].strip()
+# --- CATALOG SNAPSHOT (HOT RELOAD) ---
 
-        # Získanie strany a vytvorenie URL
-        page_num = BIOTOPE_PAGES.get(biotope_code, 1) # Default na stranu 1, ak sa nenájde
-        pdf_url = f"{PDF_BASE_URL}{PDF_FILENAME}#page={page_num}"
-        
-        top_matches_data.append({
-            'rank': rank + 1,
-            'code': biotope_code,
-            'name': biotope_name,
-            'fqi': f"{score:.2f} %",
-            'pdf_url': pdf_url
-        })
+def get_file_fingerprint(filename):
+    """Vráti (mtime_ns, veľkosť) súboru alebo None, ak súbor neexistuje."""
+    try:
+        file_stat = os.stat(filename)
+    except OSError:
+        return None
+    return (file_stat.st_mtime_ns, file_stat.st_size)
 
-    return top_matches_data, processed_canonical_species, name_conversion_map, ignored_inputs
+def get_catalog_fingerprint():
+    return (get_file_fingerprint(CATALOG_FILENAME), get_file_fingerprint(PAGES_FILENAME))
 
-# --- EXPORT FUNCTIONS (LOCALIZED) ---
+def parse_biotope_pages(pages_text):
+    """Načíta dvojice 'KÓD strana' (aj vo formáte "KÓD": strana) zo súboru so stranami."""
+    re_page_entry = re.compile(r'["\']?([A-Z]{2,3}\d{2}(?:\.\d+)?[a-z]?)["\']?\s*[:=\t ]\s*(\d+)')
+    return {code: int(page) for code, page in re_page_entry.findall(pages_text)}
 
-def generate_export_data(fqi_results_df, canonical_species_list, manual_data, lang='SK'):
-    """Generates text export based on current language."""
-    
-    E3, E2, E1, E0 = "\u2083", "\u2082", "\u2081", "\u2080"
-    
-    # Helper to get text for this specific function scope
-    def lt(key): 
-        return TRANSLATIONS.get(key, {}).get(lang, key)
+def build_catalog_snapshot(catalog_text, biotope_pages, fingerprint=None):
+    """Spracuje katalóg a vráti nemenný snapshot (dáta, indexy, súčty), alebo None pri chybe."""
+    synonym_map, group_names, similarity_matrix = parse_catalog_data(catalog_text)
+    if synonym_map is None:
+        return None
 
-    # Convert DF to string
-    # We remove the URL column for text export to keep it clean, or keep it if desired. 
-    # For now, let's keep only basic columns.
-    export_df = fqi_results_df[[t("col_rank"), t("col_code"), t("col_name"), t("col_fqi")]]
-    fqi_table = export_df.reset_index(drop=True).to_csv(sep='\t', index=False)
-    
-    output = f"{lt('export_title')}\n"
-    output += f"{lt('export_based_on')}\n\n"
+    version_hash = hashlib.sha1(catalog_text.encode('utf-8'))
+    version_hash.update(repr(sorted(biotope_pages.items())).encode('utf-8'))
 
-    # 1. Header
-    output += f"{lt('export_sec1')}\n"
-    output += "--------------------------------------------------\n"
-    output += f"{lt('lbl_locality')}:              {manual_data['lokalita']}\n"
-    output += f"{lt('lbl_coords')}:             {manual_data['suradnica']}\n"
-    output += f"{lt('lbl_mapper')}:       {manual_data['mapovatel']}\n"
-    output += f"{lt('lbl_date')}:                 {manual_data['datum'].strftime('%Y-%m-%d') if isinstance(manual_data['datum'], date) else manual_data['datum']}\n"
-    output += f"{lt('export_covers_title')} (E{E3}, E{E2}, E{E1}, E{E0}):\n"
-    output += f"  E{E3}:                  {manual_data['pokryvnost_E3']}\n"
-    output += f"  E{E2}:                  {manual_data['pokryvnost_E2']}\n"
-    output += f"  E{E1}:                  {manual_data['pokryvnost_E1']}\n"
-    output += f"  E{E0}:                  {manual_data['pokryvnost_E0']}\n\n"
-    
-    # 2. Results
-    output += f"{lt('export_sec2')}\n"
-    output += "--------------------------------------------------\n"
-    output += fqi_table
-    output += "\n"
+    total_frequency_per_group = calculate_total_frequency_per_group(similarity_matrix, group_names)
 
-    # 3. Canonical Species
-    output += f"{lt('export_sec3')}\n"
-    output += "--------------------------------------------------\n"
-    output += f"{lt('export_count_canon')}" + str(len(canonical_species_list)) + "\n"
-    output += "\n".join(sorted(canonical_species_list))
-    
-    remaining_unknown_species = manual_data.get('remaining_unknown_species')
-    manual_selections_for_analysis = manual_data.get('manual_selections_for_analysis', []) 
-    
-    if manual_selections_for_analysis:
-        output += f"\n\n{lt('export_sec4')}\n"
-        output += "--------------------------------------------------\n"
-        output += f"{lt('export_desc_manual')}\n"
-        output += "\n".join(manual_selections_for_analysis)
+    snapshot = {
+        'version': version_hash.hexdigest()[:12],
+        'fingerprint': fingerprint,
+        'loaded_at': datetime.now(),
+        'synonym_map': synonym_map,
+        'group_names': group_names,
+        'similarity_matrix': similarity_matrix,
+        'total_frequency_per_group': total_frequency_per_group,
+        'all_species': get_all_known_species(synonym_map, similarity_matrix),
+        'biotope_pages': biotope_pages,
+    }
+    # Poradie v all_species = ID druhu; relácie si držia len polia týchto ID
+    snapshot['all_species_index'] = {name: i for i, name in enumerate(snapshot['all_species'])}
+    snapshot.update(build_catalog_matrix(synonym_map, group_names, similarity_matrix, total_frequency_per_group, biotope_pages))
+    return snapshot
 
-    if remaining_unknown_species:
-        output += f"\n\n{lt('export_sec5')}\n"
-        output += "--------------------------------------------------\n"
-        output += f"{lt('export_desc_unknown')}\n"
-        output += "\n".join(remaining_unknown_species)
-    
-    output += f"\n\n{lt('export_end')}\n"
-    
-    return output
+def build_catalog_matrix(synonym_map, group_names, similarity_matrix, total_frequency_per_group, biotope_pages):
+    """Pripraví maticu druh×skupina (numpy) a indexy mien pre vektorový výpočet FQI."""
+    group_ids = list(group_names.keys())
+    group_column = {group_id: col for col, group_id in enumerate(group_ids)}
+    species_names = list(similarity_matrix.keys())
+    species_index = {name: row for row, name in enumerate(species_names)}
 
-def generate_excel_data(fqi_results_df, canonical_species_list, manual_data, lang='SK'):
-    """Generates Excel export based on current language."""
-    
-    def lt(key): 
-        return TRANSLATIONS.get(key, {}).get(lang, key)
-    
-    header_data = [
-        ("--- ZÁKLADNÉ ÚDAJE ---", ""),
-        (lt('lbl_locality'), manual_data['lokalita']),
-        (lt('lbl_coords'), manual_data['suradnica']),
-        (lt('lbl_mapper'), manual_data['mapovatel']),
-        (lt('lbl_date'), manual_data['datum'].strftime('%Y-%m-%d') if isinstance(manual_data['datum'], date) else manual_data['datum']),
-        ("--- POKRYVNOSŤ ETÁŽÍ ---", ""),
-        (lt('lbl_e3'), manual_data['pokryvnost_E3']),
-        (lt('lbl_e2'), manual_data['pokryvnost_E2']),
-        (lt('lbl_e1'), manual_data['pokryvnost_E1']),
-        (lt('lbl_e0'), manual_data['pokryvnost_E0']),
-    ]
-    df_header = pd.DataFrame(header_data, columns=[lt('col_desc'), lt('col_val')])
-    
-    df_species = pd.DataFrame(sorted(canonical_species_list), columns=[lt('col_canon_header')])
-    
-    remaining = manual_data.get('remaining_unknown_species', [])
-    manual_added = manual_data.get('manual_selections_for_analysis', [])
-    
-    df_status = pd.DataFrame({
-        lt('col_status'): 
-            [lt('status_manual')] * len(manual_added) + 
-            [lt('status_unclassified')] * len(remaining),
-        lt('col_species'): manual_added + remaining
-    })
-    
-    output = io.BytesIO()
-    
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df_header.to_excel(writer, sheet_name=lt('sheet_field_data')[:30], index=False, startrow=0, startcol=0)
-        
-        # FQI Results - remove URL column for Excel export clean look, or keep it.
-        # Removing for clean data export.
-        df_fqi_excel = fqi_results_df[[t("col_rank"), t("col_code"), t("col_name"), t("col_fqi")]].copy()
-        df_fqi_excel.to_excel(writer, sheet_name=lt('sheet_fqi')[:30], index=False, startrow=0, startcol=0)
+    frequency_matrix = np.zeros((len(species_names), len(group_ids)), dtype=np.int32)
+    for row, canonical_name in enumerate(species_names):
+        for group_id, count in similarity_matrix[canonical_name].items():
+            col = group_column.get(group_id)
+            if col is not None:
+                frequency_matrix[row, col] = count
 
-        df_species.to_excel(writer, sheet_name=lt('sheet_canon')[:30], index=False, startrow=0, startcol=0)
+    # Každé známe meno (synonymum aj kanonické) → riadok kanonického druhu v matici
+    name_index = dict(species_index)
+    for synonym, canonical_name in synonym_map.items():
+        row = species_index.get(canonical_name)
+        if row is not None:
+            name_index[synonym] = row
+        elif synonym in name_index and synonym != canonical_name:
+            # get_canonical_name uprednostňuje synonymum pred vlastným riadkom matice
+            del name_index[synonym]
 
-        if not df_status.empty:
-            df_status.to_excel(writer, sheet_name=lt('sheet_unknown')[:30], index=False, startrow=0, startcol=0)
+    group_codes = []
+    group_labels = []
+    for group_id in group_ids:
+        biotope_code, biotope_name = split_biotope_name(group_names[group_id], group_id)
+        group_codes.append(biotope_code)
+        group_labels.append(biotope_name)
 
-        for sheetname in writer.sheets:
-            worksheet = writer.sheets[sheetname]
-            worksheet.set_column('A:D', 30)
-            
+    group_pdf_urls = [get_biotope_pdf_url(code, biotope_pages) for code in group_codes]
+    group_totals = np.array([total_frequency_per_group.get(group_id, 0) for group_id in group_ids], dtype=np.float64)
+
+    catalog_matrix = {
+        'group_ids': group_ids,
+        'group_codes': group_codes,
+        'group_labels': group_labels,
+        'group_pdf_urls': group_pdf_urls,
+        'group_totals': group_totals,
+        'species_names': species_names,
+        'species_index': species_index,
+        'name_index': name_index,
+        'frequency_matrix': frequency_matrix,
+    }
+    catalog_matrix.update(build_metric_arrays(frequency_matrix))
+    catalog_matrix.update(build_lookalike_groups(frequency_matrix, catalog_matrix['group_norms']))
+    catalog_matrix.update(build_species_profiles(synonym_map, frequency_matrix))
+    catalog_matrix.update(build_hierarchy(frequency_matrix, group_codes, group_labels, group_pdf_urls, group_totals, biotope_pages))
+    return catalog_matrix
+
+# Počet najpodobnejších ("zameniteľných") skupín uložených pre každú skupinu
+LOOKALIKE_NEIGHBOURS = 3
+
+def build_lookalike_groups(frequency_matrix, group_norms, n_neighbours=LOOKALIKE_NEIGHBOURS):
+    """Kosínusová podobnosť frekvenčných profilov skupín (skupina × skupina) a ich najbližší susedia."""
+    frequencies = frequency_matrix.astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        norms = np.outer(group_norms, group_norms)
+        group_similarity = np.where(norms > 0, (frequencies.T @ frequencies) / norms, 0.0)
+    np.fill_diagonal(group_similarity, -np.inf)
+
+    n_neighbours = min(n_neighbours, max(len(group_norms) - 1, 0))
+    lookalike_columns = np.argsort(-group_similarity, axis=1, kind='stable')[:, :n_neighbours]
+    lookalike_scores = np.take_along_axis(group_similarity, lookalike_columns, axis=1)
+    np.fill_diagonal(group_similarity, 1.0)
+
+    return {
+        'group_similarity': group_similarity.astype(np.float32),
+        'lookalike_columns': lookalike_columns,
+        'lookalike_scores': lookalike_scores,
+    }
+
+def build_species_profiles(synonym_map, frequency_matrix):
+    """Invertované indexy pre profil druhu: kanonické meno → synonymá a druh → skupiny podľa početnosti."""
+    synonyms = defaultdict(list)
+    for synonym, canonical_name in synonym_map.items():
+        if synonym != canonical_name:
+            synonyms[canonical_name].append(synonym)
+
+    # Nenulové bunky matice v tvare CSR; v rámci riadku zoradené podľa početnosti (zostupne), potom podľa stĺpca
+    rows, columns = np.nonzero(frequency_matrix)
+    counts = frequency_matrix[rows, columns]
+    order = np.lexsort((columns, -counts, rows))
+    profile_indptr = np.zeros(frequency_matrix.shape[0] + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=frequency_matrix.shape[0]), out=profile_indptr[1:])
+
+    return {
+        'canonical_synonyms': {name: tuple(sorted(names)) for name, names in synonyms.items()},
+        'profile_indptr': profile_indptr,
+        'profile_columns': columns[order].astype(np.int32),
+        'profile_counts': counts[order].astype(np.int32),
+    }
+
+def build_metric_arrays(frequency_matrix):
+    # Rozšírená matica [frekvencie | výskyt 0/1 | max. frekvencia druhu] – všetky metriky
+    # podobnosti sa dajú spočítať z jedného súčtu jej riadkov (viď compute_similarity_metrics)
+    presence_matrix = (frequency_matrix > 0).astype(np.int32)
+    species_row_max = frequency_matrix.max(axis=1, initial=0).astype(np.int32)
+    return {
+        'metric_matrix': np.hstack([frequency_matrix, presence_matrix, species_row_max[:, None]]),
+        'group_species_counts': presence_matrix.sum(axis=0).astype(np.float64),
+        'group_norms': np.sqrt((frequency_matrix.astype(np.float64) ** 2).sum(axis=0)),
+    }
+
+def load_catalog_snapshot_from_files(fingerprint):
+    """Snapshot zo súborov katalógu; None, ak katalóg chýba alebo sa nedá spracovať."""
+    try:
+        catalog_text = load_file_content(CATALOG_FILENAME)
+    except FileNotFoundError:
+        return None
+
+    biotope_pages = dict(BIOTOPE_PAGES)
+    if fingerprint[1] is not None:
+        try:
+            biotope_pages.update(parse_biotope_pages(load_file_content(PAGES_FILENAME)))
+        except OSError as e:
+            logger.warning("Page file %s not loaded: %s", PAGES_FILENAME, e)
+
+    return build_catalog_snapshot(catalog_text, biotope_pages, fingerprint)
+
+@st.cache_resource
+def get_catalog_store():
+    """Zdieľané úložisko aktuálneho snapshotu katalógu (spoločné pre všetky relácie)."""
+    return {
+        'snapshot': None,
+        'lock': threading.Lock(),
+        'watcher': None,
+        'failed_fingerprint': None,
+        'last_error': None,
+        'history_refresh': None,
+        'history_refresh_pending': None,
+        'history_refresher': None,
+    }
+
+def _catalog_watcher_loop(store):
+    while True:
+        time.sleep(CATALOG_WATCH_INTERVAL)
+        try:
+            fingerprint = get_catalog_fingerprint()
+            current = store['snapshot']
+            if fingerprint[0] is None or fingerprint == store['failed_fingerprint']:
+                continue
+            if current is not None and fingerprint == current['fingerprint']:
+                continue
+
+            snapshot = load_catalog_snapshot_from_files(fingerprint)
+
+            # Súbor sa počas čítania ešte menil (napr. prebieha kopírovanie) – skúsime v ďalšom kole
+            if get_catalog_fingerprint() != fingerprint:
+                continue
+
+            if snapshot is None:
+                logger.warning("Catalog %s could not be parsed, keeping version %s",
+                               CATALOG_FILENAME, current['version'] if current else None)
+                store['failed_fingerprint'] = fingerprint
+                continue
+
+            # Atomická výmena referencie: bežiace behy skriptu dokončia výpočet so starou verziou,
+            # nové behy už dostanú novú. Dvojica (stará, nová) sa číta pod zámkom – medzitým mohol
+            # snapshot nastaviť aj beh skriptu (prvé načítanie).
+            with store['lock']:
+                previous = store['snapshot']
+                store['snapshot'] = snapshot
+                store['failed_fingerprint'] = None
+                store['last_error'] = None
+
+            # Uložené analýzy sa prepočítajú len tam, kde zmena katalógu môže zmeniť výsledok
+            # (mimo zámku – schedule_history_refresh si ho berie sám)
+            if previous is not None and previous['version'] != snapshot['version']:
+                schedule_history_refresh(store, previous, snapshot)
+        except Exception as e:
+            logger.exception("Catalog reload failed")
+            store['last_error'] = str(e)
+
+def schedule_history_refresh(store, old_snapshot, new_snapshot):
+    """Prepočet histórie beží vo vlastnom vlákne, aby dlhý zápis do SQLite nebrzdil ďalšiu výmenu katalógu.
+
+    Zmeny, ktoré prídu počas prepočtu, sa zlúčia do jedného čakajúceho prechodu (najstaršia → najnovšia verzia).
+    """
+    with store['lock']:
+        pending = store['history_refresh_pending']
+        store['history_refresh_pending'] = (pending[0] if pending else old_snapshot, new_snapshot)
+        if store['history_refresher'] is None:
+            refresher = threading.Thread(target=_history_refresh_loop, args=(store,), name="history-refresh", daemon=True)
+            store['history_refresher'] = refresher
+            refresher.start()
+
+def _history_refresh_loop(store):
+    while True:
+        with store['lock']:
+            pending = store['history_refresh_pending']
+            store['history_refresh_pending'] = None
+            if pending is None:
+                store['history_refresher'] = None
+                return
+        try:
+            store['history_refresh'] = refresh_history_for_catalog(*pending)
+        except Exception as e:
+            logger.exception("History refresh failed")
+            store['last_error'] = str(e)
+
+def start_catalog_watcher(store):
+    with store['lock']:
+        if store['watcher'] is None or not store['watcher'].is_alive():
+            watcher = threading.Thread(target=_catalog_watcher_loop, args=(store,), name="catalog-watcher", daemon=True)
+            watcher.start()
+            store['watcher'] = watcher
+
+def get_catalog_snapshot():
+    """Vráti aktuálny snapshot katalógu. Prvé načítanie prebehne synchrónne, ďalšie už na pozadí."""
+    store = get_catalog_store()
+
+    if store['snapshot'] is None:
+        with store['lock']:
+            if store['snapshot'] is None:
+                try:
+                    store['snapshot'] = load_catalog_snapshot_from_files(get_catalog_fingerprint())
+                except Exception as e:
+                    logger.exception("Catalog load failed")
+                    store['last_error'] = str(e)
+
+    snapshot = store['snapshot']
+    if snapshot is not None:
+        start_catalog_watcher(store)
+    return snapshot
+
+# --- SCORING ENGINE (MATRIX) ---
+
+def resolve_species_rows(species_list, snapshot):
+    """Priradí zadané mená k riadkom matice (synonymum → kanonický druh, opakovaný druh sa ignoruje)."""
+    name_index = snapshot['name_index']
+    species_names = snapshot['species_names']
+
+    rows = []
+    seen_rows = set()
+    name_conversion_map = {}
+    ignored_inputs = []
+    unknown_inputs = []
+
+    for user_species in species_list:
+        user_species = biotope_offline.normalize_species_name(user_species)
+        row = name_index.get(user_species)
+
+        if row is None:
+            unknown_inputs.append(user_species)
+            continue
+
+        name_conversion_map[user_species] = species_names[row]
+        if row in seen_rows:
+            ignored_inputs.append(user_species)
+        else:
+            seen_rows.add(row)
+            rows.append(row)
+
+    return np.array(rows, dtype=np.intp), name_conversion_map, ignored_inputs, unknown_inputs
+
+def score_rows_batch(rows_per_releve, snapshot, matrix_key='frequency_matrix'):
+    """Kumulatívne frekvencie (zápis × skupina) pre viac zápisov naraz jedným np.add.reduceat."""
+    frequency_matrix = snapshot[matrix_key]
+    cumulative = np.zeros((len(rows_per_releve), frequency_matrix.shape[1]), dtype=np.int64)
+
+    lengths = np.array([len(rows) for rows in rows_per_releve], dtype=np.intp)
+    non_empty = np.flatnonzero(lengths)
+    if len(non_empty) == 0:
+        return cumulative
+
+    all_rows = np.concatenate([rows_per_releve[i] for i in non_empty])
+    offsets = np.concatenate(([0], np.cumsum(lengths[non_empty])[:-1]))
+    cumulative[non_empty] = np.add.reduceat(frequency_matrix[all_rows], offsets, axis=0)
+    return cumulative
+
+def compute_fqi(cumulative, group_totals):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fqi = np.where(group_totals > 0, cumulative / group_totals * 100, 0.0)
+    return fqi
+
+# Metriky podobnosti zápisu so skupinou (všetky v %):
+#   fqi       – podiel súčtu frekvencií vybraných druhov na celkovej frekvencii skupiny
+#   jaccard   – |druhy zápisu ∩ druhy skupiny| / |druhy zápisu ∪ druhy skupiny|
+#   cosine    – kosínus medzi 0/1 vektorom zápisu a frekvenčným profilom skupiny
+#   precision – frekvenčne vážená presnosť: frekvencie druhov v skupine / ich maximálne frekvencie v katalógu
+#   f1        – harmonický priemer presnosti a FQI (podielu na frekvencii skupiny, t. j. váženej úplnosti)
+SIMILARITY_METRICS = ('fqi', 'jaccard', 'cosine', 'precision', 'f1')
+
+def compute_similarity_metrics(rows_per_releve, snapshot):
+    """Všetky metriky pre blok zápisov z jedného prechodu cez rozšírenú maticu (zápis × skupina)."""
+    combined = score_rows_batch(rows_per_releve, snapshot, matrix_key='metric_matrix')
+    n_species = np.array([len(rows) for rows in rows_per_releve], dtype=np.float64)
+    return metrics_from_combined(combined, n_species, snapshot)
+
+def metrics_from_combined(combined, n_species, snapshot):
+    """Metriky z riadkových súčtov rozšírenej matice (zápis × [frekvencie | výskyt | max])."""
+    n_groups = len(snapshot['group_ids'])
+    combined = combined.astype(np.float64)
+    n_species = np.asarray(n_species, dtype=np.float64)[:, None]
+
+    cumulative = combined[:, :n_groups]
+    shared_species = combined[:, n_groups:2 * n_groups]
+    row_max_sum = combined[:, 2 * n_groups:]
+
+    group_totals = snapshot['group_totals']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        recall = np.where(group_totals > 0, cumulative / group_totals, 0.0)
+        union = n_species + snapshot['group_species_counts'] - shared_species
+        jaccard = np.where(union > 0, shared_species / union, 0.0)
+        cosine_norm = np.sqrt(n_species) * snapshot['group_norms']
+        cosine = np.where(cosine_norm > 0, cumulative / cosine_norm, 0.0)
+        precision = np.where(row_max_sum > 0, cumulative / row_max_sum, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+
+    return {
+        'cumulative': cumulative,
+        'fqi': recall * 100,
+        'jaccard': jaccard * 100,
+        'cosine': cosine * 100,
+        'precision': precision * 100,
+        'f1': f1 * 100,
+    }
+
+def rank_top_groups(cumulative, scores, top_k=3):
+    """Vráti indexy stĺpcov top-k skupín (len skupiny so zhodou) zoradené podľa zvolenej metriky."""
+    candidates = np.flatnonzero(cumulative > 0)
+    if len(candidates) == 0:
+        return candidates
+    order = np.argsort(-scores[candidates], kind='stable')[:top_k]
+    return candidates[order]
+
+def build_top_matches(columns, fqi, snapshot, metrics=None):
+    """Zostaví top výsledky (kód, názov, FQI ako text aj číslo, PDF odkaz, voliteľne všetky metriky)."""
+    top_matches_data = []
+    for rank, col in enumerate(columns):
+        item = {
+            'rank': rank + 1,
+            'code': snapshot['group_codes'][col],
+            'name': snapshot['group_labels'][col],
+            'fqi': f"{fqi[col]:.2f} %",
+            'fqi_value': float(fqi[col]),
+            'group_id': snapshot['group_ids'][col],
+            'pdf_url': snapshot['group_pdf_urls'][col],
+        }
+        if metrics is not None:
+            item['metrics'] = {metric: float(metrics[metric][col]) for metric in SIMILARITY_METRICS}
+        if 'lookalike_columns' in snapshot:
+            item['lookalikes'] = [
+                (snapshot['group_codes'][other], float(score) * 100)
+                for other, score in zip(snapshot['lookalike_columns'][col], snapshot['lookalike_scores'][col])
+                if score > 0
+            ]
+        top_matches_data.append(item)
+    return top_matches_data
+
+def analyze_similarity_metrics(species_list, snapshot, rank_by='fqi', top_k=3, cover_entries=None, weighting='presence', cover_scale='auto'):
+    """FQI nad maticou snapshotu spolu so všetkými metrikami a voľbou poradia (jediná cesta hodnotenia zápisu).
+
+    S cover_entries [(druh, pokryvnosť, vrstva), ...] a weighting != 'presence' je FQI vážené pokryvnosťou.
+    """
+    rows, name_conversion_map, ignored_inputs, _ = resolve_species_rows(species_list, snapshot)
+    processed_canonical_species = {snapshot['species_names'][row] for row in rows}
+
+    metrics = compute_similarity_metrics([rows], snapshot)
+    if weighting != 'presence':
+        metrics = apply_cover_weighting(metrics, [rows], [covers_for_rows(rows, cover_entries or [], snapshot, cover_scale)], snapshot, weighting)
+    metrics = {name: values[0] for name, values in metrics.items()}
+    columns = rank_top_groups(metrics['cumulative'], metrics[rank_by], top_k)
+    if len(columns) == 0:
+        return None, processed_canonical_species, name_conversion_map, ignored_inputs
+
+    top_matches_data = build_top_matches(columns, metrics['fqi'], snapshot, metrics)
+    return top_matches_data, processed_canonical_species, name_conversion_map, ignored_inputs
+
+@instrumented_cache_data(max_entries=256, show_spinner=False)
+def analyze_similarity(species_list, catalog_version, rank_by='fqi', top_k=3, cover_entries=None,
+                       weighting='presence', cover_scale='auto', _snapshot=None):
+    """Vstup stránky výsledkov: analyze_similarity_metrics s cache podľa zoznamu druhov a verzie katalógu."""
+    return analyze_similarity_metrics(species_list, _snapshot, rank_by, top_k, cover_entries, weighting, cover_scale)
+
+# --- COVER-WEIGHTED FQI ---
+
+# Vstup s pokryvnosťou: "druh<TAB alebo ;>pokryvnosť[<TAB alebo ;>vrstva]"; pokryvnosť v % alebo v stupnici
+# Braun-Blanquet, vrstva E3/E2/E1/E0. Váhy sa normalizujú na priemer 1, takže rovnaké pokryvnosti
+# dajú presne obyčajné FQI a vážené varianty sú s ním porovnateľné.
+COVER_LAYERS = ('E3', 'E2', 'E1', 'E0')
+COVER_SCALES = ('auto', 'percent', 'braun_blanquet')
+COVER_WEIGHTINGS = ('presence', 'cover', 'sqrt_cover', 'ordinal')
+
+# Stred intervalu pokryvnosti (%) pre stupne Braun-Blanquet
+BRAUN_BLANQUET_COVER = {
+    'r': 0.1, '+': 0.5, '1': 2.5, '2m': 2.5, '2a': 10.0, '2b': 20.0, '2': 15.0, '3': 37.5, '4': 62.5, '5': 87.5,
+}
+# Ordinálna stupnica (van der Maarel 1–9) podľa hraníc pokryvnosti v %
+ORDINAL_COVER_BOUNDS = np.array([0.1, 0.5, 5.0, 15.0, 25.0, 50.0, 75.0])
+ORDINAL_COVER_STEPS = np.array([1, 2, 3, 5, 6, 7, 8, 9], dtype=np.float64)
+
+RE_COVER_FIELDS = re.compile(r'\t|;')
+
+def parse_species_cover_line(line):
+    """Riadok vstupu → (druh, text pokryvnosti, vrstva); pri samotnom mene sú posledné dve prázdne."""
+    fields = [re.sub(r'\s+', ' ', field).strip() for field in RE_COVER_FIELDS.split(line)]
+    fields += [''] * (3 - len(fields))
+    return fields[0], fields[1], parse_cover_layer(fields[2])
+
+def parse_cover_layer(text):
+    text = text.strip().upper()
+    if text in COVER_LAYERS:
+        return text
+    if f"E{text}" in COVER_LAYERS:
+        return f"E{text}"
+    return ''
+
+def detect_cover_scale(cover_texts):
+    """Braun-Blanquet, ak sú všetky zadané hodnoty platné stupne, inak percentá."""
+    values = [text.strip().lower() for text in cover_texts if text and text.strip()]
+    if values and all(value in BRAUN_BLANQUET_COVER for value in values):
+        return 'braun_blanquet'
+    return 'percent'
+
+def parse_cover_value(text, scale='percent'):
+    """Pokryvnosť v % (0–100) alebo NaN, ak chýba alebo sa nedá prečítať."""
+    text = text.strip().lower().rstrip('%').strip()
+    if not text:
+        return np.nan
+    if scale == 'braun_blanquet':
+        return BRAUN_BLANQUET_COVER.get(text, np.nan)
+    try:
+        return min(max(float(text.replace(',', '.')), 0.0), 100.0)
+    except ValueError:
+        return BRAUN_BLANQUET_COVER.get(text, np.nan)
+
+def resolve_cover_entries(entries, snapshot, scale='auto'):
+    """Ako resolve_species_rows, navyše pokryvnosť (%) pre každý riadok matice.
+
+    Duplicita kanonického druhu v tej istej vrstve sa ignoruje (platí prvý záznam), pokryvnosti
+    toho istého druhu z rôznych vrstiev sa skombinujú ako nezávislé prekryvy: 1 − Π(1 − c).
+    """
+    entries = list(entries)
+    if scale == 'auto':
+        scale = detect_cover_scale(cover for _, cover, _ in entries)
+    rows, name_conversion_map, _, unknown_inputs = resolve_species_rows([name for name, _, _ in entries], snapshot)
+
+    # Ten istý druh v inej vrstve nie je duplicita – ignoruje sa len opakovanie v rovnakej vrstve
+    layer_covers = {}
+    ignored_inputs = []
+    for name, cover, layer in entries:
+        name = biotope_offline.normalize_species_name(name)
+        row = snapshot['name_index'].get(name)
+        if row is None:
+            continue
+        if layer in layer_covers.setdefault(row, {}):
+            ignored_inputs.append(name)
+        else:
+            layer_covers[row][layer] = parse_cover_value(cover, scale)
+
+    covers = np.full(len(rows), np.nan)
+    for i, row in enumerate(rows.tolist()):
+        known = [value for value in layer_covers.get(row, {}).values() if not np.isnan(value)]
+        if known:
+            covers[i] = 100.0 * (1.0 - np.prod([1.0 - value / 100.0 for value in known]))
+    return rows, covers, name_conversion_map, ignored_inputs, unknown_inputs
+
+def cover_weights(covers, weighting='cover'):
+    """Váhy druhov z pokryvností (%); chýbajúca pokryvnosť dostane priemernú váhu, priemer váh je 1."""
+    covers = np.asarray(covers, dtype=np.float64)
+    if weighting == 'presence' or len(covers) == 0:
+        return np.ones(len(covers))
+    if weighting == 'sqrt_cover':
+        weights = np.sqrt(covers / 100.0)
+    elif weighting == 'ordinal':
+        weights = np.where(np.isnan(covers), np.nan, ORDINAL_COVER_STEPS[np.searchsorted(ORDINAL_COVER_BOUNDS, np.nan_to_num(covers))])
+    else:
+        weights = covers / 100.0
+
+    known = ~np.isnan(weights)
+    if not known.any() or weights[known].sum() <= 0:
+        return np.ones(len(covers))
+    weights[~known] = weights[known].mean()
+    return weights * (len(weights) / weights.sum())
+
+def get_releve_cover_entries(releve):
+    """Záznamy (druh, pokryvnosť, vrstva) dávkového zápisu; bez stĺpca pokryvnosti sú pokryvnosti prázdne."""
+    covers = releve.get('covers') or [('', '')] * len(releve['species'])
+    return [(name, cover, layer) for name, (cover, layer) in zip(releve['species'], covers)]
+
+def align_cover_entries(species_list, cover_entries):
+    """Zoznam druhov a k nemu zarovnané (pokryvnosť, vrstva); druh z viacerých vrstiev sa zopakuje pre každú vrstvu."""
+    covers_per_name = defaultdict(list)
+    for name, cover, layer in cover_entries:
+        covers_per_name[name].append((cover, layer))
+    species, covers = [], []
+    for name in species_list:
+        for cover, layer in covers_per_name.get(name) or [('', '')]:
+            species.append(name)
+            covers.append((cover, layer))
+    return species, covers
+
+def covers_for_rows(rows, cover_entries, snapshot, scale='auto'):
+    """Pokryvnosti zadaných záznamov zarovnané na riadky rows (NaN pre druhy bez pokryvnosti)."""
+    cover_rows, covers = resolve_cover_entries(cover_entries, snapshot, scale)[:2]
+    row_covers = dict(zip(cover_rows.tolist(), covers.tolist()))
+    return np.array([row_covers.get(row, np.nan) for row in rows.tolist()], dtype=np.float64)
+
+def score_rows_weighted(rows_per_releve, weights_per_releve, snapshot):
+    """Vážené kumulatívne frekvencie (zápis × skupina): váhy × riadky matice, pre všetky zápisy jedným reduceat."""
+    frequency_matrix = snapshot['frequency_matrix']
+    cumulative = np.zeros((len(rows_per_releve), frequency_matrix.shape[1]), dtype=np.float64)
+
+    lengths = np.array([len(rows) for rows in rows_per_releve], dtype=np.intp)
+    non_empty = np.flatnonzero(lengths)
+    if len(non_empty) == 0:
+        return cumulative
+
+    all_rows = np.concatenate([rows_per_releve[i] for i in non_empty])
+    all_weights = np.concatenate([weights_per_releve[i] for i in non_empty])
+    offsets = np.concatenate(([0], np.cumsum(lengths[non_empty])[:-1]))
+    cumulative[non_empty] = np.add.reduceat(frequency_matrix[all_rows] * all_weights[:, None], offsets, axis=0)
+    return cumulative
+
+def apply_cover_weighting(metrics, rows_per_releve, covers_per_releve, snapshot, weighting='presence'):
+    """Nahradí FQI váženým variantom (ostatné metriky zostávajú podľa prítomnosti druhov)."""
+    if weighting == 'presence':
+        return metrics
+    weights_per_releve = [cover_weights(covers, weighting) for covers in covers_per_releve]
+    weighted = score_rows_weighted(rows_per_releve, weights_per_releve, snapshot)
+    group_totals = snapshot['group_totals']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fqi = np.where(group_totals > 0, weighted / group_totals * 100, 0.0)
+    return dict(metrics, fqi=fqi)
+
+# --- HIERARCHY (CLASS / TYPE / SUBTYPE) ---
+
+# Kód biotopu: trieda (písmená), typ (+ číslo), podtyp (+ ".číslo"); koncové malé písmeno je variant,
+# napr. LES05.1a → LES / LES05 / LES05.1, VOD12b → VOD / VOD12 / VOD12
+RE_BIOTOPE_HIERARCHY = re.compile(r'^([A-Z]+)(\d+)?(\.\d+)?[a-z]?$')
+
+HIERARCHY_LEVELS = ('class', 'type', 'subtype')
+
+def get_hierarchy_units(biotope_code):
+    match = RE_BIOTOPE_HIERARCHY.match(biotope_code)
+    if not match:
+        return {level: biotope_code for level in HIERARCHY_LEVELS}
+    class_code = match.group(1)
+    type_code = class_code + (match.group(2) or '')
+    return {'class': class_code, 'type': type_code, 'subtype': type_code + (match.group(3) or '')}
+
+def build_hierarchy(frequency_matrix, group_codes, group_labels, group_pdf_urls, group_totals, biotope_pages):
+    """Agregované matice a súčty pre každú úroveň hierarchie (pri načítaní katalógu).
+
+    Každá úroveň má rovnaké kľúče ako skupiny snapshotu (group_ids, group_totals, ...),
+    takže na ňu fungujú metrics_from_combined aj build_top_matches bez úprav.
+    """
+    code_column = {code: col for col, code in enumerate(group_codes)}
+    units_per_group = [get_hierarchy_units(code) for code in group_codes]
+
+    hierarchy = {}
+    level_matrices = []
+    offset = 0
+    for level in HIERARCHY_LEVELS:
+        unit_codes = list(dict.fromkeys(units[level] for units in units_per_group))
+        unit_column = {code: i for i, code in enumerate(unit_codes)}
+        membership = np.zeros((len(group_codes), len(unit_codes)), dtype=np.int64)
+        membership[np.arange(len(group_codes)), [unit_column[units[level]] for units in units_per_group]] = 1
+
+        members = [[] for _ in unit_codes]
+        for code, units in zip(group_codes, units_per_group):
+            members[unit_column[units[level]]].append(code)
+
+        level_matrix = build_metric_arrays((frequency_matrix @ membership).astype(np.int32))
+        width = level_matrix['metric_matrix'].shape[1]
+        level_matrices.append(level_matrix.pop('metric_matrix'))
+
+        hierarchy[level] = {
+            'group_ids': unit_codes,
+            'group_codes': unit_codes,
+            # Názov podľa skupiny s rovnakým kódom, inak rozsah kódov, ktoré úroveň zahŕňa
+            'group_labels': [
+                group_labels[code_column[code]] if code in code_column
+                else (unit_members[0] if len(unit_members) == 1 else f"{unit_members[0]} – {unit_members[-1]}")
+                for code, unit_members in zip(unit_codes, members)
+            ],
+            'group_pdf_urls': [
+                get_biotope_pdf_url(code, biotope_pages) if code in biotope_pages else group_pdf_urls[code_column[unit_members[0]]]
+                for code, unit_members in zip(unit_codes, members)
+            ],
+            'group_members': members,
+            'group_totals': group_totals @ membership,
+            'matrix_columns': slice(offset, offset + width),
+            **level_matrix,
+        }
+        offset += width
+
+    return {'hierarchy': hierarchy, 'hierarchy_matrix': np.hstack(level_matrices)}
+
+def compute_hierarchy_metrics(rows_per_releve, snapshot):
+    """Metriky pre všetky úrovne hierarchie z jedného prechodu cez spojenú maticu úrovní."""
+    combined = score_rows_batch(rows_per_releve, snapshot, matrix_key='hierarchy_matrix')
+    n_species = np.array([len(rows) for rows in rows_per_releve], dtype=np.float64)
+    return {
+        level: metrics_from_combined(combined[:, view['matrix_columns']], n_species, view)
+        for level, view in snapshot['hierarchy'].items()
+    }
+
+def analyze_hierarchy(species_list, snapshot, rank_by='fqi', top_k=3):
+    """Poradie tried, typov a podtypov biotopov pre jeden zápis (jedno volanie, jeden prechod maticou)."""
+    rows = resolve_species_rows(species_list, snapshot)[0]
+    results = {}
+    for level, level_metrics in compute_hierarchy_metrics([rows], snapshot).items():
+        metrics = {name: values[0] for name, values in level_metrics.items()}
+        columns = rank_top_groups(metrics['cumulative'], metrics[rank_by], top_k)
+        results[level] = build_top_matches(columns, metrics['fqi'], snapshot['hierarchy'][level], metrics)
+    return results
+
+# --- SPECIES PROFILE ---
+
+def get_species_profile(species_name, snapshot):
+    """Profil druhu (aj zo synonyma): kanonické meno, synonymá a výskyt v skupinách zoradený podľa početnosti.
+
+    Číta len predpripravené indexy snapshotu (build_species_profiles); pre neznáme meno vráti None.
+    """
+    species_name = biotope_offline.normalize_species_name(species_name)
+    if species_name not in snapshot['all_species_index']:
+        return None
+
+    canonical_name = get_canonical_name(species_name, snapshot['synonym_map'])
+    row = snapshot['species_index'].get(canonical_name)
+    if row is None:
+        columns = counts = np.zeros(0, dtype=np.int32)
+    else:
+        start, end = snapshot['profile_indptr'][row], snapshot['profile_indptr'][row + 1]
+        columns = snapshot['profile_columns'][start:end]
+        counts = snapshot['profile_counts'][start:end]
+
+    total = int(counts.sum())
+    group_totals = snapshot['group_totals'][columns]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share_of_group = np.where(group_totals > 0, counts / group_totals * 100, 0.0)
+
+    return {
+        'name': species_name,
+        'canonical': canonical_name,
+        'synonyms': snapshot['canonical_synonyms'].get(canonical_name, ()),
+        'total': total,
+        'groups': [
+            {
+                'code': snapshot['group_codes'][col],
+                'name': snapshot['group_labels'][col],
+                'pdf_url': snapshot['group_pdf_urls'][col],
+                'count': int(count),
+                'share_of_species': count / total * 100,
+                'share_of_group': float(share),
+            }
+            for col, count, share in zip(columns.tolist(), counts.tolist(), share_of_group)
+        ],
+    }
+
+# --- LEAVE-ONE-OUT SENSITIVITY ---
+
+def leave_one_out_sensitivity(rows, snapshot, rank_by='fqi', top_k=3):
+    """Poradie top-k po vynechaní každého druhu zápisu.
+
+    Všetky varianty vzniknú naraz odčítaním riadku druhu od súčtu rozšírenej matice,
+    namiesto opakovaného volania analyze_similarity_metrics pre každý vynechaný druh.
+    """
+    rows = np.asarray(rows, dtype=np.intp)
+    if len(rows) == 0:
+        return []
+
+    metric_matrix = snapshot['metric_matrix']
+    species_rows = metric_matrix[rows].astype(np.int64)
+    combined_full = species_rows.sum(axis=0)
+
+    full_metrics = metrics_from_combined(combined_full[None, :], [len(rows)], snapshot)
+    full_top = rank_top_groups(full_metrics['cumulative'][0], full_metrics[rank_by][0], top_k)
+    full_winner = full_top[0] if len(full_top) else None
+
+    loo_metrics = metrics_from_combined(combined_full[None, :] - species_rows, np.full(len(rows), len(rows) - 1), snapshot)
+    scores = np.where(loo_metrics['cumulative'] > 0, loo_metrics[rank_by], -np.inf)
+    loo_top = np.argsort(-scores, axis=1, kind='stable')[:, :top_k]
+
+    results = []
+    for i, row in enumerate(rows):
+        top_columns = [col for col in loo_top[i] if np.isfinite(scores[i, col])]
+        winner = top_columns[0] if top_columns else None
+        results.append({
+            'species': snapshot['species_names'][row],
+            'winner_code': snapshot['group_codes'][winner] if winner is not None else None,
+            'winner_score': float(scores[i, winner]) if winner is not None else 0.0,
+            'top_codes': [snapshot['group_codes'][col] for col in top_columns],
+            'changes_winner': winner != full_winner,
+            'score_drop': float(full_metrics[rank_by][0][full_winner] - loo_metrics[rank_by][i][full_winner]) if full_winner is not None else 0.0,
+        })
+    return results
+
+# --- NEXT-BEST SPECIES SUGGESTIONS ---
+
+SUGGESTION_METHODS = ('difference', 'entropy')
+SUGGESTION_LIMIT = 10
+
+def entropy_bits(probabilities):
+    """Shannonova entropia (v bitoch) pozdĺž poslednej osi."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return -np.sum(np.where(probabilities > 0, probabilities * np.log2(probabilities), 0.0), axis=-1)
+
+def suggest_discriminating_species(rows, snapshot, rank_by='fqi', top_k=3, method='difference', limit=SUGGESTION_LIMIT):
+    """Zatiaľ nezadané druhy zoradené podľa toho, ako dobre rozlíšia top-k kandidátov zápisu.
+
+    'difference' – rozpätie prírastku FQI (frekvencia / súčet frekvencií skupiny) medzi kandidátmi,
+    'entropy' – očakávaný informačný zisk o víťazovi z pozorovania druhu (prítomný / neprítomný),
+    pričom apriórne váhy kandidátov sú ich aktuálne skóre. Obe sa rátajú naraz pre všetky druhy
+    nad k stĺpcami matice kandidátov.
+    """
+    metrics = {name: values[0] for name, values in compute_similarity_metrics([rows], snapshot).items()}
+    columns = rank_top_groups(metrics['cumulative'], metrics[rank_by], top_k)
+    if len(columns) < 2:
+        return []
+
+    candidate_counts = snapshot['frequency_matrix'][:, columns].astype(np.float64)
+    group_totals = snapshot['group_totals'][columns]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gains = np.where(group_totals > 0, candidate_counts / group_totals * 100, 0.0)
+
+    if method == 'entropy':
+        prior = np.maximum(metrics[rank_by][columns], 0.0)
+        prior = prior / prior.sum() if prior.sum() > 0 else np.full(len(columns), 1.0 / len(columns))
+        # Pravdepodobnosť výskytu druhu v skupine ~ frekvencia voči najčastejšiemu druhu skupiny
+        column_max = candidate_counts.max(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            presence = np.where(column_max > 0, candidate_counts / column_max, 0.0)
+            p_present = presence @ prior
+            posterior_present = np.where(p_present[:, None] > 0, presence * prior / p_present[:, None], 0.0)
+            posterior_absent = np.where(p_present[:, None] < 1, (1 - presence) * prior / (1 - p_present[:, None]), 0.0)
+            scores = (entropy_bits(prior) - p_present * entropy_bits(posterior_present)
+                      - (1 - p_present) * entropy_bits(posterior_absent))
+    else:
+        scores = gains.max(axis=1) - gains.min(axis=1)
+
+    scores[rows] = -np.inf
+    scores[candidate_counts.sum(axis=1) == 0] = -np.inf
+    order = np.argsort(-scores, kind='stable')[:limit]
+    order = order[scores[order] > 1e-12]
+
+    favoured = gains.argmax(axis=1)
+    return [
+        {
+            'species': snapshot['species_names'][row],
+            'score': float(scores[row]),
+            'favours': snapshot['group_codes'][columns[favoured[row]]],
+            'gains': [(snapshot['group_codes'][col], float(gain)) for col, gain in zip(columns, gains[row])],
+        }
+        for row in order.tolist()
+    ]
+
+# --- RANKING CONFIDENCE (BOOTSTRAP / PERMUTATION) ---
+
+CONFIDENCE_RESAMPLES = 2000
+CONFIDENCE_PERMUTATIONS = 1000
+# Horná hranica počtu prvkov medzivýsledku pri permutáciách (riadi spotrebu pamäte)
+CONFIDENCE_CHUNK_ELEMENTS = 4_000_000
+
+def bootstrap_confidence(rows, snapshot, top_k=3, rank_by='fqi', covers=None, weighting='presence',
+                         n_resamples=CONFIDENCE_RESAMPLES, n_permutations=CONFIDENCE_PERMUTATIONS, ci_level=95, seed=None):
+    """Spoľahlivosť poradia pre jeden zápis – rovnaká metrika a váženie ako analyze_similarity_metrics.
+
+    Bootstrap: druhy zápisu sa vyberajú s opakovaním (multinomické počty × podmatica zápisu),
+    z toho interval spoľahlivosti skóre a pravdepodobnosť, že skupina je najlepšia zhoda.
+    Permutácie: náhodné súbory rovnakého počtu druhov z katalógu (s váhami zápisu), z toho p-hodnota.
+    """
+    rng = np.random.default_rng(seed)
+    group_totals = snapshot['group_totals']
+    rows = np.asarray(rows, dtype=np.intp)
+    n_rows = len(rows)
+    if n_rows == 0:
+        return []
+
+    n_groups = len(group_totals)
+    sub_matrix = snapshot['metric_matrix'][rows].astype(np.float64)
+    weights = cover_weights(covers if covers is not None else np.full(n_rows, np.nan), weighting)
+
+    def score_samples(combined, weighted_cumulative, group_snapshot):
+        # Vážené FQI nahradí obyčajné rovnako ako apply_cover_weighting, ostatné metriky sú podľa prítomnosti
+        metrics = metrics_from_combined(combined, np.full(len(combined), n_rows), group_snapshot)
+        if weighting != 'presence':
+            metrics['fqi'] = compute_fqi(weighted_cumulative, group_snapshot['group_totals'])
+        return metrics
+
+    observed = score_samples(sub_matrix.sum(axis=0)[None, :], (weights @ sub_matrix[:, :n_groups])[None, :], snapshot)
+    observed = {name: values[0] for name, values in observed.items()}
+    columns = rank_top_groups(observed['cumulative'], observed[rank_by], top_k)
+
+    # Bootstrap – všetky opakovania jedným maticovým súčinom (B × k) @ (k × 2G+1); váhy vybraných
+    # druhov sa v každom opakovaní znova normalizujú na priemer 1
+    counts = rng.multinomial(n_rows, np.full(n_rows, 1.0 / n_rows), size=n_resamples).astype(np.float64)
+    weighted_counts = counts * weights
+    weighted_counts *= n_rows / weighted_counts.sum(axis=1, keepdims=True)
+    boot = score_samples(counts @ sub_matrix, weighted_counts @ sub_matrix[:, :n_groups], snapshot)
+    boot_scores = np.where(boot['cumulative'] > 0, boot[rank_by], -np.inf)
+    best_counts = np.bincount(boot_scores.argmax(axis=1), minlength=n_groups)
+    tail = (100 - ci_level) / 2
+    ci_low, ci_high = np.percentile(boot[rank_by][:, columns], [tail, 100 - tail], axis=0)
+
+    # Permutácie – náhodné súbory n_rows rôznych druhov, len nad stĺpcami top-k skupín, po blokoch
+    metric_matrix = snapshot['metric_matrix']
+    n_species = metric_matrix.shape[0]
+    candidate_matrix = metric_matrix[:, np.concatenate([columns, n_groups + columns, [2 * n_groups]])].astype(np.float64)
+    candidate_snapshot = {
+        'group_ids': columns, 'group_totals': group_totals[columns],
+        'group_species_counts': snapshot['group_species_counts'][columns], 'group_norms': snapshot['group_norms'][columns],
+    }
+    exceed_counts = np.zeros(len(columns), dtype=np.int64)
+    chunk_size = max(1, CONFIDENCE_CHUNK_ELEMENTS // max(n_species, n_rows * candidate_matrix.shape[1]))
+    for start in range(0, n_permutations, chunk_size):
+        size = min(chunk_size, n_permutations - start)
+        random_rows = rng.random((size, n_species)).argpartition(n_rows - 1, axis=1)[:, :n_rows]
+        picked = candidate_matrix[random_rows]
+        # Náhodné druhy dostanú váhy druhov zápisu
+        perm = score_samples(
+            picked.sum(axis=1), np.einsum('snk,n->sk', picked[:, :, :len(columns)], weights), candidate_snapshot
+        )[rank_by]
+        exceed_counts += (perm >= observed[rank_by][columns]).sum(axis=0)
+
+    return [
+        {
+            'rank': i + 1,
+            'code': snapshot['group_codes'][col],
+            'fqi_value': float(observed['fqi'][col]),
+            'score': float(observed[rank_by][col]),
+            'ci_low': float(ci_low[i]),
+            'ci_high': float(ci_high[i]),
+            'p_best': float(best_counts[col] / n_resamples),
+            'p_value': float((exceed_counts[i] + 1) / (n_permutations + 1)),
+        }
+        for i, col in enumerate(columns)
+    ]
+
+def bootstrap_confidence_batch(rows_per_releve, snapshot, n_jobs=None, seed=None, **kwargs):
+    """Spoľahlivosť pre viac zápisov paralelne (numpy počas maticových operácií uvoľňuje GIL)."""
+    seeds = np.random.SeedSequence(seed).spawn(len(rows_per_releve))
+    with ThreadPoolExecutor(max_workers=n_jobs or os.cpu_count()) as executor:
+        return list(executor.map(
+            lambda args: bootstrap_confidence(args[0], snapshot, seed=args[1], **kwargs),
+            zip(rows_per_releve, seeds)
+        ))
+
+# --- BATCH SCORING (GEOJSON) ---
+
+BATCH_COLUMN_ALIASES = {
+    'releve_id': ('zapis', 'releve', 'releve_id', 'id'),
+    'species': ('druh', 'species', 'taxon'),
+    'suradnica': ('suradnica', 'suradnice', 'coordinates', 'coords'),
+    'lat': ('lat', 'latitude', 'sirka'),
+    'lon': ('lon', 'lng', 'longitude', 'dlzka'),
+    'lokalita': ('lokalita', 'locality'),
+    'mapovatel': ('mapovatel', 'mapper'),
+    'datum': ('datum', 'date'),
+    'pokryvnost_E3': ('e3', 'pokryvnost_e3'),
+    'pokryvnost_E2': ('e2', 'pokryvnost_e2'),
+    'pokryvnost_E1': ('e1', 'pokryvnost_e1'),
+    'pokryvnost_E0': ('e0', 'pokryvnost_e0'),
+    'cover': ('pokryvnost', 'cover', 'abundance'),
+    'layer': ('vrstva', 'layer'),
+}
+
+RE_COORD_NUMBER = re.compile(r'[-+]?\d+(?:[.,]\d+)?')
+RE_COORD_DMS = re.compile(r'(\d+(?:[.,]\d+)?)\s*°\s*(?:(\d+(?:[.,]\d+)?)\s*[\'′’]\s*)?(?:(\d+(?:[.,]\d+)?)\s*(?:"|″|\'\'|”))?')
+RE_COORD_HEMISPHERE = re.compile(r'(?<![A-Za-z])([NSEW])(?![A-Za-z])', re.IGNORECASE)
+
+def parse_coordinates(coords_text):
+    """Prevedie voľný text súradníc (desatinné stupne alebo °'" s N/S/E/W) na (lat, lon), inak None."""
+    if not coords_text:
+        return None
+    text = str(coords_text).strip()
+
+    values = []
+    if '°' in text:
+        for degrees, minutes, seconds in RE_COORD_DMS.findall(text):
+            value = float(degrees.replace(',', '.'))
+            value += float(minutes.replace(',', '.')) / 60 if minutes else 0
+            value += float(seconds.replace(',', '.')) / 3600 if seconds else 0
+            values.append(value)
+    else:
+        values = [float(number.replace(',', '.')) for number in RE_COORD_NUMBER.findall(text)]
+    hemispheres = [letter.upper() for letter in RE_COORD_HEMISPHERE.findall(text)]
+
+    if len(values) != 2:
+        return None
+
+    lat, lon = values
+    if len(hemispheres) == 2:
+        if hemispheres[0] in ('E', 'W') and hemispheres[1] in ('N', 'S'):
+            lat, lon = lon, lat
+            hemispheres.reverse()
+        if hemispheres[0] == 'S':
+            lat = -abs(lat)
+        if hemispheres[1] == 'W':
+            lon = -abs(lon)
+
+    if abs(lat) > 90 and abs(lon) <= 90:
+        lat, lon = lon, lat
+    if abs(lat) > 90 or abs(lon) > 180:
+        return None
+    return lat, lon
+
+def detect_text_encoding(sample_bytes):
+    """UTF-8, ak sa úvod súboru dá dekódovať (neúplný posledný znak nevadí), inak Windows-1250."""
+    try:
+        codecs.getincrementaldecoder('utf-8-sig')().decode(sample_bytes, final=False)
+        return 'utf-8-sig'
+    except UnicodeDecodeError:
+        return 'windows-1250'
+
+def iter_batch_releves(lines):
+    """Číta dlhý formát (jeden riadok = zápis + druh) a priebežne vracia jednotlivé zápisy.
+
+    Prvý riadok je hlavička (TAB, ';' alebo ','), riadky jedného zápisu musia ísť za sebou.
+    """
+    lines = iter(lines)
+    header_line = next(lines, None)
+    if header_line is None:
+        return
+
+    delimiter = max(('\t', ';', ','), key=header_line.count)
+    reader = csv.reader(itertools.chain([header_line], lines), delimiter=delimiter)
+    header = [column.strip().lower() for column in next(reader)]
+
+    columns = {}
+    for field, aliases in BATCH_COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in header:
+                columns[field] = header.index(alias)
+                break
+    if 'releve_id' not in columns or 'species' not in columns:
+        raise ValueError(f"Missing columns: expected one of {BATCH_COLUMN_ALIASES['releve_id']} and {BATCH_COLUMN_ALIASES['species']}")
+
+    def cell(row, field):
+        col = columns.get(field)
+        return row[col].strip() if col is not None and col < len(row) else ''
+
+    current = None
+    for row in reader:
+        if not row or not any(value.strip() for value in row):
+            continue
+        releve_id = cell(row, 'releve_id')
+
+        if current is None or releve_id != current['releve_id']:
+            if current is not None:
+                yield current
+            current = {
+                'releve_id': releve_id,
+                'suradnica': cell(row, 'suradnica'),
+                'lokalita': cell(row, 'lokalita'),
+                'mapovatel': cell(row, 'mapovatel'),
+                'datum': cell(row, 'datum'),
+                'pokryvnost_E3': cell(row, 'pokryvnost_E3'),
+                'pokryvnost_E2': cell(row, 'pokryvnost_E2'),
+                'pokryvnost_E1': cell(row, 'pokryvnost_E1'),
+                'pokryvnost_E0': cell(row, 'pokryvnost_E0'),
+                'species': [],
+            }
+            # Pokryvnosť druhov (text, vrstva) sa drží len pri vstupe so stĺpcom pokryvnosti
+            if 'cover' in columns:
+                current['covers'] = []
+            if not current['suradnica'] and cell(row, 'lat') and cell(row, 'lon'):
+                current['suradnica'] = f"{cell(row, 'lat')}, {cell(row, 'lon')}"
+
+        species = biotope_offline.normalize_species_name(cell(row, 'species'))
+        if species:
+            current['species'].append(species)
+            if 'cover' in columns:
+                current['covers'].append((cell(row, 'cover'), parse_cover_layer(cell(row, 'layer'))))
+
+    if current is not None:
+        yield current
+
+def iter_chunks(iterable, chunk_size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def iter_geojson_features(releves, snapshot, top_k=3, chunk_size=1024, rank_by='fqi', confidence=False):
+    """Oskóruje zápisy po blokoch a priebežne vracia GeoJSON Feature pre každý zápis."""
+    for chunk in iter_chunks(releves, chunk_size):
+        resolved = [resolve_species_rows(releve['species'], snapshot) for releve in chunk]
+        metrics = compute_similarity_metrics([rows for rows, _, _, _ in resolved], snapshot)
+        if confidence:
+            confidence_results = bootstrap_confidence_batch(
+                [rows for rows, _, _, _ in resolved], snapshot, top_k=top_k, rank_by=rank_by, seed=0
+            )
+        cumulative = metrics['cumulative']
+        fqi = metrics['fqi']
+        rank_scores = metrics[rank_by]
+
+        for i, releve in enumerate(chunk):
+            rows, name_conversion_map, ignored_inputs, unknown_inputs = resolved[i]
+            columns = rank_top_groups(cumulative[i], rank_scores[i], top_k)
+            top_matches = build_top_matches(columns, fqi[i], snapshot)
+            coords = parse_coordinates(releve['suradnica'])
+
+            properties = {
+                'releve_id': releve['releve_id'],
+                'lokalita': releve['lokalita'],
+                'suradnica': releve['suradnica'],
+                'species_count': len(releve['species']),
+                'matched_species': int(len(rows)),
+                'unknown_species': len(unknown_inputs),
+                'catalog_version': snapshot['version'],
+                'rank_by': rank_by,
+            }
+            # Ploché stĺpce top1_*, top2_* ... sú čitateľné aj v GIS (QGIS, ArcGIS)
+            for match, col in zip(top_matches, columns):
+                prefix = f"top{match['rank']}"
+                properties[f"{prefix}_code"] = match['code']
+                properties[f"{prefix}_name"] = match['name']
+                properties[f"{prefix}_fqi"] = round(match['fqi_value'], 2)
+                if rank_by != 'fqi':
+                    properties[f"{prefix}_{rank_by}"] = round(float(rank_scores[i][col]), 2)
+                properties[f"{prefix}_pdf"] = match['pdf_url']
+
+            if confidence:
+                # Spoľahlivosť sa počíta pre poradie podľa FQI, priradí sa podľa kódu biotopu
+                confidence_by_code = {item['code']: item for item in confidence_results[i]}
+                for match in top_matches:
+                    item = confidence_by_code.get(match['code'])
+                    if item is not None:
+                        prefix = f"top{match['rank']}"
+                        properties[f"{prefix}_ci_low"] = round(item['ci_low'], 2)
+                        properties[f"{prefix}_ci_high"] = round(item['ci_high'], 2)
+                        properties[f"{prefix}_p_best"] = round(item['p_best'], 4)
+                        properties[f"{prefix}_p_value"] = round(item['p_value'], 4)
+
+            yield {
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [coords[1], coords[0]]} if coords else None,
+                'properties': properties,
+            }
+
+def write_geojson_stream(features, output):
+    """Zapisuje FeatureCollection po jednom prvku – celá kolekcia nikdy nie je v pamäti."""
+    count = 0
+    output.write('{"type": "FeatureCollection", "features": [\n')
+    for feature in features:
+        if count:
+            output.write(',\n')
+        output.write(json.dumps(feature, ensure_ascii=False))
+        count += 1
+    output.write('\n]}\n')
+    return count
+
+# --- ANALYSIS HISTORY (SQLITE) ---
+
+# Lokálna databáza uložených analýz (vytvorí sa pri prvom uložení)
+HISTORY_DB_FILENAME = "biotope_history.sqlite3"
+
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    catalog_version TEXT,
+    releve_id TEXT,
+    lokalita TEXT COLLATE NOCASE,
+    suradnica TEXT,
+    mapovatel TEXT COLLATE NOCASE,
+    datum TEXT,
+    pokryvnost_E3 TEXT,
+    pokryvnost_E2 TEXT,
+    pokryvnost_E1 TEXT,
+    pokryvnost_E0 TEXT,
+    rank_by TEXT,
+    species_count INTEGER,
+    winner_code TEXT,
+    winner_fqi REAL,
+    lat REAL,
+    lon REAL
+);
+CREATE TABLE IF NOT EXISTS analysis_species (
+    analysis_id INTEGER NOT NULL REFERENCES analyses(id) ON DELETE CASCADE,
+    input_name TEXT NOT NULL,
+    canonical_name TEXT,
+    status TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS analysis_scores (
+    analysis_id INTEGER NOT NULL REFERENCES analyses(id) ON DELETE CASCADE,
+    rank INTEGER NOT NULL,
+    group_code TEXT NOT NULL,
+    fqi REAL NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (analysis_id, rank)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_analyses_lokalita ON analyses(lokalita);
+CREATE INDEX IF NOT EXISTS idx_analyses_mapovatel ON analyses(mapovatel);
+CREATE INDEX IF NOT EXISTS idx_analyses_datum ON analyses(datum);
+CREATE INDEX IF NOT EXISTS idx_analyses_winner ON analyses(winner_code);
+CREATE INDEX IF NOT EXISTS idx_species_analysis ON analysis_species(analysis_id);
+CREATE INDEX IF NOT EXISTS idx_species_canonical ON analysis_species(canonical_name);
+CREATE INDEX IF NOT EXISTS idx_species_input ON analysis_species(input_name);
+CREATE INDEX IF NOT EXISTS idx_scores_code ON analysis_scores(group_code);
+"""
+
+# Horná hranica pri počítaní nájdených analýz (zobrazí sa ako "10000+")
+HISTORY_COUNT_LIMIT = 10000
+
+ANALYSIS_FIELDS = (
+    'created_at', 'catalog_version', 'releve_id', 'lokalita', 'suradnica', 'mapovatel', 'datum',
+    'pokryvnost_E3', 'pokryvnost_E2', 'pokryvnost_E1', 'pokryvnost_E0',
+    'rank_by', 'species_count', 'winner_code', 'winner_fqi', 'lat', 'lon', 'weighting', 'cover_scale',
+)
+
+# Stĺpce pridané neskôr (váženie pokryvnosťou): dopĺňajú sa len tu, pre nové aj staršie databázy
+HISTORY_MIGRATIONS = (
+    ('analyses', 'weighting', "TEXT NOT NULL DEFAULT 'presence'"),
+    ('analyses', 'cover_scale', "TEXT NOT NULL DEFAULT 'auto'"),
+    ('analysis_species', 'cover', "TEXT"),
+    ('analysis_species', 'layer', "TEXT"),
+)
+
+# Databázy, ktorých schéma (a migrácie) už v tomto procese prebehli: (cesta, inode) – nový súbor sa pripraví znova
+_HISTORY_DB_READY = set()
+_HISTORY_DB_READY_LOCK = threading.Lock()
+
+def connect_history_db(db_path=HISTORY_DB_FILENAME):
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    prepare_history_db(conn, db_path)
+    return conn
+
+def prepare_history_db(conn, db_path):
+    """Schéma a migrácie (stĺpce a R-strom súradníc) raz za proces, nie pri každom pripojení.
+
+    Režim WAL sa ukladá v súbore databázy, stačí ho preto nastaviť tu; ostatné pragmy platia pre pripojenie.
+    """
+    key = (os.path.abspath(db_path), os.stat(db_path).st_ino)
+    if key in _HISTORY_DB_READY:
+        return
+    with _HISTORY_DB_READY_LOCK:
+        if key not in _HISTORY_DB_READY:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(HISTORY_SCHEMA)
+            migrate_history_db(conn)
+            ensure_spatial_index(conn)
+            _HISTORY_DB_READY.add(key)
+
+def migrate_history_db(conn):
+    for table, column, definition in HISTORY_MIGRATIONS:
+        if column not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def format_record_date(value):
+    return value.strftime('%Y-%m-%d') if isinstance(value, date) else (value or '')
+
+def build_analysis_records(releves, snapshot, rank_by='fqi', top_k=3, weighting='presence', cover_scale='auto'):
+    """Pripraví záznamy na uloženie (metadáta, rozlíšenie druhov s pokryvnosťou, skóre) pre blok zápisov naraz.
+
+    Váženie a stupnica pokryvnosti sa ukladajú s analýzou, aby ju prepočet po zmene katalógu hodnotil rovnako.
+    """
+    entries_per_releve = [get_releve_cover_entries(releve) for releve in releves]
+    resolved = [resolve_cover_entries(entries, snapshot, cover_scale) for entries in entries_per_releve]
+    rows_per_releve = [rows for rows, _, _, _, _ in resolved]
+    metrics = apply_cover_weighting(
+        compute_similarity_metrics(rows_per_releve, snapshot), rows_per_releve,
+        [covers for _, covers, _, _, _ in resolved], snapshot, weighting
+    )
+    created_at = datetime.now().isoformat(timespec='seconds')
+
+    records = []
+    for i, releve in enumerate(releves):
+        rows, _, name_conversion_map, _, _ = resolved[i]
+        coords = parse_coordinates(releve.get('suradnica'))
+        columns = rank_top_groups(metrics['cumulative'][i], metrics[rank_by][i], top_k)
+
+        # Stav každého záznamu zvlášť: ignoruje sa až opakovanie druhu v tej istej vrstve
+        seen = set()
+        species = []
+        for user_species, cover, layer in entries_per_releve[i]:
+            user_species = biotope_offline.normalize_species_name(user_species)
+            if user_species in name_conversion_map:
+                key = (snapshot['name_index'][user_species], layer)
+                status = 'ignored' if key in seen else 'used'
+                seen.add(key)
+                species.append((user_species, name_conversion_map[user_species], status, cover or None, layer or None))
+            else:
+                species.append((user_species, None, 'unknown', cover or None, layer or None))
+        species.extend((name, None, 'unknown', None, None) for name in releve.get('unknown_species', []))
+
+        scores = [
+            (rank + 1, snapshot['group_codes'][col], float(metrics['fqi'][i][col]), float(metrics[rank_by][i][col]))
+            for rank, col in enumerate(columns)
+        ]
+        analysis = {field: releve.get(field, '') for field in ANALYSIS_FIELDS}
+        analysis.update({
+            'created_at': created_at,
+            'catalog_version': snapshot['version'],
+            'datum': format_record_date(releve.get('datum')),
+            'rank_by': rank_by,
+            'species_count': int(len(rows)),
+            'winner_code': scores[0][1] if scores else None,
+            'winner_fqi': scores[0][2] if scores else None,
+            'lat': coords[0] if coords else None,
+            'lon': coords[1] if coords else None,
+            'weighting': weighting,
+            'cover_scale': cover_scale,
+        })
+        records.append({'analysis': analysis, 'species': species, 'scores': scores})
+    return records
+
+def save_analyses(records, db_path=HISTORY_DB_FILENAME):
+    """Uloží záznamy hromadne (executemany) v jednej transakcii a vráti ich ID."""
+    if not records:
+        return []
+
+    conn = connect_history_db(db_path)
+    try:
+        with conn:
+            # BEGIN IMMEDIATE uzamkne zápis, ID sa tak dajú prideliť vopred pre všetky tabuľky
+            conn.execute("BEGIN IMMEDIATE")
+            first_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM analyses").fetchone()[0]
+            ids = list(range(first_id, first_id + len(records)))
+
+            conn.executemany(
+                f"INSERT INTO analyses (id, {', '.join(ANALYSIS_FIELDS)}) VALUES (?{', ?' * len(ANALYSIS_FIELDS)})",
+                ([analysis_id] + [record['analysis'][field] for field in ANALYSIS_FIELDS] for analysis_id, record in zip(ids, records))
+            )
+            conn.executemany(
+                "INSERT INTO analysis_species (analysis_id, input_name, canonical_name, status, cover, layer) VALUES (?, ?, ?, ?, ?, ?)",
+                ((analysis_id,) + entry for analysis_id, record in zip(ids, records) for entry in record['species'])
+            )
+            conn.executemany(
+                "INSERT INTO analysis_scores (analysis_id, rank, group_code, fqi, score) VALUES (?, ?, ?, ?, ?)",
+                ((analysis_id,) + entry for analysis_id, record in zip(ids, records) for entry in record['scores'])
+            )
+    finally:
+        conn.close()
+    return ids
+
+def save_releves_to_history(releves, snapshot, db_path=HISTORY_DB_FILENAME, rank_by='fqi', top_k=3, chunk_size=2000,
+                            weighting='presence'):
+    """Uloží prúd zápisov po blokoch – každý blok je jedna transakcia."""
+    saved = 0
+    for chunk in iter_chunks(releves, chunk_size):
+        saved += len(save_analyses(build_analysis_records(chunk, snapshot, rank_by, top_k, weighting), db_path))
+    return saved
+
+def query_analyses(db_path=HISTORY_DB_FILENAME, lokalita=None, mapovatel=None, winner_code=None,
+                   date_from=None, date_to=None, limit=200, offset=0):
+    """Vyhľadá uložené analýzy; každý filter využíva vlastný index. Vráti (celkový počet, riadky)."""
+    conditions = []
+    params = []
+    if lokalita:
+        conditions.append("lokalita LIKE ?")
+        params.append(lokalita.replace('%', '').replace('_', '') + '%')
+    if mapovatel:
+        conditions.append("mapovatel LIKE ?")
+        params.append(mapovatel.replace('%', '').replace('_', '') + '%')
+    if winner_code:
+        conditions.append("winner_code = ?")
+        params.append(winner_code)
+    if date_from:
+        conditions.append("datum >= ?")
+        params.append(format_record_date(date_from))
+    if date_to:
+        conditions.append("datum <= ?")
+        params.append(format_record_date(date_to))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    conn = connect_history_db(db_path)
+    try:
+        # Počítanie sa zastaví na HISTORY_COUNT_LIMIT, pri širokom filtri tak nečíta celú tabuľku
+        total = conn.execute(
+            f"SELECT COUNT(*) FROM (SELECT 1 FROM analyses {where} LIMIT ?)", params + [HISTORY_COUNT_LIMIT]
+        ).fetchone()[0]
+        # ID sa zoradia len z pokrývajúceho indexu, celé riadky sa načítajú až pre výslednú stranu
+        rows = conn.execute(
+            f"SELECT * FROM analyses WHERE id IN (SELECT id FROM analyses {where} ORDER BY id DESC LIMIT ? OFFSET ?) ORDER BY id DESC",
+            params + [limit, offset]
+        ).fetchall()
+    finally:
+        conn.close()
+    return total, [dict(row) for row in rows]
+
+def load_analysis_details(analysis_id, db_path=HISTORY_DB_FILENAME):
+    conn = connect_history_db(db_path)
+    try:
+        species = conn.execute(
+            "SELECT input_name, canonical_name, status, cover, layer FROM analysis_species WHERE analysis_id = ?", (analysis_id,)
+        ).fetchall()
+        scores = conn.execute(
+            "SELECT rank, group_code, fqi, score FROM analysis_scores WHERE analysis_id = ? ORDER BY rank", (analysis_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [dict(row) for row in species], [dict(row) for row in scores]
+
+# --- SPATIAL INDEX (R-TREE) ---
+
+# Súradnice analýz sú v stĺpcoch lat/lon a v R-strome; spúšťače ho udržiavajú pri každom zápise,
+# takže ukladanie ani prepočet histórie o indexe nemusia vedieť
+SPATIAL_RTREE = "CREATE VIRTUAL TABLE analyses_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)"
+SPATIAL_TRIGGERS = (
+    """CREATE TRIGGER analyses_rtree_insert AFTER INSERT ON analyses WHEN NEW.lat IS NOT NULL
+    BEGIN
+        INSERT INTO analyses_rtree VALUES (NEW.id, NEW.lat, NEW.lat, NEW.lon, NEW.lon);
+    END""",
+    """CREATE TRIGGER analyses_rtree_update AFTER UPDATE OF lat, lon ON analyses
+    BEGIN
+        DELETE FROM analyses_rtree WHERE id = OLD.id;
+        INSERT INTO analyses_rtree SELECT NEW.id, NEW.lat, NEW.lat, NEW.lon, NEW.lon WHERE NEW.lat IS NOT NULL;
+    END""",
+    """CREATE TRIGGER analyses_rtree_delete AFTER DELETE ON analyses
+    BEGIN
+        DELETE FROM analyses_rtree WHERE id = OLD.id;
+    END""",
+)
+
+EARTH_RADIUS_KM = 6371.0088
+NEARBY_DEFAULT_RADIUS_KM = 5.0
+NEARBY_MAX_RADIUS_KM = 100.0
+NEARBY_LIMIT = 50
+
+def ensure_spatial_index(conn):
+    """Doplní stĺpce lat/lon (zo suradnica) do staršej databázy a založí R-strom.
+
+    Ak SQLite nemá modul rtree, použije sa obyčajný index (lat, lon) – dotazy fungujú rovnako, len pomalšie.
+    """
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name IN ('analyses_rtree', 'idx_analyses_lat_lon')").fetchone():
+        return
+
+    with conn:
+        # BEGIN IMMEDIATE – súbežné pripojenia migrujú len raz
+        conn.execute("BEGIN IMMEDIATE")
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(analyses)")}
+        if 'lat' not in columns:
+            conn.execute("ALTER TABLE analyses ADD COLUMN lat REAL")
+            conn.execute("ALTER TABLE analyses ADD COLUMN lon REAL")
+            conn.executemany(
+                "UPDATE analyses SET lat = ?, lon = ? WHERE id = ?",
+                (coords + (analysis_id,) for analysis_id, coords in (
+                    (row['id'], parse_coordinates(row['suradnica']))
+                    for row in conn.execute("SELECT id, suradnica FROM analyses WHERE suradnica != ''").fetchall()
+                ) if coords)
+            )
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name IN ('analyses_rtree', 'idx_analyses_lat_lon')").fetchone():
+            return
+        try:
+            conn.execute(SPATIAL_RTREE)
+        except sqlite3.OperationalError:
+            conn.execute("CREATE INDEX idx_analyses_lat_lon ON analyses(lat, lon)")
+            return
+        for statement in SPATIAL_TRIGGERS:
+            conn.execute(statement)
+        conn.execute("INSERT INTO analyses_rtree SELECT id, lat, lat, lon, lon FROM analyses WHERE lat IS NOT NULL")
+
+def select_bbox(conn, columns, bounds, limit=-1):
+    """Riadky analýz v obdĺžniku [min_lat, max_lat, min_lon, max_lon], najnovšie prvé (limit -1 = všetky)."""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'analyses_rtree'").fetchone():
+        # R-strom drží súradnice vo float32 (zaokrúhlené smerom von), presný test je na stĺpcoch lat/lon
+        return conn.execute(
+            f"SELECT {columns} FROM analyses_rtree r JOIN analyses a ON a.id = r.id "
+            "WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ? "
+            "AND a.lat BETWEEN ? AND ? AND a.lon BETWEEN ? AND ? ORDER BY a.id DESC LIMIT ?",
+            bounds + bounds + [limit]
+        ).fetchall()
+    return conn.execute(
+        f"SELECT {columns} FROM analyses a WHERE a.lat BETWEEN ? AND ? AND a.lon BETWEEN ? AND ? ORDER BY a.id DESC LIMIT ?",
+        bounds + [limit]
+    ).fetchall()
+
+def query_analyses_in_bbox(min_lat, min_lon, max_lat, max_lon, db_path=HISTORY_DB_FILENAME, limit=HISTORY_COUNT_LIMIT):
+    """Analýzy so súradnicami v obdĺžniku (bez prechodu cez 180. poludník), najnovšie prvé."""
+    conn = connect_history_db(db_path)
+    try:
+        rows = select_bbox(conn, "a.*", [min_lat, max_lat, min_lon, max_lon], limit)
+    finally:
+        conn.close()
+    return [dict(row) for row in rows]
+
+def haversine_km(lat, lon, lats, lons):
+    lat, lon, lats, lons = map(np.radians, (lat, lon, np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64)))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def query_analyses_near(lat, lon, radius_km, db_path=HISTORY_DB_FILENAME, limit=NEARBY_LIMIT):
+    """Analýzy do vzdialenosti radius_km, najbližšie prvé.
+
+    R-strom vráti len ID a súradnice v obalovom obdĺžniku kruhu, presná vzdialenosť sa počíta vo numpy
+    a celé riadky sa načítajú až pre výsledných najviac limit analýz.
+    """
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = math.cos(math.radians(lat))
+    ratio = math.sin(radius_km / EARTH_RADIUS_KM) / cos_lat if cos_lat > 1e-9 else 1.0
+    # Pri kruhu cez pól obdĺžnik zahŕňa všetky dĺžky
+    delta_lon = math.degrees(math.asin(ratio)) if ratio < 1.0 else 180.0
+    bounds = [max(lat - delta_lat, -90.0), min(lat + delta_lat, 90.0), max(lon - delta_lon, -180.0), min(lon + delta_lon, 180.0)]
+
+    conn = connect_history_db(db_path)
+    try:
+        points = np.array(select_bbox(conn, "a.id, a.lat, a.lon", bounds), dtype=np.float64).reshape(-1, 3)
+        distances = haversine_km(lat, lon, points[:, 1], points[:, 2])
+        inside = np.flatnonzero(distances <= radius_km)
+        nearest = inside[np.argsort(distances[inside], kind='stable')[:limit]]
+        distance_by_id = {int(points[i, 0]): float(distances[i]) for i in nearest}
+        rows = conn.execute(
+            f"SELECT * FROM analyses WHERE id IN ({', '.join('?' * len(distance_by_id))})", list(distance_by_id)
+        ).fetchall() if distance_by_id else []
+    finally:
+        conn.close()
+    return sorted((dict(row, distance_km=distance_by_id[row['id']]) for row in rows), key=lambda item: item['distance_km'])
+
+# --- INCREMENTAL HISTORY REFRESH ---
+
+def diff_catalog_snapshots(old_snapshot, new_snapshot):
+    """Porovná dve verzie katalógu: zmenené rozlíšenie mien, zmenené riadky druhov a zmenené skupiny."""
+    old_groups = {group_id: col for col, group_id in enumerate(old_snapshot['group_ids'])}
+    new_groups = {group_id: col for col, group_id in enumerate(new_snapshot['group_ids'])}
+    common_groups = [group_id for group_id in new_snapshot['group_ids'] if group_id in old_groups]
+    old_cols = np.array([old_groups[group_id] for group_id in common_groups], dtype=np.intp)
+    new_cols = np.array([new_groups[group_id] for group_id in common_groups], dtype=np.intp)
+    removed_cols = np.array([col for group_id, col in old_groups.items() if group_id not in new_groups], dtype=np.intp)
+    added_cols = np.array([col for group_id, col in new_groups.items() if group_id not in old_groups], dtype=np.intp)
+
+    # Skupiny so zmeneným súčtom frekvencií, počtom druhov alebo normou menia skóre všetkých metrík
+    group_changed = (
+        (old_snapshot['group_totals'][old_cols] != new_snapshot['group_totals'][new_cols])
+        | (old_snapshot['group_species_counts'][old_cols] != new_snapshot['group_species_counts'][new_cols])
+        | ~np.isclose(old_snapshot['group_norms'][old_cols], new_snapshot['group_norms'][new_cols])
+    )
+    changed_group_codes = {old_snapshot['group_codes'][col] for col in old_cols[group_changed]}
+    changed_group_codes.update(new_snapshot['group_codes'][col] for col in new_cols[group_changed])
+    changed_group_codes.update(old_snapshot['group_codes'][col] for col in removed_cols)
+    changed_group_codes.update(new_snapshot['group_codes'][col] for col in added_cols)
+
+    # Riadky druhov porovnané naraz na spoločných skupinách; výskyt v pridanej/odobranej skupine je tiež zmena
+    old_index = old_snapshot['species_index']
+    common_species = [name for name in new_snapshot['species_names'] if name in old_index]
+    old_rows = np.array([old_index[name] for name in common_species], dtype=np.intp)
+    new_rows = np.array([new_snapshot['species_index'][name] for name in common_species], dtype=np.intp)
+    old_matrix = old_snapshot['frequency_matrix'][old_rows]
+    new_matrix = new_snapshot['frequency_matrix'][new_rows]
+    row_changed = (old_matrix[:, old_cols] != new_matrix[:, new_cols]).any(axis=1)
+    row_changed |= old_matrix[:, removed_cols].any(axis=1) | new_matrix[:, added_cols].any(axis=1)
+
+    changed_species = {common_species[i] for i in np.flatnonzero(row_changed)}
+    changed_species.update(set(old_index) ^ set(new_snapshot['species_index']))
+
+    # Druhy s výskytom v zmenenej skupine (v starej alebo novej verzii): zmenený súčet skupiny mení ich FQI
+    # v nej, takže skupina môže vstúpiť do top-k ktorejkoľvek analýzy s takým druhom (aj keď v nej ešte nebola)
+    old_group_cols = np.concatenate((old_cols[group_changed], removed_cols))
+    new_group_cols = np.concatenate((new_cols[group_changed], added_cols))
+    group_species = {
+        old_snapshot['species_names'][row]
+        for row in np.flatnonzero(old_snapshot['frequency_matrix'][:, old_group_cols].any(axis=1))
+    }
+    group_species.update(
+        new_snapshot['species_names'][row]
+        for row in np.flatnonzero(new_snapshot['frequency_matrix'][:, new_group_cols].any(axis=1))
+    )
+
+    # Mená (vrátane synoným), ktoré sa po novom priradia k inému druhu alebo prestali/začali byť známe
+    old_names, new_names = old_snapshot['species_names'], new_snapshot['species_names']
+    old_name_index, new_name_index = old_snapshot['name_index'], new_snapshot['name_index']
+    changed_names = set()
+    for name in old_name_index.keys() | new_name_index.keys():
+        old_row = old_name_index.get(name)
+        new_row = new_name_index.get(name)
+        old_canonical = old_names[old_row] if old_row is not None else None
+        new_canonical = new_names[new_row] if new_row is not None else None
+        if old_canonical != new_canonical:
+            changed_names.add(name)
+
+    return {
+        'changed_names': changed_names,
+        'changed_species': changed_species,
+        'changed_group_codes': changed_group_codes,
+        'changed_group_species': group_species,
+        'changed_group_columns': new_group_cols,
+    }
+
+def find_affected_analyses(conn, diff, catalog_version, snapshot, chunk_size=2000):
+    """ID analýz (uložených so starou verziou), ktoré obsahujú zmenený druh alebo meno, majú medzi uloženými
+    najlepšími skupinami zmenenú skupinu, alebo do ktorých top-k môže zmenená skupina po novom vstúpiť."""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS diff_names (name TEXT PRIMARY KEY) WITHOUT ROWID")
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS diff_species (name TEXT PRIMARY KEY) WITHOUT ROWID")
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS diff_codes (code TEXT PRIMARY KEY) WITHOUT ROWID")
+    with conn:
+        for table, values in (
+            ('diff_names', diff['changed_names']),
+            ('diff_species', diff['changed_species']),
+            ('diff_codes', diff['changed_group_codes']),
+        ):
+            conn.execute(f"DELETE FROM {table}")
+            conn.executemany(f"INSERT INTO {table} VALUES (?)", ((value,) for value in values))
+
+    # Tabuľky druhov a skóre slúžia ako invertovaný index meno/druh/skupina → analýzy
+    affected_ids = [row[0] for row in conn.execute(
+        """
+        SELECT id FROM analyses WHERE catalog_version = ? AND id IN (
+            SELECT analysis_id FROM analysis_species WHERE input_name IN (SELECT name FROM diff_names)
+            UNION SELECT analysis_id FROM analysis_species WHERE canonical_name IN (SELECT name FROM diff_species)
+            UNION SELECT analysis_id FROM analysis_scores WHERE group_code IN (SELECT code FROM diff_codes)
+        ) ORDER BY id
+        """,
+        (catalog_version,)
+    )]
+
+    # Ostatné analýzy s druhom zo zmenenej skupiny: ich riadky aj ostatné skupiny sa nezmenili, výsledok sa
+    # zmení len vtedy, ak zmenená skupina dosiahne uložené skóre k-tej skupiny
+    with conn:
+        conn.execute("DELETE FROM diff_species")
+        conn.executemany("INSERT INTO diff_species VALUES (?)", ((value,) for value in diff['changed_group_species']))
+    affected = set(affected_ids)
+    candidate_ids = [row[0] for row in conn.execute(
+        """
+        SELECT id FROM analyses WHERE catalog_version = ? AND id IN (
+            SELECT analysis_id FROM analysis_species WHERE canonical_name IN (SELECT name FROM diff_species)
+        ) ORDER BY id
+        """,
+        (catalog_version,)
+    ) if row[0] not in affected]
+    for start in range(0, len(candidate_ids), chunk_size):
+        affected_ids.extend(find_group_entries(conn, candidate_ids[start:start + chunk_size], diff, snapshot))
+    return sorted(affected_ids)
+
+def column_subset_snapshot(snapshot, columns):
+    """Skupinové polia a matice snapshotu zúžené na vybrané stĺpce (riadky druhov ostávajú)."""
+    n_groups = len(snapshot['group_ids'])
+    return {
+        'group_ids': [snapshot['group_ids'][col] for col in columns],
+        'group_totals': snapshot['group_totals'][columns],
+        'group_species_counts': snapshot['group_species_counts'][columns],
+        'group_norms': snapshot['group_norms'][columns],
+        'frequency_matrix': snapshot['frequency_matrix'][:, columns],
+        'metric_matrix': snapshot['metric_matrix'][:, np.concatenate([columns, n_groups + columns, [2 * n_groups]])],
+    }
+
+def find_group_entries(conn, analysis_ids, diff, snapshot):
+    """ID analýz, do ktorých top-k vstúpi niektorá zmenená skupina (skóre ≥ uložené skóre k-tej skupiny)."""
+    columns = diff['changed_group_columns']
+    if len(columns) == 0:
+        return []
+    placeholders = ', '.join('?' * len(analysis_ids))
+    settings = conn.execute(
+        f"""
+        SELECT a.id, a.rank_by, a.weighting, a.cover_scale,
+               (SELECT MIN(s.score) FROM analysis_scores s WHERE s.analysis_id = a.id) AS kth_score
+        FROM analyses a WHERE a.id IN ({placeholders})
+        """,
+        analysis_ids
+    ).fetchall()
+    releve_per_analysis = defaultdict(lambda: {'species': [], 'covers': []})
+    for analysis_id, input_name, cover, layer in conn.execute(
+        f"SELECT analysis_id, input_name, cover, layer FROM analysis_species WHERE analysis_id IN ({placeholders}) ORDER BY analysis_id, rowid",
+        analysis_ids
+    ):
+        releve_per_analysis[analysis_id]['species'].append(input_name)
+        releve_per_analysis[analysis_id]['covers'].append((cover or '', layer or ''))
+
+    # Skóre len zmenených skupín, zoskupené podľa váženia a stupnice ako pri prepočte
+    batches = defaultdict(list)
+    for analysis_id, rank_by, weighting, cover_scale, kth_score in settings:
+        key = (weighting if weighting in COVER_WEIGHTINGS else 'presence', cover_scale if cover_scale in COVER_SCALES else 'auto')
+        batches[key].append((analysis_id, rank_by if rank_by in SIMILARITY_METRICS else 'fqi', kth_score))
+
+    subset = column_subset_snapshot(snapshot, columns)
+    entered = []
+    for (weighting, cover_scale), items in batches.items():
+        resolved = [
+            resolve_cover_entries(get_releve_cover_entries(releve_per_analysis[analysis_id]), snapshot, cover_scale)[:2]
+            for analysis_id, _, _ in items
+        ]
+        rows_per_releve = [rows for rows, _ in resolved]
+        metrics = apply_cover_weighting(
+            compute_similarity_metrics(rows_per_releve, subset), rows_per_releve,
+            [covers for _, covers in resolved], subset, weighting
+        )
+        for i, (analysis_id, rank_by, kth_score) in enumerate(items):
+            # Bez uložených skupín vstúpi každá skupina so zhodou; rovnosť skóre sa pre istotu prepočíta
+            matches = metrics['cumulative'][i] > 0
+            if kth_score is not None:
+                matches &= metrics[rank_by][i] >= kth_score
+            if matches.any():
+                entered.append(analysis_id)
+    return entered
+
+def rescore_analyses(conn, analysis_ids, snapshot):
+    """Prepočíta vybrané analýzy novým katalógom; metadáta zápisu ostávajú, mení sa rozlíšenie druhov a skóre."""
+    placeholders = ', '.join('?' * len(analysis_ids))
+    settings = conn.execute(
+        f"""
+        SELECT a.id, a.rank_by, (SELECT COUNT(*) FROM analysis_scores s WHERE s.analysis_id = a.id) AS top_k,
+               a.weighting, a.cover_scale
+        FROM analyses a WHERE a.id IN ({placeholders})
+        """,
+        analysis_ids
+    ).fetchall()
+    releve_per_analysis = defaultdict(lambda: {'species': [], 'covers': []})
+    for analysis_id, input_name, cover, layer in conn.execute(
+        f"SELECT analysis_id, input_name, cover, layer FROM analysis_species WHERE analysis_id IN ({placeholders}) ORDER BY analysis_id, rowid",
+        analysis_ids
+    ):
+        releve_per_analysis[analysis_id]['species'].append(input_name)
+        releve_per_analysis[analysis_id]['covers'].append((cover or '', layer or ''))
+
+    # Zápisy s rovnakou metrikou, počtom skupín a vážením sa prepočítajú spolu jedným maticovým krokom
+    batches = defaultdict(list)
+    for analysis_id, rank_by, top_k, weighting, cover_scale in settings:
+        key = (
+            rank_by if rank_by in SIMILARITY_METRICS else 'fqi', top_k or 3,
+            weighting if weighting in COVER_WEIGHTINGS else 'presence', cover_scale if cover_scale in COVER_SCALES else 'auto',
+        )
+        batches[key].append(analysis_id)
+
+    updates, species_rows, score_rows = [], [], []
+    for (rank_by, top_k, weighting, cover_scale), ids in batches.items():
+        records = build_analysis_records(
+            [releve_per_analysis[analysis_id] for analysis_id in ids], snapshot, rank_by, top_k, weighting, cover_scale
+        )
+        for analysis_id, record in zip(ids, records):
+            analysis = record['analysis']
+            updates.append((analysis['catalog_version'], analysis['species_count'], analysis['winner_code'], analysis['winner_fqi'], analysis_id))
+            species_rows.extend((analysis_id,) + entry for entry in record['species'])
+            score_rows.extend((analysis_id,) + entry for entry in record['scores'])
+
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(f"DELETE FROM analysis_species WHERE analysis_id IN ({placeholders})", analysis_ids)
+        conn.execute(f"DELETE FROM analysis_scores WHERE analysis_id IN ({placeholders})", analysis_ids)
+        conn.executemany(
+            "INSERT INTO analysis_species (analysis_id, input_name, canonical_name, status, cover, layer) VALUES (?, ?, ?, ?, ?, ?)",
+            species_rows
+        )
+        conn.executemany("INSERT INTO analysis_scores (analysis_id, rank, group_code, fqi, score) VALUES (?, ?, ?, ?, ?)", score_rows)
+        conn.executemany(
+            "UPDATE analyses SET catalog_version = ?, species_count = ?, winner_code = ?, winner_fqi = ? WHERE id = ?",
+            updates
+        )
+
+def refresh_history_for_catalog(old_snapshot, new_snapshot, db_path=HISTORY_DB_FILENAME, chunk_size=2000):
+    """Zosúladí uloženú históriu s novou verziou katalógu bez prepočtu celého archívu.
+
+    Analýzy predchádzajúcej verzie sa prepočítajú len tam, kde zmena môže zmeniť výsledok, ostatným
+    sa iba prepíše verzia katalógu. Analýzy zo starších verzií (napr. uložené pred vypnutím servera)
+    sa nedajú porovnať so známym katalógom, preto sa prepočítajú celé.
+    """
+    if not os.path.exists(db_path):
+        return None
+
+    started = time.perf_counter()
+    diff = diff_catalog_snapshots(old_snapshot, new_snapshot)
+    conn = connect_history_db(db_path)
+    try:
+        # Horná hranica ID – neskôr uložené analýzy sa nepreznačia naslepo
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM analyses").fetchone()[0]
+        affected_ids = find_affected_analyses(conn, diff, old_snapshot['version'], new_snapshot, chunk_size)
+        stale_ids = [row[0] for row in conn.execute(
+            "SELECT id FROM analyses WHERE (catalog_version IS NULL OR catalog_version NOT IN (?, ?)) AND id <= ? ORDER BY id",
+            (old_snapshot['version'], new_snapshot['version'], max_id)
+        )]
+        rescore_ids = affected_ids + stale_ids
+        for start in range(0, len(rescore_ids), chunk_size):
+            rescore_analyses(conn, rescore_ids[start:start + chunk_size], new_snapshot)
+
+        with conn:
+            restamped = conn.execute(
+                "UPDATE analyses SET catalog_version = ? WHERE catalog_version = ? AND id <= ?",
+                (new_snapshot['version'], old_snapshot['version'], max_id)
+            ).rowcount
+    finally:
+        conn.close()
+
+    return {
+        'from_version': old_snapshot['version'],
+        'to_version': new_snapshot['version'],
+        'rescored': len(rescore_ids),
+        'reconciled': len(stale_ids),
+        'restamped': restamped,
+        'seconds': time.perf_counter() - started,
+    }
+
+# --- EXPORT FUNCTIONS (LOCALIZED) ---
+
+def generate_export_data(fqi_results_df, canonical_species_list, manual_data, lang='SK'):
+    """Generates text export based on current language."""
+    
+    E3, E2, E1, E0 = "\u2083", "\u2082", "\u2081", "\u2080"
+    
+    # Helper to get text for this specific function scope
+    def lt(key): 
+        return TRANSLATIONS.get(key, {}).get(lang, key)
+
+    # Convert DF to string
+    # We remove the URL column for text export to keep it clean, or keep it if desired. 
+    # For now, let's keep only basic columns.
+    export_df = fqi_results_df[[lt("col_rank"), lt("col_code"), lt("col_name"), lt("col_fqi")]]
+    fqi_table = export_df.reset_index(drop=True).to_csv(sep='\t', index=False)
+    
+    output = f"{lt('export_title')}\n"
+    output += f"{lt('export_based_on')}\n\n"
+
+    # 1. Header
+    output += f"{lt('export_sec1')}\n"
+    output += "--------------------------------------------------\n"
+    output += f"{lt('lbl_locality')}:              {manual_data['lokalita']}\n"
+    output += f"{lt('lbl_coords')}:             {manual_data['suradnica']}\n"
+    output += f"{lt('lbl_mapper')}:       {manual_data['mapovatel']}\n"
+    output += f"{lt('lbl_date')}:                 {manual_data['datum'].strftime('%Y-%m-%d') if isinstance(manual_data['datum'], date) else manual_data['datum']}\n"
+    output += f"{lt('export_covers_title')} (E{E3}, E{E2}, E{E1}, E{E0}):\n"
+    output += f"  E{E3}:                  {manual_data['pokryvnost_E3']}\n"
+    output += f"  E{E2}:                  {manual_data['pokryvnost_E2']}\n"
+    output += f"  E{E1}:                  {manual_data['pokryvnost_E1']}\n"
+    output += f"  E{E0}:                  {manual_data['pokryvnost_E0']}\n\n"
+    
+    # 2. Results
+    output += f"{lt('export_sec2')}\n"
+    output += "--------------------------------------------------\n"
+    output += fqi_table
+    output += "\n"
+
+    # 3. Canonical Species
+    output += f"{lt('export_sec3')}\n"
+    output += "--------------------------------------------------\n"
+    output += f"{lt('export_count_canon')}" + str(len(canonical_species_list)) + "\n"
+    output += "\n".join(sorted(canonical_species_list))
+    
+    remaining_unknown_species = manual_data.get('remaining_unknown_species')
+    manual_selections_for_analysis = manual_data.get('manual_selections_for_analysis', []) 
+    
+    if manual_selections_for_analysis:
+        output += f"\n\n{lt('export_sec4')}\n"
+        output += "--------------------------------------------------\n"
+        output += f"{lt('export_desc_manual')}\n"
+        output += "\n".join(manual_selections_for_analysis)
+
+    if remaining_unknown_species:
+        output += f"\n\n{lt('export_sec5')}\n"
+        output += "--------------------------------------------------\n"
+        output += f"{lt('export_desc_unknown')}\n"
+        output += "\n".join(remaining_unknown_species)
+    
+    output += f"\n\n{lt('export_end')}\n"
+    
+    return output
+
+def generate_excel_data(fqi_results_df, canonical_species_list, manual_data, lang='SK'):
+    """Generates Excel export based on current language."""
+    
+    def lt(key): 
+        return TRANSLATIONS.get(key, {}).get(lang, key)
+    
+    header_data = [
+        ("--- ZÁKLADNÉ ÚDAJE ---", ""),
+        (lt('lbl_locality'), manual_data['lokalita']),
+        (lt('lbl_coords'), manual_data['suradnica']),
+        (lt('lbl_mapper'), manual_data['mapovatel']),
+        (lt('lbl_date'), manual_data['datum'].strftime('%Y-%m-%d') if isinstance(manual_data['datum'], date) else manual_data['datum']),
+        ("--- POKRYVNOSŤ ETÁŽÍ ---", ""),
+        (lt('lbl_e3'), manual_data['pokryvnost_E3']),
+        (lt('lbl_e2'), manual_data['pokryvnost_E2']),
+        (lt('lbl_e1'), manual_data['pokryvnost_E1']),
+        (lt('lbl_e0'), manual_data['pokryvnost_E0']),
+    ]
+    df_header = pd.DataFrame(header_data, columns=[lt('col_desc'), lt('col_val')])
+    
+    df_species = pd.DataFrame(sorted(canonical_species_list), columns=[lt('col_canon_header')])
+    
+    remaining = manual_data.get('remaining_unknown_species', [])
+    manual_added = manual_data.get('manual_selections_for_analysis', [])
+    
+    df_status = pd.DataFrame({
+        lt('col_status'): 
+            [lt('status_manual')] * len(manual_added) + 
+            [lt('status_unclassified')] * len(remaining),
+        lt('col_species'): manual_added + remaining
+    })
+    
+    output = io.BytesIO()
+    
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        df_header.to_excel(writer, sheet_name=lt('sheet_field_data')[:30], index=False, startrow=0, startcol=0)
+        
+        # FQI Results - remove URL column for Excel export clean look, or keep it.
+        # Removing for clean data export.
+        df_fqi_excel = fqi_results_df[[lt("col_rank"), lt("col_code"), lt("col_name"), lt("col_fqi")]].copy()
+        df_fqi_excel.to_excel(writer, sheet_name=lt('sheet_fqi')[:30], index=False, startrow=0, startcol=0)
+
+        df_species.to_excel(writer, sheet_name=lt('sheet_canon')[:30], index=False, startrow=0, startcol=0)
+
+        if not df_status.empty:
+            df_status.to_excel(writer, sheet_name=lt('sheet_unknown')[:30], index=False, startrow=0, startcol=0)
+
+        for sheetname in writer.sheets:
+            worksheet = writer.sheets[sheetname]
+            worksheet.set_column('A:D', 30)
+            
     output.seek(0)
     return output.read()
 
+# --- BATCH REPORT EXPORT (ZIP) ---
+
+RE_UNSAFE_FILENAME_CHARS = re.compile(r'[^0-9A-Za-z._-]+')
+
+def build_localized_results(top_matches_data, lang='SK'):
+    """DataFrame výsledkov v tvare, aký očakávajú generate_export_data a generate_excel_data."""
+    def lt(key):
+        return TRANSLATIONS.get(key, {}).get(lang, key)
+
+    return pd.DataFrame(
+        [
+            {
+                lt("col_rank"): item['rank'],
+                lt("col_code"): item['code'],
+                lt("col_name"): item['name'],
+                lt("col_fqi"): item['fqi'],
+                lt("col_pdf"): item['pdf_url'],
+            }
+            for item in top_matches_data
+        ],
+        columns=[lt("col_rank"), lt("col_code"), lt("col_name"), lt("col_fqi"), lt("col_pdf")]
+    )
+
+def iter_releve_reports(releves, snapshot, lang='SK', rank_by='fqi', top_k=3, formats=('txt', 'xlsx'), chunk_size=256):
+    """Generátor (názov súboru, obsah) – protokoly sa vytvárajú po jednom, až keď ich ZIP potrebuje."""
+    file_base = "habitat_analysis" if lang == 'EN' else "biotop_analyza"
+
+    for chunk_start, chunk in enumerate(iter_chunks(releves, chunk_size)):
+        resolved = [resolve_species_rows(releve['species'], snapshot) for releve in chunk]
+        metrics = compute_similarity_metrics([rows for rows, _, _, _ in resolved], snapshot)
+
+        for i, releve in enumerate(chunk):
+            rows, name_conversion_map, ignored_inputs, unknown_inputs = resolved[i]
+            columns = rank_top_groups(metrics['cumulative'][i], metrics[rank_by][i], top_k)
+            df_results = build_localized_results(build_top_matches(columns, metrics['fqi'][i], snapshot), lang)
+            canonical_species = [snapshot['species_names'][row] for row in rows]
+
+            manual_data = {
+                'lokalita': releve.get('lokalita', ''),
+                'suradnica': releve.get('suradnica', ''),
+                'mapovatel': releve.get('mapovatel', ''),
+                'datum': releve.get('datum', ''),
+                'pokryvnost_E3': releve.get('pokryvnost_E3', ''),
+                'pokryvnost_E2': releve.get('pokryvnost_E2', ''),
+                'pokryvnost_E1': releve.get('pokryvnost_E1', ''),
+                'pokryvnost_E0': releve.get('pokryvnost_E0', ''),
+                'manual_selections_for_analysis': [],
+                'remaining_unknown_species': unknown_inputs,
+            }
+
+            index = chunk_start * chunk_size + i + 1
+            safe_id = RE_UNSAFE_FILENAME_CHARS.sub('_', str(releve['releve_id']))[:40] or "zapis"
+            name = f"{index:06d}_{file_base}_{safe_id}"
+
+            if 'txt' in formats:
+                yield f"{name}.txt", generate_export_data(df_results, canonical_species, manual_data, lang=lang).encode('utf-8')
+            if 'xlsx' in formats:
+                yield f"{name}.xlsx", generate_excel_data(df_results, canonical_species, manual_data, lang=lang)
+
+def write_reports_zip(reports, output, progress=None):
+    """Zapisuje protokoly do ZIP postupne; v pamäti je vždy len jeden protokol.
+
+    S progress (dict) sa po každom súbore aktualizuje progress['written'] a pri nastavenom
+    progress['cancel'] sa zápis ukončí.
+    """
+    count = 0
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, data in reports:
+            archive.writestr(name, data)
+            count += 1
+            if progress is not None:
+                progress['written'] = count
+                if progress['cancel'].is_set():
+                    break
+    return count
+
+def export_reports_zip(input_path, output_path, snapshot, lang='SK', rank_by='fqi', top_k=3, formats=('txt', 'xlsx'),
+                       progress=None):
+    """Protokoly pre všetky zápisy zo súboru do ZIP súboru na disku (vhodné aj pre pracovné vlákno)."""
+    with open(input_path, 'rb') as f:
+        encoding = detect_text_encoding(f.read(65536))
+
+    with open(input_path, 'rb') as raw:
+        source = io.TextIOWrapper(raw, encoding=encoding, newline='')
+        reports = iter_releve_reports(iter_batch_releves(source), snapshot, lang, rank_by, top_k, formats)
+        if progress is not None:
+            reports = track_read_progress(reports, raw, progress)
+        return write_reports_zip(reports, output_path, progress)
+
+def track_read_progress(items, raw, progress):
+    # Počet zápisov vopred nepoznáme – priebeh sa odhaduje podľa prečítaných bajtov vstupu
+    for item in items:
+        progress['bytes_read'] = raw.tell()
+        yield item
+
+def start_reports_zip_export(input_path, output_path, snapshot, lang='SK', rank_by='fqi', top_k=3):
+    """Spustí export protokolov v pracovnom vlákne; vráti stav (zapísané súbory, prečítané bajty, chyba, zrušenie)."""
+    export = {
+        'cancel': threading.Event(),
+        'written': 0,
+        'bytes_read': 0,
+        'total_bytes': os.path.getsize(input_path),
+        'output_path': output_path,
+        'error': None,
+        'finished': False,
+    }
+    get_export_executor().submit(_run_reports_zip_export, export, input_path, snapshot, lang, rank_by, top_k)
+    return export
+
+def _run_reports_zip_export(export, input_path, snapshot, lang, rank_by, top_k):
+    try:
+        export_reports_zip(input_path, export['output_path'], snapshot, lang, rank_by, top_k, progress=export)
+    except Exception as e:
+        # Akákoľvek chyba (vstup, zápis na disk, zipfile, tvorba XLSX) sa ukáže na stránke, neukončí ju
+        export['error'] = f"{type(e).__name__}: {e}"
+    finally:
+        remove_file_quietly(input_path)
+        export['finished'] = True
+
+@st.cache_resource
+def get_export_executor():
+    """Zdieľaný pool pracovných vlákien pre dlhé exporty (spoločný pre všetky relácie)."""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="report-export")
+
+# --- BACKGROUND BATCH JOBS ---
+
+BATCH_JOB_CHUNK_SIZE = 500      # zápisov v jednej úlohe pre pool
+BATCH_JOB_MAX_PENDING = 8       # najviac rozpracovaných blokov na jednu úlohu (zvyšok čaká na čítanie)
+BATCH_PREVIEW_ROWS = 1000       # koľko priebežných výsledkov sa zobrazí v tabuľke
+BATCH_POLL_INTERVAL = 1.0       # s, obnovenie priebehu na stránke
+
+@st.cache_resource
+def get_batch_executor():
+    """Ohraničený pool vlákien pre dávkové hodnotenie (spoločný pre všetky relácie)."""
+    return ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix="batch-score")
+
+def score_releve_chunk(chunk, snapshot, rank_by='fqi', top_k=3, weighting='presence', cover_scale='auto'):
+    """Riadky súhrnnej tabuľky a matica skóre (zápis × skupina, float16) pre blok zápisov (jeden maticový prechod)."""
+    if weighting == 'presence':
+        resolved = [resolve_species_rows(releve['species'], snapshot) for releve in chunk]
+        metrics = compute_similarity_metrics([rows for rows, _, _, _ in resolved], snapshot)
+    else:
+        resolved_covers = [resolve_cover_entries(get_releve_cover_entries(releve), snapshot, cover_scale) for releve in chunk]
+        resolved = [(rows, conversion, ignored, unknown) for rows, _, conversion, ignored, unknown in resolved_covers]
+        rows_per_releve = [item[0] for item in resolved_covers]
+        metrics = apply_cover_weighting(
+            compute_similarity_metrics(rows_per_releve, snapshot), rows_per_releve,
+            [item[1] for item in resolved_covers], snapshot, weighting
+        )
+
+    results = []
+    for i, releve in enumerate(chunk):
+        rows, _, _, unknown_inputs = resolved[i]
+        columns = rank_top_groups(metrics['cumulative'][i], metrics[rank_by][i], top_k)
+        results.append({
+            'releve_id': releve['releve_id'],
+            'lokalita': releve.get('lokalita', ''),
+            'datum': releve.get('datum', ''),
+            'species_count': int(len(rows)),
+            'unknown_count': len(unknown_inputs),
+            'winner_code': snapshot['group_codes'][columns[0]] if len(columns) else None,
+            'winner_score': float(metrics[rank_by][i][columns[0]]) if len(columns) else None,
+            'top_codes': [snapshot['group_codes'][col] for col in columns],
+        })
+    # Pre heatmapu stačí float16 (skóre v %, 0–100)
+    return results, metrics[rank_by].astype(np.float16)
+
+def start_batch_job(input_path, snapshot, rank_by='fqi', top_k=3, chunk_size=BATCH_JOB_CHUNK_SIZE, weighting='presence',
+                    cover_scale='auto'):
+    """Spustí dávkové hodnotenie na pozadí a vráti stav úlohy (priebeh, priebežné výsledky, zrušenie)."""
+    job = {
+        'cancel': threading.Event(),
+        'lock': threading.Lock(),
+        'total': None,
+        'read': 0,
+        'bytes_read': 0,
+        'total_bytes': os.path.getsize(input_path),
+        'done': 0,
+        'chunks': {},
+        'score_chunks': {},
+        'group_codes': snapshot['group_codes'],
+        'rank_by': rank_by,
+        'weighting': weighting,
+        'cover_scale': cover_scale,
+        'error': None,
+        'finished': False,
+        'started_at': time.perf_counter(),
+        'finished_at': None,
+    }
+    feeder = threading.Thread(
+        target=_run_batch_job,
+        args=(job, get_batch_executor(), input_path, snapshot, rank_by, top_k, chunk_size),
+        name="batch-feeder",
+        daemon=True
+    )
+    feeder.start()
+    return job
+
+def _score_job_chunk(job, index, chunk, snapshot, rank_by, top_k):
+    if job['cancel'].is_set():
+        return
+    try:
+        results, scores = score_releve_chunk(
+            chunk, snapshot, rank_by, top_k, weighting=job['weighting'], cover_scale=job['cover_scale']
+        )
+    except Exception as e:
+        job['error'] = str(e)
+        job['cancel'].set()
+        return
+    with job['lock']:
+        job['chunks'][index] = results
+        job['score_chunks'][index] = scores
+        job['done'] += len(chunk)
+
+def _run_batch_job(job, executor, input_path, snapshot, rank_by, top_k, chunk_size):
+    # Čítanie súboru beží vo vlastnom vlákne; bloky sa posielajú do poolu len po uvoľnení miesta
+    pending = threading.Semaphore(BATCH_JOB_MAX_PENDING)
+    futures = []
+    try:
+        with open(input_path, 'rb') as f:
+            encoding = detect_text_encoding(f.read(65536))
+        # Súbor sa číta len raz – zápisy sa počítajú pri posielaní blokov, celkový počet je známy až na konci
+        with open(input_path, 'rb') as raw:
+            source = io.TextIOWrapper(raw, encoding=encoding, newline='')
+            releves = track_read_progress(iter_batch_releves(source), raw, job)
+            for index, chunk in enumerate(iter_chunks(releves, chunk_size)):
+                job['read'] += len(chunk)
+                pending.acquire()
+                if job['cancel'].is_set():
+                    pending.release()
+                    break
+                future = executor.submit(_score_job_chunk, job, index, chunk, snapshot, rank_by, top_k)
+                future.add_done_callback(lambda _: pending.release())
+                futures.append(future)
+            else:
+                job['total'] = job['read']
+        wait(futures)
+    except (ValueError, UnicodeDecodeError, OSError) as e:
+        job['error'] = str(e)
+    finally:
+        remove_file_quietly(input_path)
+        job['finished_at'] = time.perf_counter()
+        job['finished'] = True
+
+def get_batch_job_status(job):
+    if not job['finished']:
+        return 'running'
+    if job['error']:
+        return 'failed'
+    if job['cancel'].is_set():
+        return 'cancelled'
+    return 'done'
+
+def get_batch_job_results(job, limit=None):
+    """Doteraz hotové výsledky v poradí zápisov zo súboru (bloky môžu dobiehať mimo poradia)."""
+    with job['lock']:
+        indexes = sorted(job['chunks'])
+        chunks = [job['chunks'][index] for index in indexes]
+    results = []
+    for chunk in chunks:
+        results.extend(chunk)
+        if limit is not None and len(results) >= limit:
+            return results[:limit]
+    return results
+
+# --- BATCH HEATMAP (LEVELS OF DETAIL) ---
+
+HEATMAP_MAX_ROWS = 120          # najviac riadkov heatmapy poslaných klientovi v jednom pohľade
+HEATMAP_VIEW_SIZES = (60, 120, 250, 500, 1000, 5000, 20000, 100000)
+
+def get_batch_job_scores(job):
+    """Matica skóre hotových zápisov (v poradí zo súboru) a ich ID."""
+    with job['lock']:
+        indexes = sorted(job['score_chunks'])
+        score_chunks = [job['score_chunks'][index] for index in indexes]
+        releve_ids = [item['releve_id'] for index in indexes for item in job['chunks'][index]]
+    if not score_chunks:
+        return np.zeros((0, len(job['group_codes'])), dtype=np.float16), releve_ids
+    return np.vstack(score_chunks), releve_ids
+
+def build_heatmap_pyramid(scores, releve_ids, group_codes, max_rows=HEATMAP_MAX_ROWS):
+    """Zoradí zápisy podľa zhlukov a pripraví úrovne detailu (priemery blokov 2^k riadkov).
+
+    Stĺpce idú v poradí kódov (LES01.1, LES01.2, …, teda podľa hierarchie), zápisy podľa
+    najlepšej skupiny a v rámci nej podľa klesajúceho skóre – zhluky tvoria súvislé pásy.
+    """
+    column_order = np.argsort(np.array(group_codes, dtype=object), kind='stable')
+    column_position = np.empty_like(column_order)
+    column_position[column_order] = np.arange(len(column_order))
+
+    if len(scores):
+        dominant = scores.argmax(axis=1)
+        strength = scores.max(axis=1).astype(np.float32)
+        row_order = np.lexsort((-strength, column_position[dominant]))
+    else:
+        row_order = np.zeros(0, dtype=np.intp)
+    base = scores[row_order][:, column_order].astype(np.float32)
+
+    levels = [base.astype(np.float16)]
+    step = 1
+    while base.shape[0] > max_rows * step:
+        step *= 2
+        starts = np.arange(0, base.shape[0], step)
+        counts = np.diff(np.append(starts, base.shape[0]))[:, None]
+        levels.append((np.add.reduceat(base, starts, axis=0) / counts).astype(np.float16))
+
+    return {
+        'row_order': row_order,
+        'column_order': column_order,
+        'releve_ids': [releve_ids[row] for row in row_order],
+        'group_codes': [group_codes[col] for col in column_order],
+        'levels': levels,
+    }
+
+def get_heatmap_window(pyramid, row_start, row_count, column_mask=None, max_rows=HEATMAP_MAX_ROWS):
+    """Vyberie najjemnejšiu úroveň, pri ktorej sa viditeľný blok zmestí do max_rows, a vráti dlhú tabuľku buniek."""
+    levels = pyramid['levels']
+    level = 0
+    while level < len(levels) - 1 and math.ceil(row_count / 2 ** level) > max_rows:
+        level += 1
+    step = 2 ** level
+
+    first = row_start // step
+    last = math.ceil(min(row_start + row_count, len(pyramid['releve_ids'])) / step)
+    block = levels[level][first:last]
+    codes = pyramid['group_codes']
+    if column_mask is not None:
+        block = block[:, column_mask]
+        codes = [code for code, keep in zip(codes, column_mask) if keep]
+
+    releve_ids = pyramid['releve_ids']
+    labels = []
+    for block_row in range(first, last):
+        start = block_row * step
+        end = min(start + step, len(releve_ids))
+        labels.append(releve_ids[start] if end - start == 1 else f"{releve_ids[start]} … (+{end - start - 1})")
+
+    cells = pd.DataFrame({
+        'row': np.repeat(np.arange(len(labels)), len(codes)),
+        'releve': np.repeat(np.array(labels, dtype=object), len(codes)),
+        'code': np.tile(np.array(codes, dtype=object), len(labels)),
+        'score': block.astype(np.float32).ravel(),
+    })
+    return cells, step
+
+# --- DURABLE JOB QUEUE (SQLITE) ---
+
+# Fronta veľkých dávkových úloh: vstupy, nastavenia aj hotové bloky sú v SQLite, takže úloha
+# prežije zatvorenie prehliadača aj reštart servera a pokračuje od posledného uloženého bloku.
+JOB_QUEUE_DB_FILENAME = "biotope_jobs.sqlite3"
+JOB_QUEUE_WORKERS = min(4, os.cpu_count() or 1)
+JOB_QUEUE_IDLE_INTERVAL = 2.0   # s, ako často sa hľadá nová úloha, keď je fronta prázdna
+JOB_LEASE_SECONDS = 60          # po tejto dobe bez obnovy môže úlohu prevziať iný proces (napr. po reštarte)
+JOB_QUEUE_LIST_LIMIT = 20
+JOB_ACTIVE_STATUSES = ('queued', 'running')
+
+JOB_QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    finished_at TEXT,
+    status TEXT NOT NULL,
+    catalog_version TEXT,
+    rank_by TEXT NOT NULL,
+    top_k INTEGER NOT NULL,
+    input_name TEXT,
+    total_releves INTEGER NOT NULL,
+    total_chunks INTEGER NOT NULL,
+    lease_owner TEXT,
+    lease_until REAL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS job_chunks (
+    job_id TEXT NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    chunk_index INTEGER NOT NULL,
+    releve_count INTEGER NOT NULL,
+    input BLOB NOT NULL,
+    results BLOB,
+    PRIMARY KEY (job_id, chunk_index)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at);
+"""
+
+# Stĺpce pridané neskôr (váženie a stupnica pokryvnosti): dopĺňajú sa len tu, pre nové aj staršie databázy
+JOB_QUEUE_MIGRATIONS = (
+    ('jobs', 'weighting', "TEXT NOT NULL DEFAULT 'presence'"),
+    ('jobs', 'cover_scale', "TEXT NOT NULL DEFAULT 'auto'"),
+)
+
+# Ako pri histórii: schéma a migrácie fronty raz za proces pre každý súbor (cesta, inode)
+_JOB_QUEUE_DB_READY = set()
+_JOB_QUEUE_DB_READY_LOCK = threading.Lock()
+
+def connect_job_queue_db(db_path=JOB_QUEUE_DB_FILENAME):
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    prepare_job_queue_db(conn, db_path)
+    return conn
+
+def prepare_job_queue_db(conn, db_path):
+    key = (os.path.abspath(db_path), os.stat(db_path).st_ino)
+    if key in _JOB_QUEUE_DB_READY:
+        return
+    with _JOB_QUEUE_DB_READY_LOCK:
+        if key not in _JOB_QUEUE_DB_READY:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(JOB_QUEUE_SCHEMA)
+            for table, column, definition in JOB_QUEUE_MIGRATIONS:
+                if column not in {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            _JOB_QUEUE_DB_READY.add(key)
+
+def pack_records(records):
+    return zlib.compress(json.dumps(records, ensure_ascii=False).encode('utf-8'))
+
+def unpack_records(blob):
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+def submit_queue_job(releves, snapshot, rank_by='fqi', top_k=3, input_name='', db_path=JOB_QUEUE_DB_FILENAME,
+                     chunk_size=BATCH_JOB_CHUNK_SIZE, weighting='presence', cover_scale='auto'):
+    """Uloží zápisy (po blokoch) a nastavenia novej úlohy do fronty a vráti jej ID."""
+    job_id = uuid.uuid4().hex[:12]
+    conn = connect_job_queue_db(db_path)
+    try:
+        with conn:
+            # Úloha je viditeľná pre spracovanie až po uložení všetkých blokov (jedna transakcia)
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO jobs (id, created_at, status, catalog_version, rank_by, top_k, weighting, cover_scale, input_name, "
+                "total_releves, total_chunks) VALUES (?, ?, 'queued', ?, ?, ?, ?, ?, ?, 0, 0)",
+                (
+                    job_id, datetime.now().isoformat(timespec='seconds'), snapshot['version'], rank_by, int(top_k),
+                    weighting, cover_scale, input_name
+                )
+            )
+            total_releves = 0
+            total_chunks = 0
+            for index, chunk in enumerate(iter_chunks(releves, chunk_size)):
+                conn.execute(
+                    "INSERT INTO job_chunks (job_id, chunk_index, releve_count, input) VALUES (?, ?, ?, ?)",
+                    (job_id, index, len(chunk), pack_records(chunk))
+                )
+                total_releves += len(chunk)
+                total_chunks += 1
+            conn.execute("UPDATE jobs SET total_releves = ?, total_chunks = ? WHERE id = ?", (total_releves, total_chunks, job_id))
+    finally:
+        conn.close()
+    return job_id
+
+QUEUE_JOB_PROGRESS_SQL = """
+SELECT j.*, COUNT(c.chunk_index) AS done_chunks, COALESCE(SUM(c.releve_count), 0) AS done_releves
+FROM jobs j LEFT JOIN job_chunks c ON c.job_id = j.id AND c.results IS NOT NULL
+"""
+
+def list_queue_jobs(db_path=JOB_QUEUE_DB_FILENAME, limit=JOB_QUEUE_LIST_LIMIT):
+    """Posledné úlohy fronty s priebehom (počet hotových blokov a zápisov)."""
+    if not os.path.exists(db_path):
+        return []
+    conn = connect_job_queue_db(db_path)
+    try:
+        rows = conn.execute(QUEUE_JOB_PROGRESS_SQL + " GROUP BY j.id ORDER BY j.created_at DESC LIMIT ?", (limit,)).fetchall()
+    finally:
+        conn.close()
+    return [dict(row) for row in rows]
+
+def has_active_queue_jobs(db_path=JOB_QUEUE_DB_FILENAME):
+    """Čaká alebo beží vo fronte nejaká úloha? (jeden dotaz cez idx_jobs_status)"""
+    if not os.path.exists(db_path):
+        return False
+    conn = connect_job_queue_db(db_path)
+    try:
+        placeholders = ", ".join("?" for _ in JOB_ACTIVE_STATUSES)
+        row = conn.execute(f"SELECT 1 FROM jobs WHERE status IN ({placeholders}) LIMIT 1", JOB_ACTIVE_STATUSES).fetchone()
+    finally:
+        conn.close()
+    return row is not None
+
+def iter_queue_job_results(job_id, db_path=JOB_QUEUE_DB_FILENAME, limit=None):
+    """Hotové výsledky úlohy v poradí zápisov (po blokoch, bez načítania celej úlohy naraz)."""
+    conn = connect_job_queue_db(db_path)
+    try:
+        count = 0
+        cursor = conn.execute(
+            "SELECT results FROM job_chunks WHERE job_id = ? AND results IS NOT NULL ORDER BY chunk_index", (job_id,)
+        )
+        for row in cursor:
+            for item in unpack_records(row['results']):
+                if limit is not None and count >= limit:
+                    return
+                yield item
+                count += 1
+    finally:
+        conn.close()
+
+def cancel_queue_job(job_id, db_path=JOB_QUEUE_DB_FILENAME):
+    conn = connect_job_queue_db(db_path)
+    try:
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ?, lease_owner = NULL WHERE id = ? AND status IN ('queued', 'running')",
+                (datetime.now().isoformat(timespec='seconds'), job_id)
+            )
+    finally:
+        conn.close()
+
+def delete_queue_job(job_id, db_path=JOB_QUEUE_DB_FILENAME):
+    conn = connect_job_queue_db(db_path)
+    try:
+        with conn:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+    finally:
+        conn.close()
+
+def claim_queue_job(db_path, owner):
+    """Prevezme najstaršiu čakajúcu úlohu alebo rozpracovanú úlohu s vypršaným prenájmom."""
+    conn = connect_job_queue_db(db_path)
+    try:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status IN ('queued', 'running') "
+                "AND (lease_owner IS NULL OR lease_owner = ? OR lease_until < ?) ORDER BY created_at LIMIT 1",
+                (owner, time.time())
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', lease_owner = ?, lease_until = ? WHERE id = ?",
+                (owner, time.time() + JOB_LEASE_SECONDS, row['id'])
+            )
+    finally:
+        conn.close()
+    return dict(row)
+
+# Stav procesu v poole: katalóg sa načíta raz a používa pre všetky bloky (a úlohy), kým sa súbor nezmení
+_QUEUE_WORKER_STATE = {'snapshot': None, 'connections': {}}
+
+def _init_queue_worker():
+    _QUEUE_WORKER_STATE['snapshot'] = load_catalog_snapshot_from_files(get_catalog_fingerprint())
+
+def _score_queue_chunk(db_path, job_id, chunk_index, catalog_version, rank_by, top_k, weighting='presence', cover_scale='auto'):
+    """Ohodnotí jeden blok úlohy v procese poolu a uloží výsledok (checkpoint); None = iná verzia katalógu."""
+    fingerprint = get_catalog_fingerprint()
+    snapshot = _QUEUE_WORKER_STATE['snapshot']
+    if snapshot is None or snapshot['fingerprint'] != fingerprint:
+        snapshot = _QUEUE_WORKER_STATE['snapshot'] = load_catalog_snapshot_from_files(fingerprint)
+    if snapshot is None or snapshot['version'] != catalog_version:
+        return None
+
+    conn = _QUEUE_WORKER_STATE['connections'].get(db_path)
+    if conn is None:
+        conn = _QUEUE_WORKER_STATE['connections'][db_path] = connect_job_queue_db(db_path)
+    row = conn.execute(
+        "SELECT input, results IS NOT NULL AS done FROM job_chunks WHERE job_id = ? AND chunk_index = ?", (job_id, chunk_index)
+    ).fetchone()
+    if row is None or row['done']:
+        return 0
+
+    results, _ = score_releve_chunk(
+        unpack_records(row['input']), snapshot, rank_by, top_k, weighting=weighting, cover_scale=cover_scale
+    )
+    with conn:
+        conn.execute(
+            "UPDATE job_chunks SET results = ? WHERE job_id = ? AND chunk_index = ? AND results IS NULL",
+            (pack_records(results), job_id, chunk_index)
+        )
+    return len(results)
+
+def get_queue_worker_module():
+    # Streamlit spúšťa skript ako __main__ – procesy poolu potrebujú funkcie z importovateľného modulu
+    return importlib.import_module(os.path.splitext(os.path.basename(__file__))[0])
+
+def create_job_queue(db_path=JOB_QUEUE_DB_FILENAME, workers=JOB_QUEUE_WORKERS):
+    return {
+        'db_path': db_path,
+        'owner': uuid.uuid4().hex,
+        'workers': workers,
+        'executor': None,
+        'wake': threading.Event(),
+        'thread': None,
+        'current_job': None,
+        'last_error': None,
+    }
+
+@st.cache_resource
+def get_job_queue():
+    """Zdieľaná fronta (jeden dispečer na proces servera); pri štarte prevezme nedokončené úlohy."""
+    queue = create_job_queue()
+    queue['thread'] = threading.Thread(target=run_job_queue, args=(queue,), name="job-queue", daemon=True)
+    queue['thread'].start()
+    return queue
+
+def get_job_queue_executor(queue):
+    if queue['executor'] is None:
+        # spawn – nové procesy bez kópie vlákien servera; každý si katalóg načíta raz v inicializácii
+        worker_module = get_queue_worker_module()
+        queue['executor'] = ProcessPoolExecutor(
+            max_workers=queue['workers'],
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=worker_module._init_queue_worker
+        )
+    return queue['executor']
+
+def run_job_queue(queue):
+    """Slučka dispečera: berie úlohy z fronty jednu po druhej, bloky rozdeľuje do poolu procesov."""
+    while True:
+        try:
+            job = claim_queue_job(queue['db_path'], queue['owner'])
+            if job is None:
+                queue['wake'].wait(JOB_QUEUE_IDLE_INTERVAL)
+                queue['wake'].clear()
+                continue
+            queue['current_job'] = job['id']
+            if not _run_queue_job(queue, job):
+                # Katalóg sa práve mení – úloha sa vráti do fronty a prevezme sa s novou verziou
+                time.sleep(JOB_QUEUE_IDLE_INTERVAL)
+        except Exception as e:
+            queue['last_error'] = str(e)
+            queue['executor'] = None
+            time.sleep(JOB_QUEUE_IDLE_INTERVAL)
+        finally:
+            queue['current_job'] = None
+
+def _run_queue_job(queue, job):
+    db_path = queue['db_path']
+    snapshot = get_catalog_store()['snapshot'] or load_catalog_snapshot_from_files(get_catalog_fingerprint())
+    conn = connect_job_queue_db(db_path)
+    try:
+        if snapshot is not None and snapshot['version'] != job['catalog_version']:
+            # Katalóg sa zmenil od spustenia – hotové bloky by mali inú verziu, úloha sa prepočíta celá
+            with conn:
+                conn.execute("UPDATE job_chunks SET results = NULL WHERE job_id = ?", (job['id'],))
+                conn.execute("UPDATE jobs SET catalog_version = ? WHERE id = ?", (snapshot['version'], job['id']))
+            job['catalog_version'] = snapshot['version']
+
+        pending_chunks = [row[0] for row in conn.execute(
+            "SELECT chunk_index FROM job_chunks WHERE job_id = ? AND results IS NULL ORDER BY chunk_index", (job['id'],)
+        )]
+        executor = get_job_queue_executor(queue)
+        worker_module = get_queue_worker_module()
+
+        futures = set()
+        catalog_changed = False
+        while pending_chunks or futures:
+            status = conn.execute("SELECT status FROM jobs WHERE id = ?", (job['id'],)).fetchone()
+            if status is None or status[0] != 'running':
+                # Zrušená alebo zmazaná úloha – rozpracované bloky sa dokončia, nové sa neposielajú
+                pending_chunks = []
+            while pending_chunks and len(futures) < BATCH_JOB_MAX_PENDING and not catalog_changed:
+                futures.add(executor.submit(
+                    worker_module._score_queue_chunk, db_path, job['id'], pending_chunks.pop(0),
+                    job['catalog_version'], job['rank_by'], job['top_k'], job['weighting'], job['cover_scale']
+                ))
+            if not futures:
+                break
+
+            done, futures = wait(futures, timeout=JOB_LEASE_SECONDS / 4, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    if future.result() is None:
+                        catalog_changed = True
+                except Exception as e:
+                    with conn:
+                        conn.execute(
+                            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, lease_owner = NULL "
+                            "WHERE id = ? AND status = 'running'",
+                            (str(e), datetime.now().isoformat(timespec='seconds'), job['id'])
+                        )
+                    pending_chunks = []
+            if catalog_changed:
+                pending_chunks = []
+            with conn:
+                conn.execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND lease_owner = ?",
+                             (time.time() + JOB_LEASE_SECONDS, job['id'], queue['owner']))
+
+        with conn:
+            if catalog_changed:
+                conn.execute("UPDATE jobs SET lease_owner = NULL WHERE id = ? AND status = 'running'", (job['id'],))
+                return False
+            remaining = conn.execute(
+                "SELECT COUNT(*) FROM job_chunks WHERE job_id = ? AND results IS NULL", (job['id'],)
+            ).fetchone()[0]
+            if remaining == 0:
+                conn.execute(
+                    "UPDATE jobs SET status = 'done', finished_at = ?, lease_owner = NULL WHERE id = ? AND status = 'running'",
+                    (datetime.now().isoformat(timespec='seconds'), job['id'])
+                )
+    finally:
+        conn.close()
+    return True
+
+# --- COLUMNAR EXPORT (PARQUET / ARROW) ---
+
+COLUMNAR_FORMATS = ('parquet', 'arrow')
+
+def get_columnar_schemas(snapshot, rank_by):
+    metadata = {'catalog_version': snapshot['version'], 'rank_by': rank_by}
+    group_type = pa.dictionary(pa.int32(), pa.string())
+    results_schema = pa.schema(
+        [
+            ('releve_id', pa.string()),
+            ('rank', pa.int16()),
+            ('group_id', group_type),
+            ('group_code', group_type),
+        ] + [(metric, pa.float64()) for metric in SIMILARITY_METRICS],
+        metadata=metadata
+    )
+    species_schema = pa.schema(
+        [
+            ('releve_id', pa.string()),
+            ('input_name', pa.string()),
+            ('canonical_name', pa.string()),
+            ('status', pa.dictionary(pa.int8(), pa.string())),
+        ],
+        metadata=metadata
+    )
+    return results_schema, species_schema
+
+def iter_columnar_batches(releves, snapshot, rank_by='fqi', top_k=3, chunk_size=4096):
+    """Pre každý blok zápisov vráti (RecordBatch výsledkov, RecordBatch rozlíšenia druhov, počet zápisov).
+
+    Stĺpce sa skladajú priamo z numpy polí metrík – FQI zostáva číslom, nie textom "12.34 %".
+    """
+    results_schema, species_schema = get_columnar_schemas(snapshot, rank_by)
+    group_ids = pa.array(snapshot['group_ids'], type=pa.string())
+    group_codes = pa.array(snapshot['group_codes'], type=pa.string())
+    statuses = ['used', 'ignored', 'unknown']
+    status_dictionary = pa.array(statuses, type=pa.string())
+    status_index = {status: i for i, status in enumerate(statuses)}
+
+    for chunk in iter_chunks(releves, chunk_size):
+        resolved = [resolve_species_rows(releve['species'], snapshot) for releve in chunk]
+        metrics = compute_similarity_metrics([rows for rows, _, _, _ in resolved], snapshot)
+
+        # Top-k pre celý blok naraz; skupiny bez zhody sa vynechajú
+        scores = np.where(metrics['cumulative'] > 0, metrics[rank_by], -np.inf)
+        top_columns = np.argsort(-scores, axis=1, kind='stable')[:, :top_k]
+        valid = np.isfinite(np.take_along_axis(scores, top_columns, axis=1))
+        releve_positions, rank_positions = np.nonzero(valid)
+        columns = top_columns[releve_positions, rank_positions]
+
+        releve_ids = np.array([releve['releve_id'] for releve in chunk], dtype=object)
+        results_batch = pa.RecordBatch.from_arrays(
+            [
+                pa.array(releve_ids[releve_positions], type=pa.string()),
+                pa.array((rank_positions + 1).astype(np.int16)),
+                pa.DictionaryArray.from_arrays(pa.array(columns.astype(np.int32)), group_ids),
+                pa.DictionaryArray.from_arrays(pa.array(columns.astype(np.int32)), group_codes),
+            ] + [pa.array(metrics[metric][releve_positions, columns]) for metric in SIMILARITY_METRICS],
+            schema=results_schema
+        )
+
+        species_ids, input_names, canonical_names, status_codes = [], [], [], []
+        for releve, (rows, name_conversion_map, ignored_inputs, unknown_inputs) in zip(chunk, resolved):
+            ignored = set(ignored_inputs)
+            for user_species in releve['species']:
+                user_species = biotope_offline.normalize_species_name(user_species)
+                canonical_name = name_conversion_map.get(user_species)
+                if canonical_name is None:
+                    status = 'unknown'
+                else:
+                    status = 'ignored' if user_species in ignored else 'used'
+                species_ids.append(releve['releve_id'])
+                input_names.append(user_species)
+                canonical_names.append(canonical_name)
+                status_codes.append(status_index[status])
+
+        species_batch = pa.RecordBatch.from_arrays(
+            [
+                pa.array(species_ids, type=pa.string()),
+                pa.array(input_names, type=pa.string()),
+                pa.array(canonical_names, type=pa.string()),
+                pa.DictionaryArray.from_arrays(pa.array(status_codes, type=pa.int8()), status_dictionary),
+            ],
+            schema=species_schema
+        )
+        yield results_batch, species_batch, len(chunk)
+
+def open_columnar_writer(path, schema, fmt):
+    if fmt == 'parquet':
+        return pq.ParquetWriter(path, schema, compression='zstd')
+    return pa.ipc.new_file(path, schema)
+
+def write_columnar_export(releves, results_path, species_path, snapshot, fmt='parquet', rank_by='fqi', top_k=3, chunk_size=4096):
+    """Zapíše výsledky a rozlíšenie druhov po blokoch (Parquet alebo Arrow IPC). Vráti počet zápisov."""
+    if pa is None:
+        raise RuntimeError("pyarrow is required for Parquet/Arrow export")
+    if fmt not in COLUMNAR_FORMATS:
+        raise ValueError(f"Unknown columnar format: {fmt}")
+
+    results_schema, species_schema = get_columnar_schemas(snapshot, rank_by)
+    results_writer = open_columnar_writer(results_path, results_schema, fmt)
+    species_writer = open_columnar_writer(species_path, species_schema, fmt)
+
+    releve_count = 0
+    try:
+        for results_batch, species_batch, chunk_count in iter_columnar_batches(releves, snapshot, rank_by, top_k, chunk_size):
+            results_writer.write_batch(results_batch)
+            species_writer.write_batch(species_batch)
+            releve_count += chunk_count
+    finally:
+        results_writer.close()
+        species_writer.close()
+    return releve_count
+
+# --- OFFLINE BUNDLE (FIELD DEVICES) ---
+
+def export_offline_bundle(snapshot, path):
+    """Zapíše katalóg do kompaktného balíka pre biotope_offline (bez servera a textového katalógu)."""
+    name_index = snapshot['name_index']
+    return biotope_offline.write_bundle(
+        path,
+        snapshot['version'],
+        snapshot['all_species'],
+        [name_index.get(name, -1) for name in snapshot['all_species']],
+        [snapshot['all_species_index'][name] for name in snapshot['species_names']],
+        snapshot['frequency_matrix'],
+        snapshot['group_totals'],
+        snapshot['group_codes'],
+        snapshot['group_labels'],
+        snapshot['biotope_pages'],
+        f"{PDF_BASE_URL}{PDF_FILENAME}",
+    )
+
+@instrumented_cache_data(max_entries=1, show_spinner=False)
+def build_offline_bundle(catalog_version, _snapshot):
+    """Obsah balíka pre danú verziu katalógu (pripraví sa raz, pri ďalšom stiahnutí sa len vráti)."""
+    with tempfile.NamedTemporaryFile(suffix='.bin', delete=False) as output:
+        bundle_path = output.name
+    try:
+        export_offline_bundle(_snapshot, bundle_path)
+        with open(bundle_path, 'rb') as f:
+            return f.read()
+    finally:
+        remove_file_quietly(bundle_path)
+
+# --- SESSION STATE (SLIM) ---
+# Zoznamy druhov sa v relácii držia ako polia int32 ID do zdieľaného snapshot['all_species'];
+# relácia si pamätá len referenciu na tento zoznam, nie jeho kópiu.
+
+SESSION_SPECIES_KEYS = ('uploaded_known_ids', 'calculated_species_ids', 'manual_selection_ids')
+EMPTY_SPECIES_IDS = np.zeros(0, dtype=np.int32)
+
+def species_to_ids(names, snapshot):
+    index = snapshot['all_species_index']
+    return np.array(sorted({index[name] for name in names if name in index}), dtype=np.int32)
+
+def get_session_species(key):
+    species_catalog = st.session_state.get('species_catalog') or []
+    return [species_catalog[i] for i in st.session_state.get(key, EMPTY_SPECIES_IDS)]
+
+def set_session_species(key, names, snapshot):
+    st.session_state[key] = species_to_ids(names, snapshot)
+
+def sync_session_catalog(snapshot):
+    """Po zmene katalógu preloží ID relácie podľa mien; druhy, ktoré katalóg už nepozná, sa stanú neznámymi."""
+    species_catalog = st.session_state.get('species_catalog')
+    if species_catalog is snapshot['all_species']:
+        return
+
+    if species_catalog is not None:
+        for key in SESSION_SPECIES_KEYS:
+            names = [species_catalog[i] for i in st.session_state.get(key, EMPTY_SPECIES_IDS)]
+            st.session_state[key] = species_to_ids(names, snapshot)
+            if key == 'uploaded_known_ids':
+                dropped = [name for name in names if name not in snapshot['all_species_index']]
+                st.session_state['uploaded_unknown_species'] = sorted(set(st.session_state.get('uploaded_unknown_species', []) + dropped))
+        # Výber v multiselecte (zoznam ID v poradí výberu)
+        index = snapshot['all_species_index']
+        selected = [species_catalog[i] for i in st.session_state.get('selected_species_multiselect', [])]
+        st.session_state['selected_species_multiselect'] = [index[name] for name in selected if name in index]
+    st.session_state['species_catalog'] = snapshot['all_species']
+
+# --- SESSION REGISTRY (MEMORY ACCOUNTING, IDLE PRUNING) ---
+
+SESSION_IDLE_TIMEOUT = 30 * 60     # s, po tejto dobe nečinnosti sa uvoľnia ťažké zdroje relácie
+SESSION_PRUNE_INTERVAL = 60        # s, ako často sa nečinné relácie kontrolujú
+SESSION_SIZE_SAMPLE = 100          # pri dlhých zoznamoch sa veľkosť odhadne z prvých N položiek
+
+@st.cache_resource
+def get_session_registry():
+    """Zdieľaný register relácií: posledná aktivita, odhad pamäte a ťažké zdroje (úlohy, dočasné súbory)."""
+    return {'lock': threading.Lock(), 'sessions': {}, 'last_prune': 0.0}
+
+def get_session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else 'local'
+
+def get_session_entry(session_id=None):
+    registry = get_session_registry()
+    session_id = session_id or get_session_id()
+    with registry['lock']:
+        entry = registry['sessions'].get(session_id)
+        if entry is None:
+            entry = registry['sessions'][session_id] = {'last_seen': time.time(), 'state_bytes': 0, 'resources': {}, 'temp_paths': {}}
+        return entry
+
+def get_session_resource(key, default=None):
+    return get_session_entry()['resources'].get(key, default)
+
+def set_session_resource(key, value, paths=()):
+    """Uloží zdroj relácie spolu s jeho dočasnými súbormi; súbory nahradeného zdroja sa zmažú."""
+    entry = get_session_entry()
+    paths = tuple(paths)
+    for path in entry['temp_paths'].get(key, ()):
+        if path not in paths:
+            remove_file_quietly(path)
+    entry['resources'][key] = value
+    entry['temp_paths'][key] = paths
+
+def estimate_object_size(value, shared_species=None, depth=0):
+    """Približná veľkosť objektu v bajtoch; reťazce zo zdieľaného katalógu sa nepočítajú."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, str):
+        if shared_species is not None and shared_species.get(value) is not None:
+            return 0
+        return sys.getsizeof(value)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if depth > 4:
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        items = list(value.items())
+        sample = items[:SESSION_SIZE_SAMPLE]
+        sampled = sum(estimate_object_size(k, shared_species, depth + 1) + estimate_object_size(v, shared_species, depth + 1) for k, v in sample)
+        return sys.getsizeof(value) + (sampled * len(items) // len(sample) if sample else 0)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = list(itertools.islice(value, SESSION_SIZE_SAMPLE))
+        sampled = sum(estimate_object_size(item, shared_species, depth + 1) for item in items)
+        return sys.getsizeof(value) + (sampled * len(value) // len(items) if items else 0)
+    return sys.getsizeof(value)
+
+def estimate_batch_job_size(job):
+    with job['lock']:
+        chunks = list(job['chunks'].values())
+        score_bytes = sum(scores.nbytes for scores in job['score_chunks'].values())
+    heatmap = job.get('heatmap')
+    if heatmap is not None:
+        score_bytes += sum(level.nbytes for level in heatmap['levels'])
+    return sum(estimate_object_size(chunk) for chunk in chunks) + score_bytes
+
+def record_session_activity(snapshot):
+    """Pri každom behu skriptu zaznamená aktivitu relácie; odhad pamäte sa obnoví najviac raz za SESSION_PRUNE_INTERVAL."""
+    entry = get_session_entry()
+    entry['last_seen'] = time.time()
+    if entry['last_seen'] - entry.get('sized_at', 0.0) >= SESSION_PRUNE_INTERVAL:
+        entry['sized_at'] = entry['last_seen']
+        estimate_session_size(entry, snapshot)
+
+    registry = get_session_registry()
+    if time.time() - registry['last_prune'] >= SESSION_PRUNE_INTERVAL:
+        registry['last_prune'] = time.time()
+        prune_idle_sessions()
+
+def estimate_session_size(entry, snapshot):
+    shared_species = snapshot['all_species_index']
+    entry['state_bytes'] = sum(
+        estimate_object_size(value, shared_species)
+        for key, value in st.session_state.to_dict().items()
+        if key != 'species_catalog'   # zdieľaná referencia na katalóg
+    )
+    entry['resource_bytes'] = sum(
+        estimate_batch_job_size(value) if key == 'batch_job' else estimate_object_size(value)
+        for key, value in dict(entry['resources']).items()
+    )
+
+def release_session_resources(entry):
+    """Zruší bežiace úlohy relácie a zmaže dočasné súbory registrované pri jej zdrojoch."""
+    for key in ('batch_job', 'batch_zip_export'):
+        if key in entry['resources']:
+            entry['resources'][key]['cancel'].set()
+    for paths in entry['temp_paths'].values():
+        for path in paths:
+            remove_file_quietly(path)
+
+def prune_idle_sessions(idle_timeout=SESSION_IDLE_TIMEOUT):
+    """Zruší úlohy a zmaže dočasné súbory relácií, ktoré boli dlhšie nečinné (aj zatvorené karty)."""
+    registry = get_session_registry()
+    now = time.time()
+    with registry['lock']:
+        idle = [session_id for session_id, entry in registry['sessions'].items() if now - entry['last_seen'] > idle_timeout]
+        entries = [registry['sessions'].pop(session_id) for session_id in idle]
+    for entry in entries:
+        release_session_resources(entry)
+    return len(entries)
+
+def get_session_memory_report():
+    registry = get_session_registry()
+    now = time.time()
+    with registry['lock']:
+        return [
+            {
+                'session_id': session_id,
+                'idle_seconds': now - entry['last_seen'],
+                'state_bytes': entry['state_bytes'],
+                'resource_bytes': entry.get('resource_bytes', 0),
+            }
+            for session_id, entry in registry['sessions'].items()
+        ]
+
 # --- CALLBACKS ---
 
 def calculate_fqi_action():
-    uploaded_known = st.session_state.get('uploaded_known_species', [])
-    manual_selected = st.session_state.selected_species_multiselect
+    snapshot = get_catalog_snapshot()
+    sync_session_catalog(snapshot)
+    manual_selected = np.unique(np.array(st.session_state.selected_species_multiselect, dtype=np.int32))
     
-    combined_species = list(set(uploaded_known + manual_selected))
-    
-    st.session_state['calculated_species'] = combined_species
-    st.session_state['manual_selections_for_display'] = manual_selected 
+    st.session_state['calculated_species_ids'] = np.union1d(st.session_state['uploaded_known_ids'], manual_selected).astype(np.int32)
+    st.session_state['manual_selection_ids'] = manual_selected
     st.session_state['app_mode'] = 'results'
     
 def handle_upload():
     uploaded_file = st.session_state.uploaded_file_key
-    all_known_species = st.session_state.all_known_species_data
+    snapshot = get_catalog_snapshot()
+    sync_session_catalog(snapshot)
     
     if uploaded_file is not None:
-        known_species, unknown_species = process_uploaded_species_list(uploaded_file, all_known_species)
+        known_species, unknown_species, cover_entries = process_uploaded_species_list(uploaded_file, snapshot['all_species_index'])
         
         if known_species is None:
              st.error("Error decoding file.")
              return
              
-        st.session_state['uploaded_known_species'] = known_species
+        set_session_species('uploaded_known_ids', known_species, snapshot)
         st.session_state['uploaded_unknown_species'] = unknown_species
+        st.session_state['uploaded_cover_entries'] = cover_entries
         msg = t('toast_loaded').format(
             len(known_species) + len(unknown_species),
             len(known_species),
@@ -797,17 +4091,28 @@ def handle_upload():
         )
         st.toast(msg, icon='📄')
     else:
-        st.session_state['uploaded_known_species'] = []
+        st.session_state['uploaded_known_ids'] = EMPTY_SPECIES_IDS
         st.session_state['uploaded_unknown_species'] = []
+        st.session_state['uploaded_cover_entries'] = []
         st.toast(t('toast_removed'), icon='🗑️')
 
 def reset_selection_action():
     st.session_state['app_mode'] = 'selection'
-    st.session_state['uploaded_known_species'] = []
+    st.session_state['uploaded_known_ids'] = EMPTY_SPECIES_IDS
     st.session_state['uploaded_unknown_species'] = []
+    st.session_state['uploaded_cover_entries'] = []
     
-    if 'manual_selections_for_display' in st.session_state:
-        st.session_state['selected_species_multiselect'] = st.session_state['manual_selections_for_display']
+    if 'manual_selection_ids' in st.session_state:
+        st.session_state['selected_species_multiselect'] = st.session_state['manual_selection_ids'].tolist()
+
+def add_suggested_species_action():
+    snapshot = get_catalog_snapshot()
+    sync_session_catalog(snapshot)
+    species_id = snapshot['all_species_index'].get(st.session_state.get('suggestion_pick'))
+    selected = st.session_state.get('selected_species_multiselect', [])
+    if species_id is not None and species_id not in selected:
+        st.session_state['selected_species_multiselect'] = selected + [species_id]
+    st.session_state['suggestion_pick'] = None
 
 def set_lang(lang_code):
     st.session_state['lang'] = lang_code
@@ -816,6 +4121,643 @@ def set_lang(lang_code):
     # In Streamlit versions > 1.27 st.rerun() is preferred.
     # We will let the button click handle the refresh naturally.
 
+# --- SPECIES SUGGESTIONS (UI) ---
+
+def render_species_suggestions(species_list, snapshot, rank_by='fqi', key_prefix='suggestions', allow_add=False):
+    """Tabuľka druhov, ktoré sa oplatí hľadať v teréne na rozlíšenie blízkych kandidátov."""
+    method = st.radio(
+        t("suggest_method"), options=list(SUGGESTION_METHODS),
+        format_func=lambda key: t(f"suggest_method_{key}"), horizontal=True, key=f'{key_prefix}_method'
+    )
+    rows = resolve_species_rows(species_list, snapshot)[0]
+    suggestions = suggest_discriminating_species(rows, snapshot, rank_by=rank_by, method=method)
+    if not suggestions:
+        st.info(t("suggest_none"))
+        return
+
+    df_suggestions = pd.DataFrame([
+        {
+            t("col_species"): item['species'],
+            t(f"col_suggest_{method}"): f"{item['score']:.2f}" + (" %" if method == 'difference' else " bit"),
+            t("col_favours"): item['favours'],
+            t("col_candidate_gains"): ", ".join(f"{code} +{gain:.2f} %" for code, gain in item['gains']),
+        }
+        for item in suggestions
+    ])
+    st.dataframe(df_suggestions, use_container_width=True, hide_index=True)
+    st.caption(t(f"suggest_caption_{method}"))
+
+    if allow_add:
+        st.pills(
+            t("suggest_add"), options=[item['species'] for item in suggestions],
+            key='suggestion_pick', on_change=add_suggested_species_action
+        )
+
+# --- BATCH PAGE ---
+
+def remove_file_quietly(path):
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def render_batch_page(snapshot):
+    st.header(t("batch_title"))
+    st.info(t("batch_info"))
+
+    batch_file = st.file_uploader(t("batch_upload_label"), type=['txt', 'tsv', 'csv'], key='batch_file_key')
+    top_k = st.number_input(t("batch_top_k"), min_value=1, max_value=10, value=3, key='batch_top_k')
+    rank_metric = st.selectbox(
+        t("metric_label"),
+        options=list(SIMILARITY_METRICS),
+        format_func=lambda metric: t(f"metric_{metric}"),
+        key='batch_rank_metric'
+    )
+    col_weighting, col_scale = st.columns(2)
+    with col_weighting:
+        batch_weighting = st.selectbox(
+            t("cover_weighting_label"), options=list(COVER_WEIGHTINGS),
+            format_func=lambda key: t(f"cover_weighting_{key}"), key='batch_cover_weighting', help=t("batch_cover_help")
+        )
+    with col_scale:
+        batch_cover_scale = st.selectbox(
+            t("cover_scale_label"), options=list(COVER_SCALES),
+            format_func=lambda key: t(f"cover_scale_{key}"), key='batch_cover_scale'
+        )
+    with_confidence = st.checkbox(t("confidence_toggle"), key='batch_confidence')
+
+    if batch_file is not None and st.button(t("btn_batch_job"), type="primary", use_container_width=True):
+        previous_job = get_session_resource('batch_job')
+        if previous_job is not None:
+            previous_job['cancel'].set()
+        # Kópia nahratého súboru na disk – úloha beží aj po ďalších behoch skriptu
+        with tempfile.NamedTemporaryFile('wb', suffix='.txt', delete=False) as input_copy:
+            batch_file.seek(0)
+            shutil.copyfileobj(batch_file, input_copy)
+        set_session_resource('batch_job', start_batch_job(
+            input_copy.name, snapshot, rank_by=rank_metric, top_k=int(top_k), weighting=batch_weighting,
+            cover_scale=batch_cover_scale
+        ))
+
+    if batch_file is not None and st.button(t("btn_queue_job"), use_container_width=True):
+        encoding = detect_text_encoding(batch_file.read(65536))
+        batch_file.seek(0)
+        source = io.TextIOWrapper(batch_file, encoding=encoding, newline='')
+        try:
+            job_id = submit_queue_job(
+                iter_batch_releves(source), snapshot, rank_by=rank_metric, top_k=int(top_k),
+                input_name=batch_file.name, weighting=batch_weighting, cover_scale=batch_cover_scale
+            )
+        except (ValueError, UnicodeDecodeError) as e:
+            st.error(t("batch_error").format(e))
+        else:
+            get_job_queue()['wake'].set()
+            st.session_state['queue_job_id'] = job_id
+            st.success(t("queue_submitted").format(job_id))
+        finally:
+            source.detach()
+
+    batch_job = get_session_resource('batch_job')
+    if batch_job is not None:
+        # Počas behu sa obnovuje len tento fragment, nie celá stránka
+        st.fragment(render_batch_job, run_every=None if batch_job['finished'] else BATCH_POLL_INTERVAL)()
+
+    # Trvalá fronta: úlohy aj výsledky sú v databáze, dajú sa vyzdvihnúť aj z inej relácie
+    queue_active = any(job['status'] in JOB_ACTIVE_STATUSES for job in list_queue_jobs())
+    st.fragment(render_job_queue, run_every=BATCH_POLL_INTERVAL if queue_active else None)()
+
+    if batch_file is None:
+        return
+
+    if st.button(t("btn_batch_geojson"), use_container_width=True):
+        encoding = detect_text_encoding(batch_file.read(65536))
+        batch_file.seek(0)
+        # Súbor sa číta po riadkoch a výstup ide priamo na disk – celá kolekcia nie je v pamäti
+        source = io.TextIOWrapper(batch_file, encoding=encoding, newline='')
+        try:
+            with tempfile.NamedTemporaryFile('w', suffix='.geojson', encoding='utf-8', delete=False) as output:
+                geojson_path = output.name
+                features = iter_geojson_features(
+                    iter_batch_releves(source), snapshot, int(top_k), rank_by=rank_metric, confidence=with_confidence
+                )
+                count = write_geojson_stream(features, output)
+        except (ValueError, UnicodeDecodeError) as e:
+            remove_file_quietly(geojson_path)
+            st.error(t("batch_error").format(e))
+            return
+        finally:
+            source.detach()
+
+        set_session_resource('batch_geojson_path', geojson_path, paths=(geojson_path,))
+        st.session_state['batch_geojson_count'] = count
+
+    if st.button(t("btn_batch_save_history"), use_container_width=True):
+        encoding = detect_text_encoding(batch_file.read(65536))
+        batch_file.seek(0)
+        source = io.TextIOWrapper(batch_file, encoding=encoding, newline='')
+        try:
+            saved = save_releves_to_history(
+                iter_batch_releves(source), snapshot, rank_by=rank_metric, top_k=int(top_k), weighting=batch_weighting
+            )
+            st.success(t("batch_saved").format(saved))
+        except (ValueError, UnicodeDecodeError) as e:
+            st.error(t("batch_error").format(e))
+        finally:
+            source.detach()
+
+    if st.button(t("btn_batch_zip"), use_container_width=True):
+        # Kópia nahratého súboru na disk – pracovné vlákno nesmie závisieť od objektov relácie
+        with tempfile.NamedTemporaryFile('wb', suffix='.txt', delete=False) as input_copy:
+            batch_file.seek(0)
+            shutil.copyfileobj(batch_file, input_copy)
+        with tempfile.NamedTemporaryFile('wb', suffix='.zip', delete=False) as output:
+            zip_path = output.name
+
+        previous_export = get_session_resource('batch_zip_export')
+        if previous_export is not None:
+            previous_export['cancel'].set()
+        set_session_resource('batch_zip_export', start_reports_zip_export(
+            input_copy.name, zip_path, snapshot, lang=st.session_state['lang'], rank_by=rank_metric, top_k=int(top_k)
+        ), paths=(zip_path,))
+
+    zip_export = get_session_resource('batch_zip_export')
+    if zip_export is not None:
+        st.fragment(render_reports_zip_export, run_every=None if zip_export['finished'] else BATCH_POLL_INTERVAL)()
+
+    columnar_format = st.selectbox(t("columnar_format_label"), options=list(COLUMNAR_FORMATS), key='batch_columnar_format')
+    if st.button(t("btn_batch_columnar"), use_container_width=True):
+        if pa is None:
+            st.error(t("columnar_missing"))
+        else:
+            encoding = detect_text_encoding(batch_file.read(65536))
+            batch_file.seek(0)
+            source = io.TextIOWrapper(batch_file, encoding=encoding, newline='')
+            suffix = f".{columnar_format}"
+            with tempfile.NamedTemporaryFile('wb', suffix=suffix, delete=False) as output:
+                results_path = output.name
+            with tempfile.NamedTemporaryFile('wb', suffix=suffix, delete=False) as output:
+                species_path = output.name
+            try:
+                count = write_columnar_export(
+                    iter_batch_releves(source), results_path, species_path, snapshot,
+                    fmt=columnar_format, rank_by=rank_metric, top_k=int(top_k)
+                )
+            except (ValueError, UnicodeDecodeError) as e:
+                remove_file_quietly(results_path)
+                remove_file_quietly(species_path)
+                st.error(t("batch_error").format(e))
+            else:
+                columnar_paths = (results_path, species_path)
+                set_session_resource('batch_columnar_paths', columnar_paths, paths=columnar_paths)
+                st.session_state['batch_columnar_count'] = count
+            finally:
+                source.detach()
+
+    columnar_paths = get_session_resource('batch_columnar_paths')
+    if columnar_paths and all(os.path.exists(path) for path in columnar_paths):
+        st.success(t("batch_done").format(st.session_state.get('batch_columnar_count', 0)))
+        results_path, species_path = columnar_paths
+        extension = os.path.splitext(results_path)[1]
+        mime = "application/vnd.apache.parquet" if extension == '.parquet' else "application/vnd.apache.arrow.file"
+        file_stamp = date.today().strftime('%Y%m%d')
+        col_results, col_species = st.columns(2)
+        with col_results, open(results_path, 'rb') as f:
+            st.download_button(
+                label=t("btn_download_columnar_results").format(extension[1:]),
+                data=f,
+                file_name=f"biotope_results_{file_stamp}{extension}",
+                mime=mime,
+                use_container_width=True
+            )
+        with col_species, open(species_path, 'rb') as f:
+            st.download_button(
+                label=t("btn_download_columnar_species").format(extension[1:]),
+                data=f,
+                file_name=f"biotope_species_{file_stamp}{extension}",
+                mime=mime,
+                use_container_width=True
+            )
+
+    geojson_path = get_session_resource('batch_geojson_path')
+    if geojson_path and os.path.exists(geojson_path):
+        st.success(t("batch_done").format(st.session_state.get('batch_geojson_count', 0)))
+        with open(geojson_path, 'rb') as f:
+            st.download_button(
+                label=t("btn_download_geojson"),
+                data=f,
+                file_name=f"biotope_batch_{date.today().strftime('%Y%m%d')}.geojson",
+                mime="application/geo+json",
+                use_container_width=True
+            )
+
+# --- CACHE ADMIN (SIDEBAR) ---
+
+def render_cache_admin_sidebar():
+    with st.sidebar.expander(t("cache_admin_title"), expanded=False):
+        stats = get_cache_stats()
+        if not stats:
+            st.caption(t("cache_admin_empty"))
+            return
+
+        df_cache = pd.DataFrame([
+            {
+                t("col_cache_function"): name,
+                t("col_cache_hits"): values['hits'],
+                t("col_cache_misses"): values['misses'],
+                t("col_hit_rate"): f"{values['hit_rate'] * 100:.1f} %",
+                t("col_hash_ms"): f"{values['hash_seconds'] / values['calls'] * 1000:.2f}" if values['calls'] else "-",
+                t("col_compute_ms"): f"{values['compute_seconds'] / values['misses'] * 1000:.1f}" if values['misses'] else "-",
+                t("col_cache_size"): f"{values['stored_bytes'] / 1024 / 1024:.2f}",
+                t("col_max_entries"): values['max_entries'] or "∞",
+            }
+            for name, values in sorted(stats.items())
+        ])
+        st.dataframe(df_cache, use_container_width=True, hide_index=True)
+
+        st.download_button(
+            label=t("btn_download_metrics"),
+            data=format_cache_metrics_prometheus(stats),
+            file_name="biotope_cache_metrics.prom",
+            mime="text/plain",
+            use_container_width=True
+        )
+        if st.button(t("btn_reset_cache_stats"), use_container_width=True):
+            reset_cache_stats()
+            st.rerun()
+
+def render_batch_job():
+    job = get_session_resource('batch_job')
+    if job is None:
+        return
+    status = get_batch_job_status(job)
+
+    if job['total'] is None:
+        # Kým sa súbor číta, celkový počet sa odhaduje z podielu prečítaných bajtov
+        read_fraction = job['bytes_read'] / job['total_bytes'] if job['total_bytes'] else 0.0
+        fraction = job['done'] / job['read'] * read_fraction if job['read'] else 0.0
+        st.progress(min(fraction, 1.0), text=t("batch_job_reading").format(job['done'], read_fraction))
+    else:
+        st.progress(job['done'] / job['total'] if job['total'] else 1.0, text=t("batch_job_progress").format(job['done'], job['total']))
+
+    if status == 'running':
+        if st.button(t("btn_cancel_job"), use_container_width=True):
+            job['cancel'].set()
+    elif status == 'failed':
+        st.error(t("batch_error").format(job['error']))
+    elif status == 'cancelled':
+        st.warning(t("batch_job_cancelled").format(job['done']))
+    else:
+        st.success(t("batch_job_done").format(job['done'], job['finished_at'] - job['started_at']))
+
+    results = get_batch_job_results(job, limit=BATCH_PREVIEW_ROWS)
+    if results:
+        st.caption(t("batch_job_preview").format(len(results), job['done']))
+        st.dataframe(build_batch_results_frame(results), use_container_width=True, hide_index=True)
+
+        if status != 'running':
+            st.download_button(
+                label=t("btn_download_job_csv"),
+                data=generate_batch_job_csv(job),
+                file_name=f"biotope_batch_{date.today().strftime('%Y%m%d')}.csv",
+                mime="text/csv",
+                use_container_width=True
+            )
+
+    if status != 'running' and st.checkbox(t("heatmap_toggle"), key='batch_heatmap'):
+        render_batch_heatmap(job)
+
+    # Úloha skončila počas obnovy fragmentu – celá stránka sa prekreslí a obnovovanie sa zastaví
+    if status != 'running' and st.session_state.get('batch_job_polling', False):
+        st.session_state['batch_job_polling'] = False
+        st.rerun()
+    st.session_state['batch_job_polling'] = status == 'running'
+
+def render_reports_zip_export():
+    export = get_session_resource('batch_zip_export')
+    if export is None:
+        return
+
+    if not export['finished']:
+        fraction = export['bytes_read'] / export['total_bytes'] if export['total_bytes'] else 0.0
+        st.progress(min(fraction, 1.0), text=t("batch_zip_progress").format(export['written'], fraction))
+        if st.button(t("btn_cancel_job"), key='cancel_zip_export', use_container_width=True):
+            export['cancel'].set()
+    elif export['error']:
+        st.error(t("batch_error").format(export['error']))
+    elif export['cancel'].is_set():
+        st.warning(t("batch_zip_cancelled").format(export['written']))
+    else:
+        st.success(t("batch_zip_done").format(export['written']))
+        with open(export['output_path'], 'rb') as f:
+            st.download_button(
+                label=t("btn_download_zip"),
+                data=f,
+                file_name=f"biotope_reports_{date.today().strftime('%Y%m%d')}.zip",
+                mime="application/zip",
+                use_container_width=True
+            )
+
+    # Export skončil počas obnovy fragmentu – celá stránka sa prekreslí a obnovovanie sa zastaví
+    if export['finished'] and st.session_state.get('batch_zip_polling', False):
+        st.session_state['batch_zip_polling'] = False
+        st.rerun()
+    st.session_state['batch_zip_polling'] = not export['finished']
+
+def render_batch_heatmap(job):
+    # Pyramída sa pripraví raz po dokončení úlohy a zostane pri úlohe
+    if job.get('heatmap') is None:
+        scores, releve_ids = get_batch_job_scores(job)
+        job['heatmap'] = build_heatmap_pyramid(scores, releve_ids, job['group_codes'])
+    pyramid = job['heatmap']
+    total_rows = len(pyramid['releve_ids'])
+    if total_rows == 0:
+        return
+
+    classes = list(dict.fromkeys(get_hierarchy_units(code)['class'] for code in pyramid['group_codes']))
+    col_a, col_b, col_c = st.columns(3)
+    with col_a:
+        class_filter = st.selectbox(t("heatmap_class"), options=[''] + classes, format_func=lambda code: code or t("heatmap_all_classes"), key='heatmap_class')
+    with col_b:
+        view_sizes = [size for size in HEATMAP_VIEW_SIZES if size < total_rows] + [total_rows]
+        row_count = st.select_slider(t("heatmap_rows"), options=view_sizes, value=view_sizes[-1], key='heatmap_rows')
+    with col_c:
+        max_start = max(total_rows - row_count, 0)
+        row_start = st.slider(t("heatmap_start"), min_value=0, max_value=max(max_start, 1), value=0,
+                              step=max(row_count // 4, 1), disabled=max_start == 0, key='heatmap_start')
+        row_start = min(row_start, max_start)
+
+    column_mask = None
+    if class_filter:
+        column_mask = np.array([get_hierarchy_units(code)['class'] == class_filter for code in pyramid['group_codes']])
+    cells, step = get_heatmap_window(pyramid, row_start, row_count, column_mask)
+
+    show_labels = cells['row'].nunique() <= 60
+    chart = alt.Chart(cells).mark_rect().encode(
+        x=alt.X('code:N', sort=None, title=t("col_code"), axis=alt.Axis(labelFontSize=8)),
+        y=alt.Y('releve:N', sort=alt.EncodingSortField(field='row', order='ascending'), title=t("col_releve_id"),
+                axis=alt.Axis(labels=show_labels, ticks=show_labels)),
+        color=alt.Color('score:Q', scale=alt.Scale(scheme='viridis'), title=t(f"metric_{job['rank_by']}")),
+        tooltip=[alt.Tooltip('releve:N', title=t("col_releve_id")), alt.Tooltip('code:N', title=t("col_code")),
+                 alt.Tooltip('score:Q', title=t(f"metric_{job['rank_by']}"), format='.2f')],
+    ).properties(height=600)
+    st.altair_chart(chart, use_container_width=True)
+    st.caption(t("heatmap_caption").format(row_start + 1, min(row_start + row_count, total_rows), total_rows, step))
+
+def build_batch_results_frame(results):
+    return pd.DataFrame([
+        {
+            t("col_releve_id"): item['releve_id'],
+            t("lbl_locality"): item['lokalita'],
+            t("lbl_date"): item['datum'],
+            t("col_species_count"): item['species_count'],
+            t("col_unknown_count"): item['unknown_count'],
+            t("col_code"): item['winner_code'] or "-",
+            t("col_winner_score"): f"{item['winner_score']:.2f} %" if item['winner_score'] is not None else "-",
+            t("col_top_matches"): ", ".join(item['top_codes']),
+        }
+        for item in results
+    ])
+
+def generate_batch_job_csv(job):
+    return generate_batch_results_csv(get_batch_job_results(job))
+
+def generate_batch_results_csv(results):
+    output = io.StringIO()
+    writer = csv.writer(output, delimiter=';')
+    writer.writerow(['releve_id', 'lokalita', 'datum', 'species_count', 'unknown_count', 'winner_code', 'winner_score', 'top_codes'])
+    for item in results:
+        writer.writerow([
+            item['releve_id'], item['lokalita'], item['datum'], item['species_count'], item['unknown_count'],
+            item['winner_code'] or '', f"{item['winner_score']:.4f}" if item['winner_score'] is not None else '',
+            ' '.join(item['top_codes'])
+        ])
+    return output.getvalue().encode('utf-8-sig')
+
+def render_job_queue():
+    jobs = list_queue_jobs()
+    if not jobs:
+        return
+    st.subheader(t("queue_title"))
+    st.dataframe(pd.DataFrame([
+        {
+            'ID': job['id'],
+            t("queue_col_created"): job['created_at'],
+            t("queue_col_input"): job['input_name'] or "-",
+            t("col_status"): t(f"queue_status_{job['status']}"),
+            t("queue_col_progress"): f"{job['done_releves']} / {job['total_releves']}",
+            t("metric_label"): t(f"metric_{job['rank_by']}"),
+            t("cover_weighting_label"): t(f"cover_weighting_{job['weighting']}"),
+            t("cover_scale_label"): t(f"cover_scale_{job['cover_scale']}"),
+            t("queue_col_catalog"): job['catalog_version'],
+        }
+        for job in jobs
+    ]), use_container_width=True, hide_index=True)
+
+    jobs_by_id = {job['id']: job for job in jobs}
+    if st.session_state.get('queue_job_id') not in jobs_by_id:
+        st.session_state.pop('queue_job_id', None)
+    job_id = st.selectbox(
+        t("queue_select"), options=list(jobs_by_id), key='queue_job_id',
+        format_func=lambda key: f"{key} – {jobs_by_id[key]['input_name'] or '-'} ({t('queue_status_' + jobs_by_id[key]['status'])})"
+    )
+    job = jobs_by_id[job_id]
+    active = job['status'] in JOB_ACTIVE_STATUSES
+
+    total = job['total_releves']
+    st.progress(job['done_releves'] / total if total else 1.0, text=t("batch_job_progress").format(job['done_releves'], total))
+    if job['status'] == 'failed':
+        st.error(t("batch_error").format(job['error']))
+    elif job['status'] == 'cancelled':
+        st.warning(t("batch_job_cancelled").format(job['done_releves']))
+    elif job['status'] == 'done':
+        st.success(t("queue_job_done").format(job['done_releves'], job['finished_at']))
+
+    col_action, col_download = st.columns(2)
+    with col_action:
+        if active:
+            if st.button(t("btn_cancel_job"), key='queue_cancel', use_container_width=True):
+                cancel_queue_job(job_id)
+                st.rerun()
+        elif st.button(t("btn_queue_delete"), key='queue_delete', use_container_width=True):
+            delete_queue_job(job_id)
+            st.rerun()
+    with col_download:
+        if job['status'] == 'done':
+            st.download_button(
+                label=t("btn_download_job_csv"),
+                data=generate_batch_results_csv(iter_queue_job_results(job_id)),
+                file_name=f"biotope_batch_{job_id}.csv",
+                mime="text/csv",
+                use_container_width=True
+            )
+
+    results = list(iter_queue_job_results(job_id, limit=BATCH_PREVIEW_ROWS))
+    if results:
+        st.caption(t("batch_job_preview").format(len(results), job['done_releves']))
+        st.dataframe(build_batch_results_frame(results), use_container_width=True, hide_index=True)
+
+    # Všetky úlohy skončili počas obnovy fragmentu – celá stránka sa prekreslí a obnovovanie sa zastaví
+    any_active = any(item['status'] in JOB_ACTIVE_STATUSES for item in jobs)
+    if not any_active and st.session_state.get('queue_polling', False):
+        st.session_state['queue_polling'] = False
+        st.rerun()
+    st.session_state['queue_polling'] = any_active
+
+def render_session_admin_sidebar():
+    with st.sidebar.expander(t("session_admin_title"), expanded=False):
+        report = sorted(get_session_memory_report(), key=lambda item: -(item['state_bytes'] + item['resource_bytes']))
+        current_session = get_session_id()
+        st.caption(t("session_admin_summary").format(
+            len(report), sum(item['state_bytes'] + item['resource_bytes'] for item in report) / 1024 / 1024, SESSION_IDLE_TIMEOUT // 60
+        ))
+        st.dataframe(pd.DataFrame([
+            {
+                t("col_session"): ("▶ " if item['session_id'] == current_session else "") + item['session_id'][:8],
+                t("col_idle_min"): f"{item['idle_seconds'] / 60:.1f}",
+                t("col_state_kb"): f"{item['state_bytes'] / 1024:.1f}",
+                t("col_resources_kb"): f"{item['resource_bytes'] / 1024:.1f}",
+            }
+            for item in report
+        ]), use_container_width=True, hide_index=True)
+        if st.button(t("btn_prune_sessions"), use_container_width=True):
+            st.toast(t("toast_sessions_pruned").format(prune_idle_sessions()))
+
+# --- HISTORY PAGE ---
+
+HISTORY_PAGE_LIMIT = 200
+
+def render_history_page():
+    st.header(t("history_title"))
+
+    col_a, col_b, col_c = st.columns(3)
+    with col_a:
+        lokalita = st.text_input(t("lbl_locality"), key='history_lokalita')
+        winner_code = st.text_input(t("lbl_winner_code"), key='history_winner')
+    with col_b:
+        mapovatel = st.text_input(t("lbl_mapper"), key='history_mapovatel')
+    with col_c:
+        date_from = st.date_input(t("lbl_date_from"), value=None, key='history_date_from')
+        date_to = st.date_input(t("lbl_date_to"), value=None, key='history_date_to')
+
+    total, analyses = query_analyses(
+        lokalita=lokalita.strip(), mapovatel=mapovatel.strip(), winner_code=winner_code.strip(),
+        date_from=date_from, date_to=date_to, limit=HISTORY_PAGE_LIMIT
+    )
+
+    if not analyses:
+        st.info(t("history_empty"))
+        return
+
+    total_display = f"{HISTORY_COUNT_LIMIT}+" if total >= HISTORY_COUNT_LIMIT else total
+    st.write(t("history_found").format(total_display, HISTORY_PAGE_LIMIT))
+    df_history = pd.DataFrame([
+        {
+            'ID': item['id'],
+            t("lbl_date"): item['datum'],
+            t("lbl_locality"): item['lokalita'],
+            t("lbl_coords"): item['suradnica'],
+            t("lbl_mapper"): item['mapovatel'],
+            t("col_code"): item['winner_code'],
+            t("col_fqi"): f"{item['winner_fqi']:.2f} %" if item['winner_fqi'] is not None else "-",
+        }
+        for item in analyses
+    ])
+    st.dataframe(df_history, use_container_width=True, hide_index=True)
+
+    analysis_id = st.selectbox(t("lbl_analysis_id"), options=[item['id'] for item in analyses], key='history_detail_id')
+    species, scores = load_analysis_details(analysis_id)
+
+    col_scores, col_species = st.columns(2)
+    with col_scores:
+        st.dataframe(pd.DataFrame(scores), use_container_width=True, hide_index=True)
+    with col_species:
+        st.dataframe(pd.DataFrame(species), use_container_width=True, hide_index=True)
+
+# --- NEARBY ANALYSES (UI) ---
+
+def render_nearby_analyses(coords, current_code=None):
+    """Staršie analýzy z histórie v okolí zadaných súradníc a ich víťazné biotopy."""
+    with st.expander(t("nearby_title")):
+        radius_km = st.number_input(
+            t("nearby_radius"), min_value=0.1, max_value=NEARBY_MAX_RADIUS_KM,
+            value=NEARBY_DEFAULT_RADIUS_KM, step=0.5, key='nearby_radius'
+        )
+        nearby = query_analyses_near(coords[0], coords[1], radius_km)
+        if not nearby:
+            st.info(t("nearby_empty"))
+            return
+
+        winner_counts = defaultdict(int)
+        for item in nearby:
+            if item['winner_code']:
+                winner_counts[item['winner_code']] += 1
+        most_common = sorted(winner_counts.items(), key=lambda entry: -entry[1])[:3]
+        st.write(t("nearby_summary").format(len(nearby), ", ".join(f"**{code}** ({count}×)" for code, count in most_common)))
+        if current_code:
+            st.caption(t("nearby_agreement").format(current_code, winner_counts.get(current_code, 0), len(nearby)))
+
+        df_nearby = pd.DataFrame([
+            {
+                t("col_distance_km"): round(item['distance_km'], 2),
+                t("lbl_date"): item['datum'],
+                t("lbl_locality"): item['lokalita'],
+                t("lbl_mapper"): item['mapovatel'],
+                t("col_code"): item['winner_code'],
+                t("col_fqi"): f"{item['winner_fqi']:.2f} %" if item['winner_fqi'] is not None else "-",
+                'ID': item['id'],
+            }
+            for item in nearby
+        ])
+        st.dataframe(df_nearby, use_container_width=True, hide_index=True)
+
+# --- SPECIES PROFILE PAGE ---
+
+def render_species_page(snapshot):
+    st.header(t("species_title"))
+
+    species_name = st.selectbox(
+        t("species_select"), options=snapshot['all_species'], index=None,
+        placeholder=t("species_placeholder"), key='species_profile_name'
+    )
+    if species_name is None:
+        st.info(t("species_info"))
+        return
+
+    profile = get_species_profile(species_name, snapshot)
+    if profile is None:
+        st.warning(t("species_unknown"))
+        return
+
+    if profile['canonical'] != profile['name']:
+        st.info(t("species_resolved").format(profile['name'], profile['canonical']))
+    st.subheader(profile['canonical'])
+    if profile['synonyms']:
+        st.write(t("species_synonyms").format(", ".join(profile['synonyms'])))
+    else:
+        st.caption(t("species_no_synonyms"))
+
+    if not profile['groups']:
+        st.warning(t("species_no_occurrences"))
+        return
+
+    st.write(t("species_occurrences").format(profile['total'], len(profile['groups'])))
+    df_profile = pd.DataFrame([
+        {
+            t("col_code"): item['code'],
+            t("col_name"): item['name'],
+            t("col_occurrences"): item['count'],
+            t("col_share_species"): f"{item['share_of_species']:.1f} %",
+            t("col_share_group"): f"{item['share_of_group']:.2f} %",
+            t("col_pdf"): item['pdf_url'],
+        }
+        for item in profile['groups']
+    ])
+    st.dataframe(
+        df_profile, use_container_width=True, hide_index=True,
+        column_config={t("col_pdf"): st.column_config.LinkColumn(t("col_pdf"), display_text=t("open_pdf"), width="small")}
+    )
+
 # --- MAIN APP ---
 
 def biotope_web_app():
@@ -856,37 +4798,87 @@ def biotope_web_app():
     # Inicializácia stavu
     if 'app_mode' not in st.session_state:
         st.session_state['app_mode'] = 'selection'
-        st.session_state['calculated_species'] = [] 
-        st.session_state['uploaded_known_species'] = []
+        st.session_state['calculated_species_ids'] = EMPTY_SPECIES_IDS
+        st.session_state['uploaded_known_ids'] = EMPTY_SPECIES_IDS
         st.session_state['uploaded_unknown_species'] = []
         st.session_state['selected_species_multiselect'] = [] 
-        st.session_state['manual_selections_for_display'] = []
+        st.session_state['manual_selection_ids'] = EMPTY_SPECIES_IDS
 
     # Krok 0: Načítanie a parsovanie dát
-    catalog_text = load_file_content(CATALOG_FILENAME)
-    if catalog_text is None:
+    # Snapshot sa prevezme raz na začiatku behu, celý beh tak pracuje s jednou verziou katalógu
+    # aj keď vlákno na pozadí medzitým pripraví novú.
+    snapshot = get_catalog_snapshot()
+    if snapshot is None:
+        if get_file_fingerprint(CATALOG_FILENAME) is None:
+            st.error(f"⚠️ {t('err_file_not_found')} '{CATALOG_FILENAME}'")
+        elif get_catalog_store()['last_error']:
+            st.error(f"Error loading file: {get_catalog_store()['last_error']}")
+        else:
+            st.error("Nepodarilo sa spracovať dáta z katalógu.")
         return
 
-    synonym_map, group_names, similarity_matrix = parse_catalog_data(catalog_text)
-    if synonym_map is None: 
-        st.error("Nepodarilo sa spracovať dáta z katalógu.")
-        return
-        
-    all_species = get_all_known_species(synonym_map, similarity_matrix)
-    total_frequency_per_group = calculate_total_frequency_per_group(similarity_matrix, group_names)
+    group_names = snapshot['group_names']
+    similarity_matrix = snapshot['similarity_matrix']
+    all_species = snapshot['all_species']
 
-    st.session_state.all_known_species_data = all_species 
+    sync_session_catalog(snapshot)
+
+    if st.session_state.get('catalog_version') not in (None, snapshot['version']):
+        st.toast(t("toast_catalog_reloaded").format(snapshot['version']), icon='🔄')
+    st.session_state['catalog_version'] = snapshot['version']
 
     # Sidebar štatistiky
     st.sidebar.header(t("stats_header"))
     st.sidebar.write(t("stats_biotopes").format(len(group_names)))
     st.sidebar.write(t("stats_matrix").format(len(similarity_matrix)))
     st.sidebar.write(t("stats_total").format(len(all_species)))
+    st.sidebar.caption(t("stats_version").format(snapshot['version'], snapshot['loaded_at'].strftime('%Y-%m-%d %H:%M:%S')))
+    # Balík sa pripraví až po kliknutí (odložené generovanie mimo behu skriptu), nie pri každom behu stránky
+    st.sidebar.download_button(
+        label=t("btn_download_bundle"),
+        data=functools.partial(build_offline_bundle, snapshot['version'], snapshot),
+        file_name=f"biotope_bundle_{snapshot['version']}.bin",
+        mime="application/octet-stream",
+        help=t("bundle_help"),
+        use_container_width=True
+    )
+    history_refresh = get_catalog_store()['history_refresh']
+    if history_refresh and history_refresh['to_version'] == snapshot['version']:
+        st.sidebar.caption(t("stats_history_refresh").format(
+            history_refresh['rescored'], history_refresh['reconciled'], history_refresh['restamped'], history_refresh['seconds']
+        ))
+
+    record_session_activity(snapshot)
+
+    # Nedokončené úlohy trvalej fronty sa po štarte servera prevezmú automaticky; bez nich sa dispečer
+    # ani pool nespúšťajú (pri zaradení novej úlohy ho spustí submit)
+    if has_active_queue_jobs():
+        get_job_queue()
+
+    # Administrátorský prehľad cache a relácií (?admin=1 v URL)
+    if st.query_params.get('admin') == '1':
+        render_cache_admin_sidebar()
+        render_session_admin_sidebar()
+
+    st.sidebar.markdown("---")
+    page = st.sidebar.radio(t("nav_label"), options=['single', 'batch', 'history', 'species'], format_func=lambda key: t(f"nav_{key}"), key='page')
 
 
     # --- RIADENIE REŽIMU APLIKÁCIE ---
 
-    if st.session_state['app_mode'] == 'selection':
+    if page == 'batch':
+        # Dávkové spracovanie viacerých zápisov
+        render_batch_page(snapshot)
+
+    elif page == 'history':
+        # Prehliadanie uložených analýz
+        render_history_page()
+
+    elif page == 'species':
+        # Profil druhu: synonymá a výskyt v skupinách
+        render_species_page(snapshot)
+
+    elif st.session_state['app_mode'] == 'selection':
         # Režim 1: VÝBER DRUHOV
 
         st.header(t("sec1_title"))
@@ -901,7 +4893,7 @@ def biotope_web_app():
             key='uploaded_file_key'
         )
 
-        uploaded_known_species = st.session_state.get('uploaded_known_species', [])
+        uploaded_known_species = get_session_species('uploaded_known_ids')
         uploaded_unknown_species = st.session_state.get('uploaded_unknown_species', [])
 
         if uploaded_file and (uploaded_known_species or uploaded_unknown_species):
@@ -918,16 +4910,21 @@ def biotope_web_app():
 
         st.subheader(t("sec1_2_subtitle"))
 
-        current_species_list = st.multiselect(
+        # Hodnota widgetu sú ID druhov (indexy do all_species), mená slúžia len na zobrazenie
+        current_species_ids = st.multiselect(
             t("multiselect_label"),
-            options=all_species,
-            default=st.session_state.get('selected_species_multiselect', []), 
+            options=range(len(all_species)),
+            format_func=all_species.__getitem__,
             key="selected_species_multiselect" 
         )
+        current_species_list = [all_species[i] for i in current_species_ids]
         
         total_species_for_analysis = list(set(uploaded_known_species + current_species_list))
 
         st.info(t("total_analysis_info").format(len(total_species_for_analysis)))
+
+        if total_species_for_analysis and st.checkbox(t("suggest_toggle"), key='show_suggestions_selection'):
+            render_species_suggestions(total_species_for_analysis, snapshot, key_prefix='suggestions_selection', allow_add=True)
         
         if total_species_for_analysis:
             st.button(
@@ -942,10 +4939,10 @@ def biotope_web_app():
     elif st.session_state['app_mode'] == 'results':
         # Režim 2: ZOBRAZENIE VÝSLEDKOV
 
-        user_species_list = st.session_state['calculated_species']
+        user_species_list = get_session_species('calculated_species_ids')
         uploaded_unknown_species = st.session_state.get('uploaded_unknown_species', [])
-        manual_selected_for_display = st.session_state.get('manual_selections_for_display', []) 
-        uploaded_known_species = st.session_state.get('uploaded_known_species', []) 
+        manual_selected_for_display = get_session_species('manual_selection_ids')
+        uploaded_known_species = get_session_species('uploaded_known_ids')
         
         remaining_unknown_species = uploaded_unknown_species 
         manual_selections_for_analysis = manual_selected_for_display
@@ -968,8 +4965,33 @@ def biotope_web_app():
         
         st.info(t("analysis_running").format(len(user_species_list)))
 
+        rank_metric = st.selectbox(
+            t("metric_label"),
+            options=list(SIMILARITY_METRICS),
+            format_func=lambda metric: t(f"metric_{metric}"),
+            key='rank_metric'
+        )
+
+        # Vážené FQI sa ponúkne, len ak nahratý zoznam obsahoval pokryvnosti
+        cover_entries = st.session_state.get('uploaded_cover_entries', [])
+        cover_weighting = 'presence'
+        cover_scale = 'auto'
+        if cover_entries:
+            col_weighting, col_scale = st.columns(2)
+            with col_weighting:
+                cover_weighting = st.selectbox(
+                    t("cover_weighting_label"), options=list(COVER_WEIGHTINGS),
+                    format_func=lambda key: t(f"cover_weighting_{key}"), key='cover_weighting'
+                )
+            with col_scale:
+                cover_scale = st.selectbox(
+                    t("cover_scale_label"), options=list(COVER_SCALES),
+                    format_func=lambda key: t(f"cover_scale_{key}"), key='cover_scale'
+                )
+
         top_matches_data, processed_species, name_conversion_map, ignored_inputs = analyze_similarity(
-            user_species_list, synonym_map, group_names, similarity_matrix, total_frequency_per_group
+            user_species_list, snapshot['version'], rank_by=rank_metric,
+            cover_entries=cover_entries, weighting=cover_weighting, cover_scale=cover_scale, _snapshot=snapshot
         )
         
         if top_matches_data is None:
@@ -990,6 +5012,8 @@ def biotope_web_app():
                 t("col_code"): item['code'],
                 t("col_name"): item['name'],
                 t("col_fqi"): item['fqi'],
+                **{t(f"metric_{metric}"): f"{item['metrics'][metric]:.2f} %" for metric in SIMILARITY_METRICS if metric != 'fqi'},
+                t("col_lookalikes"): ", ".join(f"{code} ({score:.0f} %)" for code, score in item.get('lookalikes', [])),
                 t("col_pdf"): item['pdf_url'] # URL for LinkColumn
             })
 
@@ -1017,6 +5041,77 @@ def biotope_web_app():
             )
 
         st.caption(t("fqi_caption"))
+        if cover_weighting != 'presence':
+            st.caption(t("cover_weighting_caption").format(t(f"cover_weighting_{cover_weighting}"), len(cover_entries)))
+        st.caption(t("metrics_caption"))
+        st.caption(t("lookalike_caption"))
+
+        if st.checkbox(t("hierarchy_toggle"), key='show_hierarchy'):
+            hierarchy_results = analyze_hierarchy(user_species_list, snapshot, rank_by=rank_metric)
+            level_columns = st.columns(len(HIERARCHY_LEVELS))
+            for level, level_column in zip(HIERARCHY_LEVELS, level_columns):
+                with level_column:
+                    st.markdown(f"**{t(f'level_{level}')}**")
+                    df_level = pd.DataFrame([
+                        {
+                            t("col_rank"): item['rank'],
+                            t("col_code"): item['code'],
+                            t("col_name"): item['name'],
+                            t(f"metric_{rank_metric}"): f"{item['metrics'][rank_metric]:.2f} %",
+                        }
+                        for item in hierarchy_results[level]
+                    ])
+                    if not df_level.empty:
+                        st.dataframe(df_level.set_index(t("col_rank")), use_container_width=True)
+            st.caption(t("hierarchy_caption"))
+
+        if st.checkbox(t("suggest_toggle"), key='show_suggestions'):
+            render_species_suggestions(user_species_list, snapshot, rank_by=rank_metric)
+
+        if st.checkbox(t("sensitivity_toggle"), key='show_sensitivity'):
+            rows = resolve_species_rows(user_species_list, snapshot)[0]
+            sensitivity = leave_one_out_sensitivity(rows, snapshot, rank_by=rank_metric)
+            critical_species = [item['species'] for item in sensitivity if item['changes_winner']]
+
+            if critical_species:
+                st.warning(t("sensitivity_warning").format(len(critical_species)))
+                st.code("\n".join(critical_species))
+            else:
+                st.success(t("sensitivity_stable"))
+
+            df_sensitivity = pd.DataFrame([
+                {
+                    t("col_species"): item['species'],
+                    t("col_winner"): item['winner_code'] or "-",
+                    t("col_top_codes"): ", ".join(item['top_codes']),
+                    t("col_score_drop"): f"{item['score_drop']:.2f} %",
+                    t("col_changes_winner"): item['changes_winner'],
+                }
+                for item in sorted(sensitivity, key=lambda item: (not item['changes_winner'], -item['score_drop']))
+            ])
+            st.dataframe(df_sensitivity, use_container_width=True, hide_index=True)
+
+        if st.checkbox(t("confidence_toggle"), key='show_confidence'):
+            rows = resolve_species_rows(user_species_list, snapshot)[0]
+            # Rovnaká metrika poradia a váženie pokryvnosťou ako tabuľka výsledkov vyššie
+            confidence_results = bootstrap_confidence(
+                rows, snapshot, rank_by=rank_metric, covers=covers_for_rows(rows, cover_entries, snapshot, cover_scale),
+                weighting=cover_weighting, seed=0
+            )
+            df_confidence = pd.DataFrame([
+                {
+                    t("col_rank"): item['rank'],
+                    t("col_code"): item['code'],
+                    t("col_fqi"): f"{item['fqi_value']:.2f} %",
+                    **({t(f"metric_{rank_metric}"): f"{item['score']:.2f} %"} if rank_metric != 'fqi' else {}),
+                    t("col_ci"): f"{item['ci_low']:.2f} – {item['ci_high']:.2f} %",
+                    t("col_p_best"): f"{item['p_best'] * 100:.1f} %",
+                    t("col_p_value"): f"{item['p_value']:.3f}",
+                }
+                for item in confidence_results
+            ])
+            st.dataframe(df_confidence.set_index(t("col_rank")), use_container_width=True)
+            st.caption(t("confidence_caption").format(CONFIDENCE_RESAMPLES, CONFIDENCE_PERMUTATIONS))
 
         st.markdown("---")
         
@@ -1167,6 +5262,19 @@ def biotope_web_app():
                 mime="text/plain",
                 use_container_width=True
             )
+
+        if st.button(t("btn_save_history"), use_container_width=True):
+            releve_species, releve_covers = align_cover_entries(user_species_list, cover_entries)
+            releve = dict(manual_data, species=releve_species, covers=releve_covers, unknown_species=remaining_unknown_species)
+            saved_ids = save_analyses(build_analysis_records(
+                [releve], snapshot, rank_by=rank_metric, weighting=cover_weighting, cover_scale=cover_scale
+            ))
+            st.toast(t("toast_saved_history").format(saved_ids[0]), icon='💾')
+
+        # Staršie mapovanie v okolí (len ak existuje história a súradnice sa dajú prečítať)
+        field_coords = parse_coordinates(suradnica)
+        if field_coords and os.path.exists(HISTORY_DB_FILENAME):
+            render_nearby_analyses(field_coords, top_matches_data[0]['code'] if top_matches_data else None)
             
         st.markdown("---") 
             
@@ -1175,4 +5283,14 @@ def biotope_web_app():
 
 
 if __name__ == "__main__":
+    if '--export-bundle' in sys.argv:
+        # Offline balík pre terénne zariadenia: --export-bundle CESTA
+        bundle_snapshot = load_catalog_snapshot_from_files(get_catalog_fingerprint())
+        if bundle_snapshot is None:
+            sys.exit(f"{CATALOG_FILENAME}: catalog not found or not parseable")
+        export_offline_bundle(bundle_snapshot, sys.argv[sys.argv.index('--export-bundle') + 1])
+        sys.exit(0)
+    if '--job-worker' in sys.argv:
+        # Samostatný spracovateľ fronty úloh (bez webového servera)
+        run_job_queue(create_job_queue())
     biotope_web_app()
\ No newline at end of file
@@ -0,0 +1,186 @@
+"""Rozpočty pamäte (tracemalloc) hlavných ciest aplikácie na syntetických katalógoch.
+
+Spustenie: python -m pytest tests/test_memory_budgets.py
+Nové rozpočty: BIOTOPE_UPDATE_MEMORY_BUDGETS=1 python -m pytest tests/test_memory_budgets.py
+"""
+import gc
+import json
+import math
+import os
+import random
+import sys
+import tracemalloc
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import biotope_web_app as app
+
+MEMORY_BUDGETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "memory_budgets.json")
+SYNTHETIC_CATALOG_SIZES = (500, 2000, 8000)   # počet kanonických druhov syntetického katalógu
+MEASURED_PATHS = (
+    'parse_catalog_data', 'get_all_known_species', 'build_catalog_snapshot',
+    'analyze_similarity_metrics', 'session_state', 'generate_export_data', 'generate_excel_data',
+)
+MEMORY_BUDGET_HEADROOM = 1.25                 # rezerva pri zápise nových rozpočtov
+MEMORY_BUDGET_MIN_SLACK = 256 * 1024          # B, aby malé merania neboli citlivé na šum
+UPDATE_BUDGETS = os.environ.get('BIOTOPE_UPDATE_MEMORY_BUDGETS') == '1'
+
+def generate_synthetic_catalog(n_species, seed=0, synonym_ratio=0.3, max_groups_per_species=12):
+    """Katalóg v rovnakom textovom formáte ako skutočný (sekcie 1 a 4), so skupinami z BIOTOPE_PAGES."""
+    rnd = random.Random(seed)
+    codes = list(app.BIOTOPE_PAGES)
+    names = [f"Synthetica{i // 25} speciosa{i}" for i in range(n_species)]
+
+    lines = ["SECTION 1: Species aggregation"]
+    for i, name in enumerate(names):
+        lines.append(f"{name} - {i + 1}")
+        lines.append(f"    {name} 1")
+        if rnd.random() < synonym_ratio:
+            lines.append(f"    {name} var. synonymum 2")
+    lines.append("SECTION 4: Similarity")
+    for group_number, code in enumerate(codes, 1):
+        lines.append(f"Group{group_number} name: {code} - Synthetic habitat {code} Count: {rnd.randint(5, 200)}")
+    lines.append("Frequency table")
+    for name in names:
+        lines.append(name)
+        total = 0
+        for group_number in rnd.sample(range(1, len(codes) + 1), rnd.randint(1, max_groups_per_species)):
+            count = rnd.randint(1, 100)
+            total += count
+            lines.append(f"  Group{group_number}: {count}")
+        lines.append(f"  Total: {total}")
+    return "\n".join(lines) + "\n"
+
+def measure_memory(func, *args, **kwargs):
+    """Vráti (výsledok, {'peak', 'retained'}) v bajtoch; retained = pamäť, ktorú drží výsledok."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = func(*args, **kwargs)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, {'peak': peak - baseline, 'retained': current - baseline}
+
+def fill_session_state(snapshot, uploaded_names, selected_names):
+    """Stav relácie po nahratí zoznamu a výpočte (rovnaké funkcie ako callbacky aplikácie)."""
+    app.sync_session_catalog(snapshot)
+    app.set_session_species('uploaded_known_ids', uploaded_names, snapshot)
+    app.set_session_species('manual_selection_ids', selected_names, snapshot)
+    app.set_session_species('calculated_species_ids', uploaded_names + selected_names, snapshot)
+    return dict(app.st.session_state)
+
+def build_manual_data(species_list, unknown_names):
+    """Údaje formulára exportu ako po výpočte: ručne pridané druhy a nezaradené mená zo zoznamu."""
+    return {
+        'lokalita': "Syntetická lokalita",
+        'suradnica': "48.14816, 17.10674",
+        'mapovatel': "Test",
+        'datum': date(2024, 6, 1),
+        'pokryvnost_E3': "30",
+        'pokryvnost_E2': "10",
+        'pokryvnost_E1': "80",
+        'pokryvnost_E0': "5",
+        'manual_selections_for_analysis': species_list,
+        'remaining_unknown_species': unknown_names,
+    }
+
+def measure_catalog_memory(size, seed=0):
+    measurements = {}
+    catalog_text = generate_synthetic_catalog(size, seed=seed)
+
+    # Kroky spracovania katalógu aj celý snapshot (ktorý ich obsahuje) – únik v kroku sa neskryje v súčte
+    (synonym_map, _, similarity_matrix), measurements[f"parse_catalog_data@{size}"] = measure_memory(
+        app.parse_catalog_data, catalog_text
+    )
+    _, measurements[f"get_all_known_species@{size}"] = measure_memory(
+        app.get_all_known_species, synonym_map, similarity_matrix
+    )
+    del synonym_map, similarity_matrix
+    snapshot, measurements[f"build_catalog_snapshot@{size}"] = measure_memory(
+        app.build_catalog_snapshot, catalog_text, dict(app.BIOTOPE_PAGES)
+    )
+
+    # Zápis aj nahratý zoznam rastú s katalógom, aby rozpočty zachytili aj cesty úmerné počtu druhov
+    rnd = random.Random(seed)
+    species_list = rnd.sample(snapshot['species_names'], size // 50)
+    _, measurements[f"analyze_similarity_metrics@{size}"] = measure_memory(
+        app.analyze_similarity_metrics, species_list, snapshot
+    )
+
+    uploaded_names = rnd.sample(snapshot['all_species'], size // 4)
+
+    # Exporty z výsledkov výpočtu nad nahratým zoznamom (kanonické druhy aj nezaradené mená rastú s katalógom)
+    top_matches_data, processed_species, _, _ = app.analyze_similarity_metrics(uploaded_names, snapshot, top_k=10)
+    fqi_results_df = app.build_localized_results(top_matches_data)
+    canonical_species_list = sorted(processed_species)
+    manual_data = build_manual_data(species_list, [f"Ignota speciosa{i}" for i in range(size // 4)])
+    for export in (app.generate_export_data, app.generate_excel_data):
+        _, measurements[f"{export.__name__}@{size}"] = measure_memory(
+            export, fqi_results_df, canonical_species_list, manual_data
+        )
+    # Relácia mimo behu Streamlitu – st.session_state nahradí obyčajný slovník
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(app.st, 'session_state', {})
+        _, measurements[f"session_state@{size}"] = measure_memory(
+            fill_session_state, snapshot, uploaded_names, species_list
+        )
+    return measurements
+
+def budget_for(measured):
+    return int(math.ceil(max(measured * MEMORY_BUDGET_HEADROOM, measured + MEMORY_BUDGET_MIN_SLACK)))
+
+@pytest.fixture(scope='module')
+def measurements():
+    """Meria pôvodné (necachované) funkcie – cache_data by k meraniu pridala vlastné kópie."""
+    # Zahrievacie kolo: jednorazové importy a inicializácie knižníc sa do rozpočtov nerátajú
+    measure_catalog_memory(min(SYNTHETIC_CATALOG_SIZES))
+
+    result = {}
+    for size in SYNTHETIC_CATALOG_SIZES:
+        result.update(measure_catalog_memory(size))
+    return result
+
+@pytest.fixture(scope='module')
+def budgets(measurements):
+    if UPDATE_BUDGETS:
+        # Pevná réžia knižníc (napr. to_csv) prekryje pri malých katalógoch rast dát a šum by rozpočty
+        # preházal – rozpočet väčšieho katalógu preto nikdy nie je nižší ako menšieho
+        stored = {}
+        for path in MEASURED_PATHS:
+            previous = {}
+            for size in SYNTHETIC_CATALOG_SIZES:
+                key = f"{path}@{size}"
+                previous = {
+                    kind: max(budget_for(measured), previous.get(kind, 0))
+                    for kind, measured in measurements[key].items()
+                }
+                stored[key] = previous
+        stored = dict(sorted(stored.items()))
+        with open(MEMORY_BUDGETS_PATH, 'w', encoding='utf-8') as f:
+            json.dump(stored, f, indent=2)
+            f.write("\n")
+        return stored
+
+    with open(MEMORY_BUDGETS_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+@pytest.mark.parametrize('size', SYNTHETIC_CATALOG_SIZES)
+@pytest.mark.parametrize('path', MEASURED_PATHS)
+def test_memory_within_budget(measurements, budgets, path, size):
+    key = f"{path}@{size}"
+    assert key in budgets, f"{key}: no budget stored (run with BIOTOPE_UPDATE_MEMORY_BUDGETS=1)"
+    for kind, measured in measurements[key].items():
+        assert measured <= budgets[key][kind], f"{key} {kind}: {measured} B > budget {budgets[key][kind]} B"
+
+@pytest.mark.parametrize('path', MEASURED_PATHS)
+def test_budgets_grow_with_catalog_size(budgets, path):
+    # Rozpočet, ktorý s katalógom nerastie, by prehliadol únik úmerný počtu druhov
+    for kind in ('peak', 'retained'):
+        values = [budgets[f"{path}@{size}"][kind] for size in SYNTHETIC_CATALOG_SIZES]
+        assert values == sorted(values), f"{path} {kind}: {values}"
+        assert values[-1] > values[0], f"{path} {kind}: {values}"
@@ -0,0 +1,61 @@
+"""Zhoda rozlíšenia mien medzi webovou aplikáciou a offline balíkom (biotope_offline).
+
+Spustenie: python -m pytest tests/test_offline_parity.py
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import biotope_offline
+import biotope_web_app as app
+
+PARITY_CATALOG = """SECTION 1: Species aggregation
+Poa annua - 1
+    Poa annua 1
+    Poa annua subsp. annua 2
+Festuca rubra - 2
+    Festuca rubra 1
+SECTION 4: Similarity
+Group1 name: {0} - Lúka {0} Count: 20
+Group2 name: {1} - Lúka {1} Count: 10
+Frequency table
+Poa annua
+  Group1: 12
+  Group2: 3
+  Total: 15
+Festuca rubra
+  Group2: 7
+  Total: 7
+"""
+
+@pytest.fixture(scope='module')
+def catalog(tmp_path_factory):
+    codes = list(app.BIOTOPE_PAGES)[:2]
+    snapshot = app.build_catalog_snapshot(PARITY_CATALOG.format(*codes), dict(app.BIOTOPE_PAGES))
+    path = tmp_path_factory.mktemp('bundle') / 'bundle.bin'
+    app.export_offline_bundle(snapshot, str(path))
+    return snapshot, biotope_offline.open_bundle(str(path))
+
+@pytest.mark.parametrize('name', ["Poa  annua", " Poa annua ", "Poa\tannua", "Poa  annua  subsp.  annua"])
+def test_name_normalization_matches_offline_bundle(catalog, name):
+    snapshot, bundle = catalog
+    rows, name_conversion_map, _, unknown_inputs = app.resolve_species_rows([name], snapshot)
+    offline = biotope_offline.score_species(bundle, [name])
+
+    assert unknown_inputs == offline['unknown'] == []
+    assert name_conversion_map == offline['canonical_names'] == {
+        biotope_offline.normalize_species_name(name): "Poa annua"
+    }
+    assert [snapshot['species_names'][row] for row in rows] == ["Poa annua"]
+
+def test_scores_match_offline_bundle(catalog):
+    snapshot, bundle = catalog
+    species = ["Poa  annua", "Festuca   rubra"]
+    top_matches = app.analyze_similarity_metrics(species, snapshot)[0]
+    offline = biotope_offline.score_species(bundle, species)['top_matches']
+
+    assert [item['code'] for item in top_matches] == [item['code'] for item in offline]
+    assert [item['fqi_value'] for item in top_matches] == pytest.approx([item['fqi_value'] for item in offline])